@@ -0,0 +1,279 @@
+# e2e_bench.py
+# End-to-end throughput benchmark of the real worker against the mock Horde and KAI in mock_servers.py.
+# The worker runs unmodified in this process with a generated bridgeData.yaml, the mocks run in a child process so
+# they don't count towards the worker's threads and memory. Phase timings come from the worker's own trace spans.
+# Reports jobs/sec, the fraction of time the mock GPU sat idle, p50/p99 per job phase and the worker's peak
+# threads and memory. Results are saved as JSON, and compared against a stored baseline with --baseline.
+# --record saves the worker's traffic, which --replay serves back instead of the synthetic mocks (replay_traffic.py)
+# Usage: python benchmarks/e2e_bench.py [--duration 60] [--max-threads 1] [--output run.json] [--baseline base.json]
+#        [--record traffic.jsonl.gz] [--replay traffic.jsonl.gz --speed 1|N|max]
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+import requests
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_servers import add_arguments, serve_mocks  # noqa: E402
+from replay_traffic import Trace, read_traffic, serve_replay  # noqa: E402
+from replay_traffic import add_arguments as add_replay_arguments  # noqa: E402
+
+# Job phases recorded as trace spans by worker/jobs.py
+PHASES = ["pop", "queue_wait", "softprompt", "generate", "kai_request", "submit", "submit_request", "job"]
+# Metrics which can regress. The rest describe the workload and are only shown
+HIGHER_IS_BETTER = ["jobs_per_sec", "generated_chars_per_sec"]
+LOWER_IS_BETTER = ["gpu_idle_fraction", "faulted_jobs", "worker_cpu_seconds", "peak_threads", "peak_rss_mb"]
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def phase_stats(spans_file, since):
+    durations = {}
+    if os.path.exists(spans_file):
+        with open(spans_file, encoding="utf-8") as infile:
+            for line in infile:
+                span = json.loads(line)
+                if span["start"] >= since and span["name"] in PHASES:
+                    durations.setdefault(span["name"], []).append(span["duration"])
+    stats = {}
+    for phase in PHASES:
+        values = sorted(durations.get(phase, []))
+        if values:
+            stats[phase] = {
+                "count": len(values),
+                "p50": round(percentile(values, 0.5), 4),
+                "p99": round(percentile(values, 0.99), 4),
+                "mean": round(sum(values) / len(values), 4),
+            }
+    return stats
+
+
+class ResourceMonitor:
+    """Samples the peak thread count and resident memory of this process"""
+
+    def __init__(self, interval=0.1) -> None:
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+
+def start_mock_servers(args):
+    process = multiprocessing.Process(target=serve_replay if args.replay else serve_mocks, args=(args,), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{args.kai_port}/_bench/stats", timeout=1)
+            requests.get(f"http://127.0.0.1:{args.horde_port}/_bench/stats", timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The mock servers did not start")
+
+
+def write_bridge_config(args, record):
+    max_length = max(int(value) for value in args.max_lengths.split(","))
+    max_context_length = 4096
+    if args.replay:
+        trace = Trace(read_traffic(args.replay))
+        max_length = trace.max_length
+        max_context_length = max(max_context_length, trace.max_context_length)
+    config = {
+        "horde_url": f"http://127.0.0.1:{args.horde_port}",
+        "kai_url": f"http://127.0.0.1:{args.kai_port}",
+        "worker_name": "Benchmark Worker",
+        "api_key": "0000000000",
+        "max_threads": args.max_threads,
+        "queue_size": args.queue_size,
+        "max_length": max_length,
+        "max_context_length": max_context_length,
+        "disable_terminal_ui": True,
+        "stats_output_frequency": 0,
+        "trace_enabled": True,
+        "trace_sample_rate": 1.0,
+        "telemetry_provider": "fake",
+        "record_traffic": bool(record),
+    }
+    if record:
+        config["record_traffic_path"] = record
+    with open("bridgeData.yaml", "w", encoding="utf-8") as outfile:
+        yaml.safe_dump(config, outfile)
+
+
+def run_worker(args):
+    """Runs the worker for the requested duration and returns its results"""
+    # The worker parses the command line when imported
+    sys.argv = [sys.argv[0]]
+    from worker.bridge_data import BridgeData
+    from worker.logger import quiesce_logger, set_logger_verbosity
+    from worker.recorder import recorder
+    from worker.scribe_worker import ScribeWorker
+    from worker.tracing import tracer
+
+    set_logger_verbosity(args.verbosity)
+    quiesce_logger(0 if args.verbosity else 4)
+    bridge_data = BridgeData()
+    bridge_data.reload_data()
+    if not bridge_data.kai_available:
+        raise RuntimeError("The worker could not reach the mock KAI")
+
+    horde_url = f"http://127.0.0.1:{args.horde_port}"
+    kai_url = f"http://127.0.0.1:{args.kai_port}"
+    monitor = ResourceMonitor()
+    monitor.start()
+    worker = ScribeWorker(bridge_data)
+    worker_thread = threading.Thread(target=worker.start, daemon=True)
+    worker_thread.start()
+    # Measure from after the warm up, once the worker is in its steady state
+    time.sleep(args.warmup)
+    requests.post(f"{horde_url}/_bench/reset", timeout=5)
+    requests.post(f"{kai_url}/_bench/reset", timeout=5)
+    measure_start = time.time()
+    cpu_start = time.process_time()
+    time.sleep(args.duration)
+    horde = requests.get(f"{horde_url}/_bench/stats", timeout=5).json()
+    kai = requests.get(f"{kai_url}/_bench/stats", timeout=5).json()
+    cpu_seconds = time.process_time() - cpu_start
+    measure_end = time.time()
+
+    worker.shutdown_event.set()
+    worker_thread.join(timeout=120)
+    # Submits run on their own threads, let them finish before the spans are read
+    for thread in threading.enumerate():
+        if not thread.daemon and thread is not threading.current_thread():
+            thread.join(timeout=60)
+    tracer.flush()
+    recorder.shutdown()
+    monitor.stopped.set()
+
+    seconds = measure_end - measure_start
+    phases = phase_stats("logs/spans.jsonl", measure_start)
+    return {
+        "duration": round(seconds, 2),
+        "jobs": horde.get("submits", 0),
+        "faulted_jobs": horde.get("faulted", 0),
+        "jobs_per_sec": round(horde.get("submits", 0) / seconds, 4),
+        "generated_chars_per_sec": round(horde.get("generated_chars", 0) / seconds, 1),
+        "gpu_idle_fraction": round(max(0.0, 1 - kai.get("busy_seconds", 0) / kai["seconds"]), 4),
+        "pops": horde.get("pops", 0),
+        "empty_pops": horde.get("empty_pops", 0),
+        "kai_busy_responses": kai.get("busy_responses", 0),
+        "kai_stalls": kai.get("stalls", 0),
+        "worker_cpu_seconds": round(cpu_seconds, 3),
+        "peak_threads": monitor.peak_threads,
+        "peak_rss_mb": round(monitor.peak_rss / 1048576, 1),
+        "phases": phases,
+    }
+
+
+def flatten(results):
+    metrics = {key: value for key, value in results.items() if isinstance(value, int | float)}
+    for phase, stats in results.get("phases", {}).items():
+        metrics[f"{phase}_p50"] = stats["p50"]
+        metrics[f"{phase}_p99"] = stats["p99"]
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change of every metric against the baseline and returns the names of those which regressed"""
+    current = flatten(results)
+    previous = flatten(baseline["results"])
+    regressions = []
+    print(f"{'metric':<24} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, value in current.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        change = (value - before) / before if before else 0.0
+        if name in HIGHER_IS_BETTER:
+            worse = -change
+        elif name in LOWER_IS_BETTER or name.endswith(("_p50", "_p99")):
+            worse = change
+        else:
+            worse = 0.0
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSED"
+            regressions.append(name)
+        print(f"{name:<24} {before:>12,.4g} {value:>12,.4g} {change:>+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the worker end to end against mock servers")
+    parser.add_argument("--duration", help="Seconds to measure for", type=float, default=60)
+    parser.add_argument("--warmup", help="Seconds to run before measuring", type=float, default=5)
+    parser.add_argument("--max-threads", help="The worker's max_threads", type=int, default=1)
+    parser.add_argument("--queue-size", help="The worker's queue_size", type=int, default=0)
+    parser.add_argument("--output", help="Save the results as JSON to this file", default=None)
+    parser.add_argument("--baseline", help="Compare against the results saved in this file", default=None)
+    parser.add_argument(
+        "--tolerance",
+        help="Fraction a metric may get worse than the baseline before it counts as a regression",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument("--record", help="Record the worker's traffic to this file", default=None)
+    parser.add_argument(
+        "--replay",
+        help="Serve these recorded traffic files, oldest first, instead of the synthetic mocks",
+        nargs="+",
+        default=None,
+    )
+    parser.add_argument("-v", "--verbosity", help="Show the worker's log", action="count", default=0)
+    add_arguments(parser)
+    add_replay_arguments(parser)
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    record = os.path.abspath(args.record) if args.record else None
+    if args.replay:
+        args.replay = [os.path.abspath(path) for path in args.replay]
+
+    mocks = start_mock_servers(args)
+    # The worker writes its config, logs and spans to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="e2e_bench_"))
+    sys.path.insert(0, REPO_DIR)
+    try:
+        write_bridge_config(args, record)
+        results = run_worker(args)
+    finally:
+        mocks.terminate()
+        mocks.join()
+
+    print(json.dumps(results, indent=2))
+    run = {"time": time.time(), "arguments": vars(args), "results": results}
+    if output:
+        with open(output, "w", encoding="utf-8") as outfile:
+            json.dump(run, outfile, indent=2)
+    if baseline:
+        with open(baseline, encoding="utf-8") as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        if regressions:
+            print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
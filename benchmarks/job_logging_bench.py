@@ -0,0 +1,131 @@
+# job_logging_bench.py
+# Micro-benchmark of the CPU a job spends on logging and payload serialisation, with the worker's own log sinks.
+# Compares eagerly built log arguments and a submit payload serialised on every use against the lazy arguments
+# and single serialisation now used by worker/jobs.py. Nothing is sent over the network.
+# Usage: python benchmarks/job_logging_bench.py [--jobs 2000] [--generation 2000] [--min-level INFO]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The worker logger writes to logs/ in the working directory
+os.chdir(tempfile.mkdtemp(prefix="job_logging_bench_"))
+
+from worker.logger import config, logger  # noqa: E402
+
+SUBMIT_URL = "http://localhost:7001/api/v2/generate/text/submit"
+HEADERS = {"apikey": "0000000000"}
+MODEL = "koboldcpp/Llama-3-8B"
+
+
+def make_job(generation_chars, failed):
+    job_id = str(uuid.uuid4())
+    payload = {"prompt": "x" * 8000, "max_length": 80, "max_context_length": 4096, "n": 1}
+    submit_dict = {"id": job_id, "generation": "y" * generation_chars, "seed": 0}
+    error = None
+    if failed:
+        try:
+            payload["results"][0]
+        except KeyError as err:
+            error = err
+    return job_id, payload, submit_dict, error
+
+
+def log_job_start(job_id, payload):
+    logger.debug("Starting job in threadpool for model: {}", MODEL)
+    logger.bind(
+        event="job_start",
+        job_id=job_id,
+        model=MODEL,
+        node="node1",
+        max_length=payload["max_length"],
+        context=payload["max_context_length"],
+        prompt_chars=len(payload["prompt"]),
+    ).info(
+        f"Starting generation for id {job_id}: {MODEL} @ {payload['max_length']}:{payload['max_context_length']} "
+        f"Prompt length is {len(payload['prompt'])} characters",
+    )
+
+
+def log_job_end(job_id, payload_kb):
+    logger.bind(event="payload", job_id=job_id, payload_kb=payload_kb).debug(
+        f"posting payload with size of {payload_kb} kb",
+    )
+    logger.debug("Upload completed in 0.412345")
+    logger.bind(event="job_submit", job_id=job_id, kudos=12.0, seconds=20.0, process_seconds=18.0).info(
+        f"Submitted job with id {job_id} and contributed for 12.0. Job took 20.0 seconds since queued and 18.0 "
+        "since start.",
+    )
+    logger.debug("Finished job in threadpool")
+
+
+def eager_job(job_id, payload, submit_dict, error):
+    log_job_start(job_id, payload)
+    if error:
+        logger.debug(payload)
+        trace = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        logger.trace(trace)
+    payload_kb = round(sys.getsizeof(json.dumps(submit_dict)) / 1024, 1)
+    requests.Request("POST", SUBMIT_URL, json=submit_dict, headers=HEADERS).prepare()
+    log_job_end(job_id, payload_kb)
+
+
+def lazy_job(job_id, payload, submit_dict, error):
+    log_job_start(job_id, payload)
+    if error:
+        logger.opt(lazy=True).debug("{}", lambda: payload)
+        logger.opt(lazy=True).trace(
+            "{}",
+            lambda: "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+        )
+    submit_body = json.dumps(submit_dict).encode("utf-8")
+    payload_kb = round(len(submit_body) / 1024, 1)
+    headers = {**HEADERS, "Content-Type": "application/json"}
+    requests.Request("POST", SUBMIT_URL, data=submit_body, headers=headers).prepare()
+    log_job_end(job_id, payload_kb)
+
+
+def bench(name, run_job, jobs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for job in jobs:
+            run_job(*job)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<8} {best / len(jobs) * 1e6:>8,.1f} us CPU per job (best of {repeat})")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per job logging and serialisation CPU")
+    parser.add_argument("--jobs", help="Jobs per variant", type=int, default=2000)
+    parser.add_argument("--generation", help="Characters in each generation", type=int, default=2000)
+    parser.add_argument("--repeat", help="Runs per variant, the best one is reported", type=int, default=5)
+    parser.add_argument("--failed", help="Fraction of jobs which hit a generation error", type=float, default=0.05)
+    parser.add_argument(
+        "--min-level",
+        help="Raise every sink to at least this level, e.g. INFO, to see what lazy arguments skip",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    # Only the file sinks, terminal output would dominate the measurement
+    handlers = [handler for handler in config["handlers"] if isinstance(handler["sink"], str)]
+    if args.min_level:
+        floor = logger.level(args.min_level).no
+        handlers = [{**handler, "level": max(logger.level(handler["level"]).no, floor)} for handler in handlers]
+    logger.configure(handlers=handlers)
+
+    failed_every = round(1 / args.failed) if args.failed else 0
+    jobs = [make_job(args.generation, failed_every and i % failed_every == 0) for i in range(args.jobs)]
+    eager = bench("eager", eager_job, jobs, args.repeat)
+    lazy = bench("lazy", lazy_job, jobs, args.repeat)
+    print(f"Saved {(eager - lazy) / len(jobs) * 1e6:,.1f} us per job ({(1 - lazy / eager) * 100:.1f}%)")
@@ -0,0 +1,106 @@
+# logstats_bench.py
+# Micro-benchmark of the logstats line matching stage on a synthetic bridge log corpus.
+# Compares the original four ".*" prefixed patterns against the keyword dispatched matching.
+# Usage: python benchmarks/logstats_bench.py [--lines 500000] [--relevant 0.05]
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstats import parse_legacy_lines  # noqa: E402
+
+# The patterns logstats used before keyword dispatch, every one tried on every line
+OLD_POP_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* Job pop took (\d+\.\d+).*node: (.*)\)")
+OLD_JOB_PAYLOAD_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* posting payload with size of.* (.*) kb")
+OLD_JOB_START_GEN_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* @ (.*):(.*) Prompt length is (.*) .*")
+OLD_JOB_SUB_TIME_REGEX = re.compile(
+    r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).*contributed for (.*)\. Job took (.*) "
+    r"seconds since queued and (.*) since start\.",
+)
+
+NOISE = [
+    "DEBUG      | {when} | worker.scribe_worker:process_jobs:118 - New job processing",
+    "DEBUG      | {when} | worker.jobs:start_job:231 - Starting job in threadpool for model: koboldcpp/Llama-3-8B",
+    "DEBUG      | {when} | worker.bridge_data:validate_kai:113 - Retrieving settings from KoboldAI Client...",
+    "DEBUG      | {when} | worker.jobs:submit_job:136 - Upload completed in 0.412345",
+    "DEBUG      | {when} | worker.scribe_worker:check_running_job_status:201 - Job finished successfully in 12.345s "
+    "(Total Completed: 1234)",
+    "INFO       | {when} | worker.jobs:report_skipped_info:480 - Server https://aihorde.net has no valid generations "
+    "for us to do. Skipped Info: {{'max_context_length': 12, 'models': 140, 'worker_id': 3}}.",
+]
+
+
+def relevant_lines(when):
+    job_id = uuid.uuid4()
+    return [
+        f"DEBUG      | {when} | worker.jobs:request_pop:437 - Job pop took 0.{random.randint(100, 999)} "
+        f"(node: node{random.randint(1, 5)}:7001)",
+        f"INFO       | {when} | worker.jobs:start_job:259 - Starting generation for id {job_id}: "
+        f"koboldcpp/Llama-3-8B @ {random.choice([80, 160, 512])}:{random.choice([1024, 2048, 4096])} "
+        f"Prompt length is {random.randint(100, 12000)} characters",
+        f"DEBUG      | {when} | worker.jobs:submit_job:125 - posting payload with size of "
+        f"{random.randint(1, 40) / 10} kb",
+        f"INFO       | {when} | worker.jobs:submit_job:172 - Submitted job with id {job_id} and contributed for "
+        f"{random.randint(1, 60)}.0. Job took {random.randint(5, 60)}.0 seconds since queued and "
+        f"{random.randint(5, 60)}.0 since start.",
+    ]
+
+
+def make_corpus(num_lines, relevant):
+    random.seed(0)
+    lines = []
+    while len(lines) < num_lines:
+        when = f"2024-03-01 {random.randint(0, 23):02}:{random.randint(0, 59):02}:00.000000"
+        if random.random() < relevant:
+            lines.extend(relevant_lines(when))
+        else:
+            lines.append(random.choice(NOISE).format(when=when))
+    return lines[:num_lines]
+
+
+def parse_old(lines):
+    matched = 0
+    for line in lines:
+        if OLD_POP_REGEX.match(line):
+            matched += 1
+        if OLD_JOB_START_GEN_REGEX.match(line):
+            matched += 1
+        if OLD_JOB_PAYLOAD_REGEX.match(line):
+            matched += 1
+        if OLD_JOB_SUB_TIME_REGEX.match(line):
+            matched += 1
+    return matched
+
+
+def parse_new(lines):
+    events = parse_legacy_lines(lines)
+    return sum(len(columns["time"]) for columns in events.values())
+
+
+def bench(name, parse, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matched = parse(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<18} {len(lines) / best:>12,.0f} lines/sec  ({matched:,} matches, best of {repeat})")
+    return len(lines) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark logstats line matching")
+    parser.add_argument("--lines", help="Lines in the synthetic corpus", type=int, default=500000)
+    parser.add_argument("--relevant", help="Fraction of log entries which are job events", type=float, default=0.05)
+    parser.add_argument("--repeat", help="Runs per variant, the best one is reported", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.lines, args.relevant)
+    old = bench("regex per line", parse_old, corpus, args.repeat)
+    new = bench("keyword dispatch", parse_new, corpus, args.repeat)
+    print(f"Speedup: {new / old:.1f}x")
@@ -0,0 +1,351 @@
+# mock_servers.py
+# Local stand-ins for the AI Horde text API and a KoboldAI compatible backend, for benchmarking the real worker.
+# The Horde hands out jobs from a configurable mix with configurable latency, the KAI generates at a configurable
+# token rate and can answer busy (503) or stall past the worker's timeout.
+# Both count what they see. GET /_bench/stats returns the counters, POST /_bench/reset starts a new measurement.
+# Usage: python benchmarks/mock_servers.py [--horde-port 7201] [--kai-port 7202] [--tokens-per-sec 200]
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL = "koboldcpp/Bench-7B"
+SOFTPROMPT = "bench_softprompt"
+BUSY = {"detail": {"msg": "Server is busy; please try again later.", "type": "service_unavailable"}}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args: object):  # noqa: A002
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        mock = self.server.mock
+        path = self.path.split("?")[0]
+        if path == "/_bench/stats" and method == "GET":
+            self.send_json(200, mock.stats())
+        elif path == "/_bench/reset" and method == "POST":
+            mock.reset()
+            self.send_json(200, mock.stats())
+        elif handler := mock.routes.get((method, path)):
+            status, data = handler(self.read_json() if method in ("POST", "PUT") else None)
+            try:
+                self.send_json(status, data, mock.headers)
+            except (BrokenPipeError, ConnectionResetError):
+                # The worker cancelled the request and closed its connection
+                self.close_connection = True
+        else:
+            self.send_json(404, {"message": f"No mock for {method} {path}"})
+
+    def do_GET(self):  # noqa: N802
+        self.route("GET")
+
+    def do_POST(self):  # noqa: N802
+        self.route("POST")
+
+    def do_PUT(self):  # noqa: N802
+        self.route("PUT")
+
+
+class MockServer:
+    """Serves a mock API from background threads and keeps its counters"""
+
+    headers = {}
+
+    def __init__(self, seed=None) -> None:
+        self.random = random.Random(seed)
+        self.mutex = threading.Lock()
+        self.routes = {}
+        self.counters = {}
+        self.started = time.time()
+        self.httpd = None
+
+    def count(self, name, amount=1):
+        with self.mutex:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.mutex:
+            self.counters = {}
+            self.started = time.time()
+
+    def stats(self):
+        with self.mutex:
+            return {"seconds": round(time.time() - self.started, 3), **self.counters}
+
+    def serve(self, port, host="127.0.0.1"):
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+
+class MockHorde(MockServer):
+    """The text pop and submit endpoints of the AI Horde, with find_user for the worker's start up"""
+
+    headers = {"horde-node": "mock:7001"}
+
+    def __init__(
+        self,
+        latency=0.05,
+        submit_latency=0.02,
+        empty_rate=0.0,
+        max_lengths=(80,),
+        prompt_chars=(4000,),
+        softprompt_rate=0.0,
+        seed=None,
+        ttl=None,
+    ) -> None:
+        super().__init__(seed)
+        self.ttl = ttl
+        self.latency = latency
+        self.submit_latency = submit_latency
+        self.empty_rate = empty_rate
+        self.max_lengths = max_lengths
+        self.prompt_chars = prompt_chars
+        self.softprompt_rate = softprompt_rate
+        self.routes = {
+            ("GET", "/api/v2/find_user"): self.find_user,
+            ("POST", "/api/v2/generate/text/pop"): self.pop,
+            ("POST", "/api/v2/generate/text/submit"): self.submit,
+        }
+
+    def find_user(self, _):
+        return 200, {"username": "benchmark#1", "worker_ids": []}
+
+    def make_job(self, pop):
+        max_length = min(self.random.choice(self.max_lengths), pop.get("max_length", 80))
+        softprompt = SOFTPROMPT if self.random.random() < self.softprompt_rate else ""
+        return {
+            "id": str(uuid.uuid4()),
+            "model": self.random.choice(pop.get("models") or [MODEL]),
+            "softprompt": softprompt,
+            "payload": {
+                "prompt": "x" * self.random.choice(self.prompt_chars),
+                "n": 1,
+                "max_length": max_length,
+                "max_context_length": pop.get("max_context_length", 1024),
+                "softprompt": softprompt,
+            },
+            "skipped": {},
+            **({"ttl": self.ttl} if self.ttl else {}),
+        }
+
+    def pop(self, pop):
+        time.sleep(self.latency)
+        self.count("pops")
+        if self.random.random() < self.empty_rate:
+            self.count("empty_pops")
+            return 200, {"id": None, "ids": [], "payload": {}, "skipped": {"max_context_length": 1}}
+        self.count("jobs")
+        return 200, self.make_job(pop)
+
+    def submit(self, submit):
+        time.sleep(self.submit_latency)
+        if submit.get("state") == "faulted":
+            self.count("faulted")
+        else:
+            self.count("submits")
+            self.count("generated_chars", len(submit.get("generation") or ""))
+        return 200, {"reward": 10.0}
+
+
+class MockKai(MockServer):
+    """The KoboldAI endpoints the worker uses, generating at a fixed token rate with a limited number of slots"""
+
+    def __init__(
+        self,
+        tokens_per_sec=200.0,
+        prompt_tokens_per_sec=0.0,
+        slots=1,
+        busy_rate=0.0,
+        stall_rate=0.0,
+        seed=None,
+        model=MODEL,
+        koboldcpp=False,
+    ) -> None:
+        super().__init__(seed)
+        self.model = model
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.slots = slots
+        self.busy_rate = busy_rate
+        self.stall_rate = stall_rate
+        self.softprompt = ""
+        self.active = 0
+        self.busy_since = None
+        self.busy_seconds = 0.0
+        self.routes = {
+            ("GET", "/api/latest/model"): lambda _: (200, {"result": self.model}),
+            ("GET", "/api/latest/config/soft_prompts_list"): lambda _: (200, {"values": [{"value": SOFTPROMPT}]}),
+            ("GET", "/api/latest/config/soft_prompt"): lambda _: (200, {"value": self.softprompt}),
+            ("PUT", "/api/latest/config/soft_prompt"): self.set_softprompt,
+            ("POST", "/api/latest/generate"): self.generate,
+        }
+        # Generations in progress by genkey, which koboldcpp can abort
+        self.generations = {}
+        if koboldcpp:
+            self.routes[("GET", "/api/extra/version")] = lambda _: (200, {"result": "KoboldCpp", "version": "mock"})
+            self.routes[("POST", "/api/extra/abort")] = self.abort
+
+    def reset(self):
+        with self.mutex:
+            self.busy_seconds = 0.0
+            if self.busy_since is not None:
+                self.busy_since = time.time()
+        super().reset()
+
+    def stats(self):
+        with self.mutex:
+            busy = self.busy_seconds
+            if self.busy_since is not None:
+                busy += time.time() - self.busy_since
+        return {**super().stats(), "busy_seconds": round(busy, 3)}
+
+    def set_softprompt(self, data):
+        self.softprompt = data.get("value", "")
+        self.count("softprompt_changes")
+        return 200, {}
+
+    def plan(self, payload):
+        """Decides how a generation goes: its status, the seconds it takes and the characters it returns"""
+        max_length = payload.get("max_length", 80)
+        seconds = max_length / self.tokens_per_sec
+        if self.prompt_tokens_per_sec:
+            seconds += len(payload.get("prompt", "")) / 4 / self.prompt_tokens_per_sec
+        if self.random.random() < self.stall_rate:
+            # Past the worker's generation timeout of max_length / 2 + 10 seconds
+            self.count("stalls")
+            seconds = max_length / 2 + 11
+        return 200, seconds, max_length * 4
+
+    def generate(self, payload):
+        self.count("generate_requests")
+        with self.mutex:
+            busy = self.active >= self.slots or self.random.random() < self.busy_rate
+            if not busy:
+                self.active += 1
+                if self.busy_since is None:
+                    self.busy_since = time.time()
+        if busy:
+            self.count("busy_responses")
+            return 503, BUSY
+        genkey = payload.get("genkey")
+        aborted = threading.Event()
+        try:
+            status, seconds, chars = self.plan(payload)
+            if genkey:
+                with self.mutex:
+                    self.generations[genkey] = aborted
+            if aborted.wait(seconds):
+                # koboldcpp answers an aborted generation with the text so far
+                chars = 0
+        finally:
+            with self.mutex:
+                self.generations.pop(genkey, None)
+                self.active -= 1
+                if not self.active:
+                    self.busy_seconds += time.time() - self.busy_since
+                    self.busy_since = None
+        if status != 200:
+            return status, BUSY
+        self.count("generations")
+        return 200, {"results": [{"text": "y" * chars}]}
+
+    def abort(self, data):
+        with self.mutex:
+            aborted = self.generations.get(data.get("genkey"))
+        if aborted:
+            self.count("aborts")
+            aborted.set()
+        return 200, {"success": bool(aborted)}
+
+
+def add_arguments(parser):
+    mocks = parser.add_argument_group("mock servers")
+    mocks.add_argument("--horde-port", help="Port of the mock Horde", type=int, default=7201)
+    mocks.add_argument("--kai-port", help="Port of the mock KAI", type=int, default=7202)
+    mocks.add_argument("--pop-latency", help="Seconds the Horde takes to answer a pop", type=float, default=0.05)
+    mocks.add_argument("--submit-latency", help="Seconds the Horde takes to take a submit", type=float, default=0.02)
+    mocks.add_argument("--empty-pop-rate", help="Fraction of pops without a job", type=float, default=0.0)
+    mocks.add_argument("--max-lengths", help="Comma separated max_length of the jobs handed out", default="80")
+    mocks.add_argument("--prompt-chars", help="Comma separated prompt lengths of the jobs", default="4000")
+    mocks.add_argument("--job-ttl", help="Seconds the Horde gives a job until it must be submitted", type=int)
+    mocks.add_argument("--softprompt-rate", help="Fraction of jobs asking for a softprompt", type=float, default=0.0)
+    mocks.add_argument("--tokens-per-sec", help="KAI generation speed", type=float, default=200.0)
+    mocks.add_argument(
+        "--prompt-tokens-per-sec",
+        help="KAI prompt processing speed, 0 for instant",
+        type=float,
+        default=0.0,
+    )
+    mocks.add_argument("--kai-slots", help="Generations KAI runs at once, more get 503 busy", type=int, default=1)
+    mocks.add_argument("--busy-rate", help="Fraction of generate requests answered 503 busy", type=float, default=0.0)
+    mocks.add_argument(
+        "--stall-rate",
+        help="Fraction of generations which outlast the worker's timeout",
+        type=float,
+        default=0.0,
+    )
+    mocks.add_argument("--koboldcpp", help="Serve koboldcpp's version and abort endpoints", action="store_true")
+    mocks.add_argument("--seed", help="Random seed for the job mix and failures", type=int, default=None)
+
+
+def start_mocks(args):
+    horde = MockHorde(
+        latency=args.pop_latency,
+        submit_latency=args.submit_latency,
+        empty_rate=args.empty_pop_rate,
+        max_lengths=[int(value) for value in args.max_lengths.split(",")],
+        prompt_chars=[int(value) for value in args.prompt_chars.split(",")],
+        softprompt_rate=args.softprompt_rate,
+        seed=args.seed,
+        ttl=args.job_ttl,
+    ).serve(args.horde_port)
+    kai = MockKai(
+        tokens_per_sec=args.tokens_per_sec,
+        prompt_tokens_per_sec=args.prompt_tokens_per_sec,
+        slots=args.kai_slots,
+        busy_rate=args.busy_rate,
+        stall_rate=args.stall_rate,
+        seed=args.seed,
+        koboldcpp=args.koboldcpp,
+    ).serve(args.kai_port)
+    return horde, kai
+
+
+def serve_mocks(args):
+    """Runs both mocks until interrupted"""
+    start_mocks(args)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock AI Horde and KoboldAI backend")
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Mock Horde on http://127.0.0.1:{args.horde_port}, mock KAI on http://127.0.0.1:{args.kai_port}")
+    serve_mocks(args)
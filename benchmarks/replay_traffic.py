@@ -0,0 +1,232 @@
+# replay_traffic.py
+# Serves traffic recorded by the worker with record_traffic enabled back as a local Horde and KAI, so the worker can
+# be benchmarked against a real workload instead of the synthetic mix of mock_servers.py.
+# Jobs become available at their recorded time divided by --speed and are handed out in order. While none is
+# available, pops repeat the outcome of the last recorded pop, so Horde outages and errors come back at the same
+# point. Each generation and submit attempt takes its recorded time divided by --speed and ends with its recorded
+# status. Prompts are padded to their recorded length and carry the job id, so the KAI knows which job it generates.
+# Recorded connection errors are served as 503. With --speed max every job is available at once and nothing waits,
+# except for recorded generation timeouts which still outlast the worker's timeout.
+# Usage: python benchmarks/replay_traffic.py logs/traffic.jsonl.gz [--speed 1|N|max] [--horde-port 7201]
+import argparse
+import bisect
+import gzip
+import json
+import time
+
+from mock_servers import MODEL, MockHorde, MockKai
+
+# Sent as the first characters of every replayed prompt, followed by the job id
+PROMPT_MARK = "replay:"
+
+
+def parse_speed(value):
+    """A positive replay speed, or 0.0 for "max" """
+    if value == "max":
+        return 0.0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("must be a positive number or max")
+    return speed
+
+
+def read_traffic(paths):
+    """The records of one or more traffic files, rotated ones included, in the order they happened"""
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as infile:
+            records.extend(json.loads(line) for line in infile if line.strip())
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+class Trace:
+    """Recorded traffic, grouped by job with times relative to the first record"""
+
+    def __init__(self, records) -> None:
+        start = records[0]["t"] if records else 0
+        self.pops = []
+        self.jobs = []
+        self.attempts = {"gen": {}, "submit": {}}
+        for record in records:
+            offset = record["t"] - start
+            if record["k"] == "pop":
+                self.pops.append((offset, record))
+                if record.get("job"):
+                    self.jobs.append((offset, record))
+            elif record["k"] in self.attempts:
+                self.attempts[record["k"]].setdefault(record["job"], []).append(record)
+        self.pop_offsets = [offset for offset, _ in self.pops]
+        self.duration = records[-1]["t"] - start if records else 0
+        self.max_length = max((job.get("max_length") or 0 for _, job in self.jobs), default=80) or 80
+        self.max_context_length = max((job.get("context") or 0 for _, job in self.jobs), default=1024) or 1024
+
+    def last_pop(self, offset):
+        """The latest pop recorded before the offset"""
+        index = bisect.bisect_right(self.pop_offsets, offset) - 1
+        return self.pops[index][1] if index >= 0 else None
+
+
+class ReplayClock:
+    """Seconds of recorded time which passed since the worker's first pop"""
+
+    def __init__(self, speed) -> None:
+        self.speed = speed
+        self.started = None
+
+    def now(self):
+        if self.started is None:
+            self.started = time.time()
+        if not self.speed:
+            return float("inf")
+        return (time.time() - self.started) * self.speed
+
+    def sleep(self, seconds):
+        if self.speed:
+            time.sleep(seconds / self.speed)
+
+
+def replayed_status(status):
+    """Recorded connection errors and timeouts can't be reproduced over HTTP and are served as 503"""
+    return status if isinstance(status, int) else 503
+
+
+class ReplayHorde(MockHorde):
+    def __init__(self, trace, clock) -> None:
+        super().__init__()
+        self.trace = trace
+        self.clock = clock
+        self.next_job = 0
+        self.submit_attempts = {}
+
+    def make_job(self, job):
+        prompt = f"{PROMPT_MARK}{job['job']}|"
+        prompt += "x" * max(0, (job.get("prompt_chars") or 0) - len(prompt))
+        softprompt = job.get("softprompt") or ""
+        return {
+            "id": job["job"],
+            "model": MODEL,
+            "softprompt": softprompt,
+            "payload": {
+                "prompt": prompt,
+                "n": 1,
+                "max_length": job.get("max_length") or 80,
+                "max_context_length": job.get("context") or 1024,
+                "softprompt": softprompt,
+            },
+            "skipped": {},
+        }
+
+    def pop(self, pop):
+        now = self.clock.now()
+        self.count("pops")
+        with self.mutex:
+            job = None
+            if self.next_job < len(self.trace.jobs) and self.trace.jobs[self.next_job][0] <= now:
+                job = self.trace.jobs[self.next_job][1]
+                self.next_job += 1
+        if job:
+            self.clock.sleep(job["d"])
+            self.count("jobs")
+            return 200, self.make_job(job)
+        last = self.trace.last_pop(now) if self.clock.speed else None
+        if last:
+            self.clock.sleep(last["d"])
+            if last["s"] != 200:
+                self.count("replayed_errors")
+                return replayed_status(last["s"]), {"message": f"Replayed pop failure ({last['s']})"}
+        self.count("empty_pops")
+        return 200, {"id": None, "ids": [], "payload": {}, "skipped": (last or {}).get("skipped") or {}}
+
+    def submit(self, submit):
+        job_id = submit.get("id")
+        with self.mutex:
+            attempt = self.submit_attempts.get(job_id, 0)
+            self.submit_attempts[job_id] = attempt + 1
+        recorded = self.trace.attempts["submit"].get(job_id, [])
+        status = 200
+        if attempt < len(recorded):
+            self.clock.sleep(recorded[attempt]["d"])
+            status = recorded[attempt]["s"]
+        if status != 200:
+            self.count("replayed_errors")
+            return replayed_status(status), {"message": f"Replayed submit failure ({status})"}
+        if submit.get("state") == "faulted":
+            self.count("faulted")
+        else:
+            self.count("submits")
+            self.count("generated_chars", len(submit.get("generation") or ""))
+        return 200, {"reward": (recorded[attempt].get("reward") if attempt < len(recorded) else None) or 10.0}
+
+
+class ReplayKai(MockKai):
+    def __init__(self, trace, clock) -> None:
+        # Every recorded generation may overlap, busy responses only come from the recording
+        super().__init__(slots=1000)
+        self.trace = trace
+        self.clock = clock
+        self.gen_attempts = {}
+
+    def plan(self, payload):
+        prompt = payload.get("prompt", "")
+        job_id = prompt[len(PROMPT_MARK) :].split("|", 1)[0] if prompt.startswith(PROMPT_MARK) else None
+        with self.mutex:
+            attempt = self.gen_attempts.get(job_id, 0)
+            self.gen_attempts[job_id] = attempt + 1
+        recorded = self.trace.attempts["gen"].get(job_id, [])
+        if attempt >= len(recorded):
+            # Not recorded, e.g. the worker retried more often than it did then
+            return 200, 0.0, payload.get("max_length", 80) * 4
+        record = recorded[attempt]
+        if record["s"] == "timeout":
+            # Past the worker's generation timeout of max_length / 2 + 10 seconds, whatever the speed
+            self.count("stalls")
+            return 503, payload.get("max_length", 80) / 2 + 11, 0
+        seconds = record["d"] / self.clock.speed if self.clock.speed else 0.0
+        if record["s"] == 503:
+            self.count("busy_responses")
+        elif record["s"] != 200:
+            self.count("replayed_errors")
+        return replayed_status(record["s"]), seconds, record.get("chars") or 0
+
+
+def start_replay(args):
+    trace = Trace(read_traffic(args.replay))
+    clock = ReplayClock(args.speed)
+    horde = ReplayHorde(trace, clock).serve(args.horde_port)
+    kai = ReplayKai(trace, clock).serve(args.kai_port)
+    print(
+        f"Replaying {len(trace.jobs)} jobs recorded over {trace.duration:.0f}s "
+        f"on http://127.0.0.1:{args.horde_port} and http://127.0.0.1:{args.kai_port}",
+    )
+    return horde, kai
+
+
+def serve_replay(args):
+    """Replays the traffic until interrupted"""
+    start_replay(args)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+def add_arguments(parser):
+    replay = parser.add_argument_group("traffic replay")
+    replay.add_argument(
+        "--speed",
+        help="Replay speed, e.g. 1 for real time, 10 for ten times faster or max for no waiting at all",
+        type=parse_speed,
+        default=1.0,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded worker traffic as a local Horde and KoboldAI")
+    parser.add_argument("replay", help="Traffic files, oldest first", nargs="+")
+    parser.add_argument("--horde-port", help="Port of the replayed Horde", type=int, default=7201)
+    parser.add_argument("--kai-port", help="Port of the replayed KAI", type=int, default=7202)
+    add_arguments(parser)
+    args = parser.parse_args()
+    serve_replay(args)
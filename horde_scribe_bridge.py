@@ -3,8 +3,21 @@
 # We need to import the argparser first, as it sets the necessary Switches
 from worker.argparser import args  # noqa: I001
 from worker.bridge_data import BridgeData
-from worker.logger import logger, quiesce_logger, set_logger_verbosity
+from worker.logger import (
+    enable_log_queue,
+    enable_structured_log,
+    log_deduplicator,
+    log_queue,
+    logger,
+    quiesce_logger,
+    set_log_compression,
+    set_log_deduplication,
+    set_logger_verbosity,
+)
+from worker.recorder import recorder
 from worker.scribe_worker import ScribeWorker
+from worker.shared_stats import publish_worker_stats
+from worker.tracing import tracer
 
 
 def main() -> None:
@@ -12,13 +25,25 @@ def main() -> None:
     quiesce_logger(args.quiet)
     bridge_data = BridgeData()
     bridge_data.reload_data()
+    if bridge_data.structured_log:
+        enable_structured_log()
+    if bridge_data.log_queue:
+        enable_log_queue(bridge_data.log_queue_size)
+    set_log_compression(bridge_data.log_compression)
+    set_log_deduplication(bridge_data.log_repeat_burst, bridge_data.log_repeat_window)
 
     try:
         worker = ScribeWorker(bridge_data)
+        if args.supervised is not None:
+            publish_worker_stats(worker, args.supervised)
         worker.start()
     except KeyboardInterrupt:
         logger.info("Keyboard Interrupt Received. Ending Process")
+    tracer.shutdown()
+    recorder.shutdown()
     logger.info(f"{bridge_data.worker_name} Instance stopped")
+    log_deduplicator.flush()
+    log_queue.stop()
 
 
 if __name__ == "__main__":
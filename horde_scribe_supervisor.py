@@ -0,0 +1,32 @@
+"""Runs several bridges as separate processes, one per entry of the workers list in bridgeData.yaml"""
+
+# We need to import the argparser first, as it sets the necessary Switches
+from worker.argparser import args  # noqa: I001
+import sys
+
+from worker.bridge_data import BridgeData
+from worker.consts import BRIDGE_CONFIG_FILE
+from worker.logger import logger, quiesce_logger, set_logger_verbosity
+from worker.supervisor import Supervisor
+
+
+def main() -> None:
+    set_logger_verbosity(args.verbosity)
+    quiesce_logger(args.quiet)
+    bridge_data = BridgeData()
+    # Only the config file, every worker checks its own KoboldAI server
+    bridge_data.load_config()
+    if not bridge_data.workers:
+        logger.error(f"No workers to run, add a workers list to {BRIDGE_CONFIG_FILE} as in bridgeData_template.yaml")
+        return
+
+    supervisor = Supervisor(bridge_data, sys.argv[1:])
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        logger.info("Keyboard Interrupt Received. Stopping the workers")
+    supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
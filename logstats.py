@@ -1,16 +1,42 @@
 # pop-stats.py
 # Calculate node pop stats from the local worker log file.
-# Usage: pop-stats.py [-h] [--today] [--yesterday]
+# Usage: pop-stats.py [-h] [--today] [--yesterday] [--since SINCE] [--until UNTIL] [--bucket 15m] [--csv FILE]
+#                     [--log-dir logs]
+# Requires tqdm and numpy, pyarrow for --parquet and zstandard for .zst compressed logs
 import argparse
+import ast
+import contextlib
+import csv
 import datetime
 import glob
-import mmap
+import gzip
+import io
+import json
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import numpy as np
 from tqdm import tqdm
 
-# Location of stable horde worker bridge log
-LOG_FILE = "logs/bridge*.log"
+from worker.consts import LOG_DIR
+from worker.skipped import SKIP_REASONS, capacity_advice
+
+# The stable horde worker bridge log, in LOG_DIR and the worker<N> directories of supervised workers inside it
+LOG_FILE = "bridge*.log"
+# The structured job event log, written when the bridge runs with --structured_log
+EVENTS_FILE = "events*.jsonl"
+# Directories of the workers run by horde_scribe_supervisor.py, inside the log directory
+WORKER_DIRS = "worker*"
+
+# Checkpoints and parsed events kept between --incremental runs
+INDEX_FILE = f"{LOG_DIR}/logstats_index.json"
+INDEX_EVENTS_FILE = f"{LOG_DIR}/logstats_index.npz"
+# Rotated logs compressed by the bridge are read as they are
+COMPRESSED_EXTENSIONS = (".gz", ".zst")
+# Files are split into byte ranges of this size so large logs are parsed in parallel
+CHUNK_SIZE = 32 * 1024 * 1024
 
 # TIME PERIODS
 PERIOD_ALL = 0
@@ -18,148 +44,740 @@ PERIOD_TODAY = 1
 PERIOD_YESTERDAY = 2
 PERIOD_HOUR = 3
 
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+PERCENTILES = (50, 90, 99)
 
-# regex to identify model lines
-POP_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* Job pop took (\d+\.\d+).*node: (.*)\)")
-JOB_PAYLOAD_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* posting payload with size of.* (.*) kb")
-JOB_START_GEN_REGEX = re.compile(r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).* @ (.*):(.*) Prompt length is (.*) .*")
+
+# regex to identify model lines, only used for logs written without --structured_log
+# Most lines are irrelevant, so one scan for the literal markers picks the candidate lines first.
+# The pattern for that marker then runs anchored at the marker position.
+MARKER_REGEX = re.compile(r"Job pop took|posting payload|Prompt length is|contributed for|has no valid generations")
+TIMESTAMP_REGEX = re.compile(r"\w+ *\| (\d\d\d\d-\d\d-\d\d \d\d:\d\d)")
+POP_REGEX = re.compile(r"Job pop took (\d+\.\d+).*node: (.*)\)")
+JOB_PAYLOAD_REGEX = re.compile(r"posting payload with size of.* (.*) kb")
+# The requested lengths precede the marker, so this one is searched for in the line
+JOB_START_GEN_REGEX = re.compile(r" @ (.*):(.*) Prompt length is (.*) ")
 JOB_SUB_TIME_REGEX = re.compile(
-    r".*(\d\d\d\d-\d\d-\d\d \d\d:\d\d).*contributed for (.*). Job took (.*) \
-      seconds since queued and (.*) since start.",
+    r"contributed for (.*)\. Job took (.*) seconds since queued and (.*) since start\.",
 )
+SKIPPED_REGEX = re.compile(r"has no valid generations for us to do\.(?: Skipped Info: (\{.*\})\.)?")
+
+# Columns of each job event table. Every table starts with the event timestamp
+TABLES = {
+    "pops": ("time", "node", "seconds"),
+    "jobs": ("time", "max_length", "context", "prompt_chars"),
+    "payloads": ("time", "payload_kb"),
+    "submits": ("time", "kudos", "seconds"),
+    # Empty pops, the limits we advertised and how many jobs the Horde skipped for each reason
+    "skipped": ("time", "advertised_length", "advertised_context", *SKIP_REASONS, "other"),
+}
+
+# Summary statistics: (table, column, unit)
+GENDATA = {
+    "Gen Size": ("jobs", "max_length", "tokens"),
+    "Context Window": ("jobs", "context", "tokens"),
+    "Prompt Size": ("jobs", "prompt_chars", "chars"),
+    "Sent Payload": ("payloads", "payload_kb", "KB"),
+    "Kudos": ("submits", "kudos", "kudos"),
+    "Generation Time": ("submits", "seconds", "s"),
+}
+
+
+def new_columns():
+    return {table: {column: [] for column in columns} for table, columns in TABLES.items()}
+
+
+def to_arrays(columns):
+    # Convert the parsed column lists into numpy arrays, node names stay strings
+    return {
+        table: {
+            column: np.array(values, dtype=str if column == "node" else np.float64)
+            for column, values in table_columns.items()
+        }
+        for table, table_columns in columns.items()
+    }
+
+
+def empty_events():
+    return to_arrays(new_columns())
+
+
+def concat_events(event_list):
+    if not event_list:
+        return empty_events()
+    return {
+        table: {column: np.concatenate([events[table][column] for events in event_list]) for column in columns}
+        for table, columns in TABLES.items()
+    }
+
+
+def add_skipped(skipped, when, max_length, context, reasons):
+    skipped["time"].append(when)
+    skipped["advertised_length"].append(max_length)
+    skipped["advertised_context"].append(context)
+    for reason in (*SKIP_REASONS, "other"):
+        skipped[reason].append(0)
+    for reason, count in reasons.items():
+        if isinstance(count, int | float):
+            skipped[reason if reason in SKIP_REASONS else "other"][-1] += count
+
+
+def busy_seconds(starts, ends):
+    # Length of the union of the [start, end) intervals, overlapping jobs count once
+    if not len(starts):
+        return 0.0
+    order = np.argsort(starts)
+    starts = starts[order]
+    ends = ends[order]
+    reach = np.maximum.accumulate(ends)
+    new_block = np.concatenate([[True], starts[1:] > reach[:-1]])
+    block_starts = np.flatnonzero(new_block)
+    return float((np.maximum.reduceat(ends, block_starts) - starts[block_starts]).sum())
+
+
+def is_compressed(file_path):
+    return file_path.endswith(COMPRESSED_EXTENSIONS)
+
+
+def find_logs(pattern):
+    # Plain and compressed files matching the pattern
+    # A file being compressed briefly exists in both forms, only the plain one is used then
+    logfiles = glob.glob(pattern)
+    for extension in COMPRESSED_EXTENSIONS:
+        logfiles.extend(path for path in glob.glob(pattern + extension) if path[: -len(extension)] not in logfiles)
+    return logfiles
+
+
+def open_log(file_path):
+    # Compressed logs are decompressed while streaming, never into memory or onto disk
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+    if file_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as err:
+            message = f"Reading {file_path} requires zstandard, install it with 'pip install zstandard'"
+            raise RuntimeError(message) from err
+        compressed = open(file_path, "rb")  # noqa: SIM115 closed with the reader
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(compressed, closefd=True))
+    return open(file_path, "rb")  # noqa: SIM115 the caller closes it
+
+
+def skip_bytes(infile, count):
+    # Compressed streams can only be skipped forward by decompressing
+    while count > 0:
+        block = infile.read(min(count, 1024 * 1024))
+        if not block:
+            break
+        count -= len(block)
+
+
+def read_chunk(file_path, start, end):
+    # Yield every line which starts inside the byte range [start, end), or up to the end of file if end is None
+    # Offsets in compressed files are positions in the decompressed stream
+    with open_log(file_path) as infile:
+        if start > 0:
+            # Skip the line owned by the previous chunk
+            if is_compressed(file_path):
+                skip_bytes(infile, start - 1)
+            else:
+                infile.seek(start - 1)
+            start += len(infile.readline()) - 1
+        position = start
+        for line in infile:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+
+def parse_event_chunk(file_path, start, end):
+    columns = new_columns()
+    pops, jobs, payloads, submits, skipped = (columns[table] for table in TABLES)
+    for line in read_chunk(file_path, start, end):
+        try:
+            event = json.loads(line)
+        except json.decoder.JSONDecodeError:
+            continue
+
+        kind = event.get("event")
+        if kind == "pop":
+            pops["time"].append(event["time"])
+            pops["node"].append(event["node"].split(":")[0])
+            pops["seconds"].append(event["pop_seconds"])
+        elif kind == "job_start":
+            jobs["time"].append(event["time"])
+            jobs["max_length"].append(event["max_length"])
+            jobs["context"].append(event["context"])
+            jobs["prompt_chars"].append(event["prompt_chars"])
+        elif kind == "payload":
+            payloads["time"].append(event["time"])
+            payloads["payload_kb"].append(event["payload_kb"])
+        elif kind == "job_submit":
+            submits["time"].append(event["time"])
+            submits["kudos"].append(event["kudos"])
+            submits["seconds"].append(event["process_seconds"])
+        elif kind == "skipped":
+            max_length, context = event.get("max_length"), event.get("context")
+            add_skipped(
+                skipped,
+                event["time"],
+                np.nan if max_length is None else max_length,
+                np.nan if context is None else context,
+                event.get("skipped") or {},
+            )
+    return to_arrays(columns)
+
+
+def parse_legacy_lines(lines):
+    columns = new_columns()
+    pops, jobs, payloads, submits, skipped = (columns[table] for table in TABLES)
+    # The human readable log has minute resolution timestamps, convert each minute once
+    timestamps = {}
+
+    for line in lines:
+        if not (marker := MARKER_REGEX.search(line)):
+            continue
+        if not (stamp := TIMESTAMP_REGEX.match(line)):
+            continue
+        minute = stamp.group(1)
+        if minute not in timestamps:
+            timestamps[minute] = datetime.datetime.fromisoformat(minute).timestamp()
+        when = timestamps[minute]
+        kind = marker.group()
+
+        # Match and process the job pop line
+        if kind == "Job pop took":
+            if regex := POP_REGEX.match(line, marker.start()):
+                # Extract api_node and time
+                pops["time"].append(when)
+                pops["node"].append(regex.group(2).split(":")[0])
+                pops["seconds"].append(float(regex.group(1)))
+
+        # Match for gen/prompt request and prompt character length ( /3 ~ 'tokens' ?)
+        elif kind == "Prompt length is":
+            if regex := JOB_START_GEN_REGEX.search(line):
+                jobs["time"].append(when)
+                jobs["max_length"].append(float(regex.group(1)))
+                jobs["context"].append(float(regex.group(2)))
+                jobs["prompt_chars"].append(float(regex.group(3)))
+
+        # Match for payload size
+        elif kind == "posting payload":
+            if regex := JOB_PAYLOAD_REGEX.match(line, marker.start()):
+                payloads["time"].append(when)
+                payloads["payload_kb"].append(float(regex.group(1)))
+
+        # Match for empty pops, the human readable log doesn't show the limits we advertised
+        elif kind == "has no valid generations":
+            if regex := SKIPPED_REGEX.match(line, marker.start()):
+                reasons = {}
+                if regex.group(1):
+                    with contextlib.suppress(ValueError, SyntaxError):
+                        reasons = ast.literal_eval(regex.group(1))
+                add_skipped(skipped, when, np.nan, np.nan, reasons if isinstance(reasons, dict) else {})
+
+        # Match for job submission kudos and processing time
+        elif regex := JOB_SUB_TIME_REGEX.match(line, marker.start()):
+            submits["time"].append(when)
+            submits["kudos"].append(float(regex.group(1)))
+            submits["seconds"].append(float(regex.group(3)))
+    return to_arrays(columns)
+
+
+def parse_legacy_chunk(file_path, start, end):
+    return parse_legacy_lines(read_chunk(file_path, start, end))
+
+
+def split_chunks(ranges, chunk_size=CHUNK_SIZE):
+    # Split (path, start, end) byte ranges into chunks of at most chunk_size bytes
+    # Compressed streams can't be entered part way, so they are parsed whole by one process
+    chunks = []
+    for file_path, first, last in ranges:
+        if last is None:
+            chunks.append((file_path, first, last))
+            continue
+        chunks.extend((file_path, start, min(start + chunk_size, last)) for start in range(first, last, chunk_size))
+    return chunks
+
+
+def file_range(file_path):
+    # The whole file, compressed files are read until the stream ends
+    return (file_path, 0, None if is_compressed(file_path) else os.path.getsize(file_path))
+
+
+def chunk_weight(file_path, start, end):
+    # Progress is counted in bytes read from disk, compressed files count once in full
+    return os.path.getsize(file_path) if end is None else end - start
+
+
+def first_line(file_path):
+    # The first complete line identifies a log once it has been rotated and compressed
+    with open_log(file_path) as infile:
+        line = infile.readline(4096)
+    return line.decode("utf-8", errors="replace") if line.endswith(b"\n") else None
+
+
+def complete_size(file_path, size):
+    # Offset just past the last complete line, so a line still being written is parsed on the next run
+    with open(file_path, "rb") as infile:
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            infile.seek(position - step)
+            block = infile.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def parse_duration(value):
+    # "15m" -> 900 seconds
+    match = re.fullmatch(r"(\d+)([smhd])", value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid duration '{value}', use e.g. 30s, 15m, 1h or 7d")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_time(value):
+    # Absolute local time ("2024-03-01", "2024-03-01 14:00") or relative to now ("6h", "7d")
+    with contextlib.suppress(argparse.ArgumentTypeError):
+        return time.time() - parse_duration(value)
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(f"Invalid time '{value}', use YYYY-MM-DD[ HH:MM] or e.g. 6h") from err
+
+
+def bucket_starts(times, bucket_seconds):
+    # Bucket boundaries aligned to the local clock, so 1h buckets start on the hour
+    offset = datetime.datetime.now().astimezone().utcoffset().total_seconds()
+    return np.floor((times + offset) / bucket_seconds) * bucket_seconds - offset
+
+
+def group_percentiles(groups, values, group_keys, percentiles=PERCENTILES):
+    # Percentiles of values per group, for every key in the sorted group_keys, using linear interpolation
+    result = {q: np.full(len(group_keys), np.nan) for q in percentiles}
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    sorted_values = values[order]
+    starts = np.searchsorted(sorted_groups, group_keys, side="left")
+    counts = np.searchsorted(sorted_groups, group_keys, side="right") - starts
+    present = counts > 0
+    for q in percentiles:
+        position = starts[present] + (counts[present] - 1) * q / 100
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        result[q][present] = sorted_values[low] * (1 - fraction) + sorted_values[high] * fraction
+    return result
+
+
+def group_sums(groups, values, group_keys):
+    index = np.searchsorted(group_keys, groups)
+    return np.bincount(index, weights=values, minlength=len(group_keys)), np.bincount(
+        index,
+        minlength=len(group_keys),
+    )
+
+
+class LogIndex:
+    """Per-file checkpoints, and the events parsed from each file so far"""
+
+    VERSION = 3
+
+    def __init__(self, path=INDEX_FILE, events_path=INDEX_EVENTS_FILE) -> None:
+        self.path = path
+        self.events_path = events_path
+        self.files = {}
+        self.events = {}
+
+    def load(self):
+        if not os.path.exists(self.path) or not os.path.exists(self.events_path):
+            return
+        try:
+            with open(self.path) as infile:
+                index = json.load(infile)
+            if index.get("version") != self.VERSION:
+                return
+            with np.load(self.events_path) as stored:
+                for key in stored.files:
+                    inode, table, column = key.split("/")
+                    self.events.setdefault(int(inode), empty_events())[table][column] = stored[key]
+        except (OSError, ValueError, json.decoder.JSONDecodeError):
+            self.events = {}
+            return
+        self.files = index["files"]
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as outfile:
+            json.dump({"version": self.VERSION, "files": self.files}, outfile, separators=(",", ":"))
+        arrays = {
+            f"{entry['inode']}/{table}/{column}": values
+            for entry in self.files.values()
+            for table, columns in self.events[entry["inode"]].items()
+            for column, values in columns.items()
+        }
+        temp_events_path = f"{self.events_path}.tmp.npz"
+        np.savez(temp_events_path, **arrays)
+        os.replace(temp_events_path, self.events_path)
+        os.replace(temp_path, self.path)
+
+    def plan(self, logfiles, log_format):
+        # Work out the byte range of each file which has not been parsed yet
+        # Rotated files keep their inode, so checkpoints are matched by inode and follow renames
+        by_inode = {entry["inode"]: entry for entry in self.files.values() if entry["format"] == log_format}
+        self.files = {path: entry for path, entry in self.files.items() if entry["format"] != log_format}
+        ranges = []
+        for file_path in logfiles:
+            if is_compressed(file_path):
+                continue
+            stat = os.stat(file_path)
+            entry = by_inode.pop(stat.st_ino, None)
+            if not entry or stat.st_size < entry["offset"]:
+                # New or truncated file, start over
+                entry = {"inode": stat.st_ino, "offset": 0, "format": log_format}
+                self.events[stat.st_ino] = empty_events()
+            if not entry.get("head"):
+                entry["head"] = first_line(file_path)
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            self.files[file_path] = entry
+            end = complete_size(file_path, stat.st_size) if stat.st_size > entry["offset"] else entry["offset"]
+            if end > entry["offset"]:
+                ranges.append((file_path, entry["offset"], end))
+
+        # Compressing a rotated file gives it a new inode, so a file whose checkpoint was left behind
+        # is recognised by its first line and parsed on from where the plain file was checkpointed
+        orphans = {entry["head"]: entry for entry in by_inode.values() if entry.get("head")}
+        for file_path in logfiles:
+            if not is_compressed(file_path):
+                continue
+            stat = os.stat(file_path)
+            entry = by_inode.pop(stat.st_ino, None)
+            if not entry:
+                entry = orphans.pop(first_line(file_path), None)
+                if entry:
+                    self.events[stat.st_ino] = self.events.pop(entry["inode"])
+                    entry["inode"] = stat.st_ino
+                else:
+                    entry = {"inode": stat.st_ino, "offset": 0, "format": log_format}
+                    self.events[stat.st_ino] = empty_events()
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            self.files[file_path] = entry
+            if not entry.get("complete"):
+                ranges.append((file_path, entry["offset"], None))
+        return ranges
+
+    def prune(self):
+        # Forget files removed by log retention
+        for file_path in [path for path in self.files if not os.path.exists(path)]:
+            del self.files[file_path]
+        inodes = {entry["inode"] for entry in self.files.values()}
+        self.events = {inode: events for inode, events in self.events.items() if inode in inodes}
 
 
 class LogStats:
-    def __init__(self, period=PERIOD_ALL, logfile=LOG_FILE) -> None:
+    def __init__(
+        self,
+        period=PERIOD_ALL,
+        logfile=LOG_FILE,
+        eventsfile=EVENTS_FILE,
+        legacy=False,
+        processes=None,
+        incremental=False,
+        indexfile=None,
+        since=None,
+        until=None,
+        bucket=None,
+        log_dir=LOG_DIR,
+    ) -> None:
+        self.log_dir = log_dir
         self.logfile = logfile
+        self.eventsfile = eventsfile
+        self.legacy = legacy
         self.period = period
-        self.data = {}
-        self.gendata = {
-            "Gen Size": [float(0), 0, "tokens"],
-            "Context Window": [float(0), 0, "tokens"],
-            "Prompt Size": [float(0), 0, "chars"],
-            "Sent Payload": [float(0), 0, "KB"],
-            "Kudos": [float(0), 0, "kudos"],
-            "Generation Time": [float(0), 0, "s"],
-        }
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = CHUNK_SIZE
+        self.incremental = incremental
+        indexfile = indexfile or os.path.join(log_dir, os.path.basename(INDEX_FILE))
+        self.index = LogIndex(indexfile, os.path.splitext(indexfile)[0] + ".npz")
+        self.since = since
+        self.until = until
+        self.bucket = bucket
+        self.events = empty_events()
 
-    def get_date(self):
-        # Dates in log format for filtering
+    def get_period_range(self):
+        # Start and end timestamps of the period, --since and --until narrow it further
+        now = datetime.datetime.now()
+        start, end = None, None
         if self.period == PERIOD_TODAY:
-            adate = datetime.datetime.now()
-            adate = adate.strftime("%Y-%m-%d")
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            end = start + datetime.timedelta(days=1)
         elif self.period == PERIOD_YESTERDAY:
-            adate = datetime.datetime.now() - datetime.timedelta(1)
-            adate = adate.strftime("%Y-%m-%d")
+            end = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            start = end - datetime.timedelta(days=1)
         elif self.period == PERIOD_HOUR:
-            adate = datetime.datetime.now()  # - datetime.timedelta(hours=1)
-            adate = adate.strftime("%Y-%m-%d %H:")
-        else:
-            adate = None
-        return adate
-
-    def get_num_lines(self, file_path):
-        with open(file_path, "r+") as fp:
-            buf = mmap.mmap(fp.fileno(), 0)
-            lines = 0
-            while buf.readline():
-                lines += 1
-            return lines
+            start = now.replace(minute=0, second=0, microsecond=0)
+            end = start + datetime.timedelta(hours=1)
+        start = start.timestamp() if start else -np.inf
+        end = end.timestamp() if end else np.inf
+        if self.since is not None:
+            start = max(start, self.since)
+        if self.until is not None:
+            end = min(end, self.until)
+        return start, end
+
+    def log_dirs(self):
+        # The log directory, and those of the supervised workers in it
+        worker_dirs = glob.glob(os.path.join(self.log_dir, WORKER_DIRS))
+        return [self.log_dir, *sorted(path for path in worker_dirs if os.path.isdir(path))]
 
     def parse_log(self):
-        # Identify all log files and total number of log lines
-        total_log_lines = sum(self.get_num_lines(logfile) for logfile in glob.glob(self.logfile))
-        progress = tqdm(total=total_log_lines, leave=True, unit=" lines", unit_scale=True)
-        for logfile in glob.glob(self.logfile):
-            with open(logfile) as infile:
-                for line in infile:
-                    # Match and process the job pop line
-                    if regex := POP_REGEX.match(line):
-
-                        """WHAT IS THIS USED FOR?"""
-                        if self.period and self.get_date() not in regex.group(1):
-                            continue
-
-                        # Extract api_node and time
-                        poptime = regex.group(2)
-                        api_node = regex.group(3).split(":")[0]
-                        if api_node in self.data:
-
-                            self.data[api_node] = [self.data[api_node][0] + float(poptime), self.data[api_node][1] + 1]
-
-                        else:
-                            self.data[api_node] = [float(poptime), 1]
-
-                    # Match for gen/prompt request and prompt character length ( /3 ~ 'tokens' ?)
-                    if regex := JOB_START_GEN_REGEX.match(line):
-                        req = regex.group(2)
-                        ctx = regex.group(3)
-                        prmt = regex.group(4)
-
-                        self.gendata["Gen Size"] = [
-                            self.gendata["Gen Size"][0] + float(req),
-                            self.gendata["Gen Size"][1] + 1,
-                            self.gendata["Gen Size"][2],
-                        ]
-                        self.gendata["Context Window"] = [
-                            self.gendata["Context Window"][0] + float(ctx),
-                            self.gendata["Context Window"][1] + 1,
-                            self.gendata["Context Window"][2],
-                        ]
-                        self.gendata["Prompt Size"] = [
-                            self.gendata["Prompt Size"][0] + float(prmt),
-                            self.gendata["Prompt Size"][1] + 1,
-                            self.gendata["Prompt Size"][2],
-                        ]
-
-                    # Match for payload size
-                    if regex := JOB_PAYLOAD_REGEX.match(line):
-                        pld = regex.group(2)
-                        self.gendata["Sent Payload"] = [
-                            self.gendata["Sent Payload"][0] + float(pld),
-                            self.gendata["Sent Payload"][1] + 1,
-                            self.gendata["Sent Payload"][2],
-                        ]
-
-                    # Match for job submission kudos and processing time
-                    if regex := JOB_SUB_TIME_REGEX.match(line):
-                        kudos = regex.group(2)
-                        proc = regex.group(4)
-
-                        self.gendata["Kudos"] = [
-                            self.gendata["Kudos"][0] + float(kudos),
-                            self.gendata["Kudos"][1] + 1,
-                            self.gendata["Kudos"][2],
-                        ]
-                        self.gendata["Generation Time"] = [
-                            self.gendata["Generation Time"][0] + float(proc),
-                            self.gendata["Generation Time"][1] + 1,
-                            self.gendata["Generation Time"][2],
-                        ]
-
-                progress.update()
-                print()
-
-    def print_stats(self):
+        # Prefer the structured event log, the human readable log is only parsed for older logs
+        # Decided per directory, as supervised workers may be configured differently
+        eventfiles, logfiles = [], []
+        for log_dir in self.log_dirs():
+            found = find_logs(os.path.join(log_dir, self.eventsfile))
+            if found and not self.legacy:
+                eventfiles.extend(found)
+            else:
+                logfiles.extend(find_logs(os.path.join(log_dir, self.logfile)))
+        parsed = []
+        if eventfiles:
+            parsed.append(self.parse_files(parse_event_chunk, eventfiles, "events"))
+        if logfiles or not eventfiles:
+            parsed.append(self.parse_files(parse_legacy_chunk, logfiles, "legacy"))
+        events = concat_events(parsed)
+
+        # Keep only the events inside the requested time range
+        start, end = self.get_period_range()
+        for table, columns in events.items():
+            mask = (columns["time"] >= start) & (columns["time"] < end)
+            self.events[table] = {column: values[mask] for column, values in columns.items()}
+
+    def parse_files(self, parse_chunk, logfiles, log_format):
+        # Returns the events of every file, parsing only new bytes when running incrementally
+        if not self.incremental:
+            ranges = [file_range(file_path) for file_path in logfiles]
+            return concat_events(list(self.parse_chunks(parse_chunk, ranges).values()))
+
+        self.index.load()
+        ranges = self.index.plan(logfiles, log_format)
+        for file_path, events in self.parse_chunks(parse_chunk, ranges).items():
+            inode = self.index.files[file_path]["inode"]
+            self.index.events[inode] = concat_events([self.index.events[inode], events])
+        for file_path, _, end in ranges:
+            if end is None:
+                # Compressed files are rotated logs, nothing is appended to them any more
+                self.index.files[file_path]["complete"] = True
+            else:
+                self.index.files[file_path]["offset"] = end
+        self.index.prune()
+        self.index.save()
+        return concat_events([self.index.events[self.index.files[file_path]["inode"]] for file_path in logfiles])
+
+    def parse_chunks(self, parse_chunk, ranges):
+        # Parse every chunk in a single pass and gather the event columns per file as they complete
+        chunks = split_chunks(ranges, self.chunk_size)
+        file_events = {file_path: [] for file_path, _, _ in ranges}
+        if chunks:
+            progress = tqdm(total=sum(chunk_weight(*chunk) for chunk in chunks), leave=True, unit="B", unit_scale=True)
+            if len(chunks) <= 1 or self.processes <= 1:
+                for file_path, start, end in chunks:
+                    file_events[file_path].append((start, parse_chunk(file_path, start, end)))
+                    progress.update(chunk_weight(file_path, start, end))
+            else:
+                with ProcessPoolExecutor(max_workers=min(self.processes, len(chunks))) as executor:
+                    futures = {
+                        executor.submit(parse_chunk, file_path, start, end): (
+                            file_path,
+                            start,
+                            chunk_weight(file_path, start, end),
+                        )
+                        for file_path, start, end in chunks
+                    }
+                    for future in as_completed(futures):
+                        file_path, start, size = futures[future]
+                        file_events[file_path].append((start, future.result()))
+                        progress.update(size)
+            progress.close()
+        # Keep each file's events in log order
+        return {
+            file_path: concat_events([events for _, events in sorted(chunk_events, key=lambda chunk: chunk[0])])
+            for file_path, chunk_events in file_events.items()
+        }
+
+    def node_stats(self):
+        # Pops and average pop time per node
+        pops = self.events["pops"]
+        nodes, inverse = np.unique(pops["node"], return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(nodes))
+        totals = np.bincount(inverse, weights=pops["seconds"], minlength=len(nodes))
+        return nodes, totals, counts
+
+    def skipped_summary(self):
+        # Skip reasons reported over all empty pops, and the latest limits we advertised
+        skipped = self.events["skipped"]
+        reasons = {reason: float(skipped[reason].sum()) for reason in (*SKIP_REASONS, "other")}
+        limits = {}
+        for column in ("advertised_length", "advertised_context"):
+            known = skipped[column][~np.isnan(skipped[column])]
+            limits[column] = f"{known[-1]:.0f}" if len(known) else "the current value"
+        return len(skipped["time"]), reasons, limits
+
+    def idle_share(self):
+        # Share of the logged time no job was being processed, from the end and duration of every submitted job
+        submits = self.events["submits"]
+        times = np.concatenate([columns["time"] for columns in self.events.values()])
+        if not len(times) or not len(submits["time"]):
+            return None, 0.0
+        span_start = min(times.min(), (submits["time"] - submits["seconds"]).min())
+        span = times.max() - span_start
+        if span <= 0:
+            return None, 0.0
+        busy = busy_seconds(submits["time"] - submits["seconds"], submits["time"])
+        return max(0.0, 1 - busy / span), float(span)
+
+    def summary(self):
+        # Total, mean and percentiles of each job statistic
+        summary = {}
+        for key, (table, column, unit) in GENDATA.items():
+            values = self.events[table][column]
+            summary[key] = {
+                "total": float(values.sum()),
+                "count": len(values),
+                "average": float(values.mean()) if len(values) else 0,
+                "unit": unit,
+                **{f"p{q}": float(np.percentile(values, q)) if len(values) else 0 for q in PERCENTILES},
+            }
+        return summary
+
+    def bucket_table(self, bucket_seconds):
+        # Throughput, kudos and latency percentiles per time bucket
+        submits = self.events["submits"]
+        pops = self.events["pops"]
+        jobs = self.events["jobs"]
+        submit_buckets = bucket_starts(submits["time"], bucket_seconds)
+        pop_buckets = bucket_starts(pops["time"], bucket_seconds)
+        job_buckets = bucket_starts(jobs["time"], bucket_seconds)
+        keys = np.unique(np.concatenate([submit_buckets, pop_buckets, job_buckets]))
+
+        kudos, completed = group_sums(submit_buckets, submits["kudos"], keys)
+        gen_time, _ = group_sums(submit_buckets, submits["seconds"], keys)
+        pop_time, pop_count = group_sums(pop_buckets, pops["seconds"], keys)
+        context, started = group_sums(job_buckets, jobs["context"], keys)
+        gen_percentiles = group_percentiles(submit_buckets, submits["seconds"], keys)
+        pop_percentiles = group_percentiles(pop_buckets, pops["seconds"], keys)
+
+        hours = bucket_seconds / 3600
+        with np.errstate(divide="ignore", invalid="ignore"):
+            table = {
+                "bucket_start": keys,
+                "jobs_started": started,
+                "jobs_completed": completed,
+                "jobs_per_hour": completed / hours,
+                "kudos": kudos,
+                "kudos_per_hour": kudos / hours,
+                "avg_context": np.where(started > 0, context / started, np.nan),
+                "avg_gen_time": np.where(completed > 0, gen_time / completed, np.nan),
+                **{f"gen_time_p{q}": values for q, values in gen_percentiles.items()},
+                "pops": pop_count,
+                "avg_pop_time": np.where(pop_count > 0, pop_time / pop_count, np.nan),
+                **{f"pop_time_p{q}": values for q, values in pop_percentiles.items()},
+            }
+        table["bucket"] = np.array(
+            [datetime.datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M") for start in keys],
+            dtype=str,
+        )
+        return table
+
+    def export(self, table, csv_file=None, parquet_file=None):
+        columns = ["bucket", *[column for column in table if column != "bucket"]]
+        if csv_file:
+            with open(csv_file, "w", newline="") as outfile:
+                writer = csv.writer(outfile)
+                writer.writerow(columns)
+                writer.writerows(zip(*(table[column].tolist() for column in columns), strict=True))
+            print(f"Wrote {len(table['bucket'])} rows to {csv_file}")
+        if parquet_file:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                print("Parquet export requires pyarrow, install it with 'pip install pyarrow'")
+                return
+            pyarrow.parquet.write_table(
+                pyarrow.table({column: table[column] for column in columns}),
+                parquet_file,
+            )
+            print(f"Wrote {len(table['bucket'])} rows to {parquet_file}")
+
+    def print_buckets(self, table):
+        def cell(value, width, precision=0, suffix="") -> str:
+            # Buckets without any jobs or pops have no averages
+            if np.isnan(value):
+                return f"{'-':>{width}}"
+            return f"{value:>{width - len(suffix)}.{precision}f}{suffix}"
+
+        print(
+            f"{'Bucket':<17} {'Jobs':>6} {'Jobs/h':>8} {'Kudos/h':>9} {'Ctx':>6} "
+            f"{'Gen p50':>8} {'Gen p99':>8} {'Pops':>6} {'Pop avg':>8}",
+        )
+        for row in range(len(table["bucket"])):
+            print(
+                f"{table['bucket'][row]:<17} {int(table['jobs_completed'][row]):>6} "
+                f"{cell(table['jobs_per_hour'][row], 8, 1)} {cell(table['kudos_per_hour'][row], 9)} "
+                f"{cell(table['avg_context'][row], 6)} {cell(table['gen_time_p50'][row], 8, 1, 's')} "
+                f"{cell(table['gen_time_p99'][row], 8, 1, 's')} {int(table['pops'][row]):>6} "
+                f"{cell(table['avg_pop_time'][row], 8, 2, 's')}",
+            )
+
+    def print_stats(self, csv_file=None, parquet_file=None):
         # Parse our log files
         self.parse_log()
 
         # pop times
-        total = sum(v[1] for k, v in self.data.items())
-        tf = f"{total:,}"
+        nodes, totals, counts = self.node_stats()
+        tf = f"{int(counts.sum()):,}"
         print(f"Average node pop times (out of {tf} pops in total)")
-        for k, v in self.data.items():
-            print(f"{k.split(':')[0]:15} {round(v[0]/v[1], 2)} secs {v[1]:-8} jobs from this node")
-            total += v[1]
+        for node, total, count in zip(nodes, totals, counts, strict=True):
+            print(f"{node:15} {round(total / count, 2)} secs {count:-8} jobs from this node")
         print("----------------------------------------------------------------------")
 
         # job data
+        for k, v in self.summary().items():
+            tf = f"{round(v['total']):,}"
+            af = f"{round(v['average']):,}"
+            percentiles = "  ".join(f"p{q}: {v[f'p{q}']:,.1f}" for q in PERCENTILES)
+
+            row = "{:<15} {} {:<12} {:>15} {} {:<6}".format(k, "Total:", tf, "Job Average:", af, v["unit"])
+            print(f"{row} {percentiles}")
 
-        for k, v in self.gendata.items():
-            tf = f"{round(v[0]):,}"
-            af = f"{round(v[0] / v[1]):,}"
+        # Idle time and why the Horde had no jobs for us
+        idle, span = self.idle_share()
+        empty_pops, reasons, limits = self.skipped_summary()
+        if idle is not None or empty_pops:
+            print("----------------------------------------------------------------------")
+        if idle is not None:
+            print(f"Idle {idle:.0%} of {span / 3600:.1f} hours with no job being processed")
+        if empty_pops:
+            print(f"{empty_pops:,} pops returned no job")
+            for advice in capacity_advice(reasons, limits["advertised_length"], limits["advertised_context"]):
+                print(f"  {advice}")
 
-            print("{:<15} {} {:<12} {:>15} {} {}".format(k, "Total:", tf, "Job Average:", af, v[2]))
+        if self.bucket or csv_file or parquet_file:
+            table = self.bucket_table(self.bucket or 3600)
+            if self.bucket:
+                print("----------------------------------------------------------------------")
+                self.print_buckets(table)
+            self.export(table, csv_file, parquet_file)
 
 
 if __name__ == "__main__":
@@ -181,6 +799,28 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--today", help="Statistics for today only", action="store_true")
     parser.add_argument("-y", "--yesterday", help="Statistics for yesterday only", action="store_true")
     parser.add_argument("-1", "--hour", help="Statistics for last hour only", action="store_true")
+    parser.add_argument("--since", help="Only events after this local time, or e.g. 6h ago", type=parse_time)
+    parser.add_argument("--until", help="Only events before this local time, or e.g. 1h ago", type=parse_time)
+    parser.add_argument("--bucket", help="Show statistics per time bucket, e.g. 15m, 1h or 1d", type=parse_duration)
+    parser.add_argument("--csv", help="Export the per bucket statistics (1h unless --bucket) to a CSV file")
+    parser.add_argument("--parquet", help="Export the per bucket statistics (1h unless --bucket) to a Parquet file")
+    parser.add_argument("--processes", help="Number of parallel parser processes", type=int, default=None)
+    parser.add_argument(
+        "--log-dir",
+        help="Directory of the worker's logs, those of supervised workers in its worker* directories are included",
+        default=LOG_DIR,
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="Only parse log lines added since the previous incremental run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--legacy",
+        help="Parse the human readable bridge logs even if structured event logs exist",
+        action="store_true",
+    )
     args = vars(parser.parse_args())
 
     period = PERIOD_ALL
@@ -191,7 +831,16 @@ if __name__ == "__main__":
     elif args["hour"]:
         period = PERIOD_HOUR
 
-    logs = LogStats(period)
+    logs = LogStats(
+        period,
+        legacy=args["legacy"],
+        processes=args["processes"],
+        incremental=args["incremental"],
+        since=args["since"],
+        until=args["until"],
+        bucket=args["bucket"],
+        log_dir=args["log_dir"],
+    )
     print()
-    logs.print_stats()
+    logs.print_stats(args["csv"], args["parquet"])
     print()
@@ -0,0 +1,74 @@
+import pytest
+
+from worker.admission import AdmissionController
+from worker.telemetry import FakeGpuProvider, TelemetrySampler
+
+
+@pytest.fixture
+def gpu():
+    return FakeGpuProvider(vram_total_mb=24576)
+
+
+@pytest.fixture
+def controller(gpu):
+    sampler = TelemetrySampler()
+    sampler.use_provider(gpu)
+    return AdmissionController(source=sampler.sample)
+
+
+def test_disabled_admits_everything(controller, gpu):
+    controller.configure(False, max_temp=80)
+    gpu.set(temp=95)
+    assert controller.admit(running_jobs=1)
+
+
+def test_temperature_hysteresis(controller, gpu):
+    controller.configure(True, max_temp=80, temp_margin=5)
+    gpu.set(temp=79)
+    assert controller.admit()
+    gpu.set(temp=80)
+    assert not controller.admit()
+    # Held until the temperature is back below the limit by the margin
+    gpu.set(temp=79)
+    assert not controller.admit()
+    gpu.set(temp=75)
+    assert not controller.admit()
+    gpu.set(temp=74)
+    assert controller.admit()
+    assert controller.held_since is None
+
+
+def test_power_hysteresis(controller, gpu):
+    controller.configure(True, max_power=300, power_margin=20)
+    gpu.set(power=310)
+    assert not controller.admit()
+    gpu.set(power=290)
+    assert not controller.admit()
+    gpu.set(power=279)
+    assert controller.admit()
+
+
+def test_vram_hysteresis(controller, gpu):
+    controller.configure(True, min_free_vram_mb=2048, vram_margin_mb=512)
+    gpu.set(vram_free_mb=1000)
+    # Free VRAM only counts once our jobs are using some of it
+    assert controller.admit(running_jobs=0)
+    assert not controller.admit(running_jobs=1)
+    gpu.set(vram_free_mb=2400)
+    assert not controller.admit(running_jobs=1)
+    gpu.set(vram_free_mb=2560)
+    assert controller.admit(running_jobs=1)
+    gpu.set(vram_free_mb=2400)
+    assert controller.admit(running_jobs=1)
+
+
+def test_held_limits_release_independently(controller, gpu):
+    controller.configure(True, max_temp=80, max_power=300)
+    gpu.set(temp=85, power=310)
+    assert not controller.admit()
+    assert controller.held.keys() == {"temp", "power"}
+    gpu.set(temp=70)
+    assert not controller.admit()
+    assert controller.held.keys() == {"power"}
+    gpu.set(power=200)
+    assert controller.admit()
@@ -0,0 +1,69 @@
+import pynvml
+import pytest
+
+from worker.telemetry import FakeGpuProvider, NvmlProvider, TelemetrySampler, visible_devices
+
+
+@pytest.mark.parametrize(
+    ("devices", "expected"),
+    [
+        ("0,2", [0, 2]),
+        (" 1 , 0 ", [1, 0]),
+        ("", []),
+        ("-1", []),
+        ("1,-1,0", [1]),
+        ("GPU-8f2a6c1e-0b3d-4c55-9e21-6d0f7a3b9c10", ["GPU-8f2a6c1e-0b3d-4c55-9e21-6d0f7a3b9c10"]),
+        ("0,MIG-5c3e7a10-42d1-5f7e-8a9b-1c2d3e4f5a6b", [0, "MIG-5c3e7a10-42d1-5f7e-8a9b-1c2d3e4f5a6b"]),
+    ],
+)
+def test_visible_devices(monkeypatch, devices, expected):
+    monkeypatch.setenv("CUDA_VISIBLE_DEVICES", devices)
+    assert visible_devices() == expected
+
+
+def test_visible_devices_unset(monkeypatch):
+    monkeypatch.delenv("CUDA_VISIBLE_DEVICES", raising=False)
+    assert visible_devices() is None
+
+
+@pytest.fixture
+def nvml(monkeypatch):
+    """Two GPUs, found by index or by UUID"""
+    uuids = {b"GPU-aaaa": "handle 0", b"MIG-bbbb": "handle 1 MIG"}
+
+    def by_uuid(uuid) -> str:
+        if uuid not in uuids:
+            raise pynvml.NVMLError(pynvml.NVML_ERROR_NOT_FOUND)
+        return uuids[uuid]
+
+    monkeypatch.setattr(pynvml, "nvmlDeviceGetCount", lambda: 2)
+    monkeypatch.setattr(pynvml, "nvmlDeviceGetHandleByIndex", lambda index: f"handle {index}")
+    monkeypatch.setattr(pynvml, "nvmlDeviceGetHandleByUUID", by_uuid)
+
+
+@pytest.mark.parametrize(
+    ("devices", "expected"),
+    [
+        (None, ["handle 0", "handle 1"]),
+        ("1", ["handle 1"]),
+        ("MIG-bbbb,0", ["handle 1 MIG", "handle 0"]),
+        ("GPU-cccc", ["handle 0", "handle 1"]),
+    ],
+)
+def test_visible_handles(monkeypatch, nvml, devices, expected):
+    if devices is None:
+        monkeypatch.delenv("CUDA_VISIBLE_DEVICES", raising=False)
+    else:
+        monkeypatch.setenv("CUDA_VISIBLE_DEVICES", devices)
+    assert NvmlProvider.visible_handles() == expected
+
+
+def test_sampler_reads_fake_provider():
+    provider = FakeGpuProvider(num_gpus=2)
+    provider.set(1, temp=70, load=90)
+    sampler = TelemetrySampler()
+    sampler.use_provider(provider)
+    gpus = sampler.sample()["gpus"]
+    assert [gpu["temp"] for gpu in gpus] == [40, 70]
+    assert gpus[1]["avg_load"] == 90
+    assert gpus[0]["product"] == "Fake GPU"
@@ -0,0 +1,115 @@
+"""Holds back new jobs while the GPU is short of VRAM, too hot or drawing too much power"""
+
+import threading
+import time
+
+from worker.logger import logger
+from worker.stats import bridge_stats
+from worker.telemetry import telemetry
+
+# Snapshots older than this many sampling intervals are ignored, so a stalled sampler never stalls the worker
+STALE_INTERVALS = 10
+
+
+class AdmissionController:
+    """Decides from live telemetry whether another job may start
+
+    Each limit holds new jobs once it is crossed and only releases them once the reading is back inside the
+    limit by its margin, so the worker doesn't flap around a threshold.
+    """
+
+    def __init__(self, source=None) -> None:
+        self.enabled = False
+        self.min_free_vram_mb = 0
+        self.vram_margin_mb = 512
+        self.max_temp = 0
+        self.temp_margin = 5
+        self.max_power = 0
+        self.power_margin = 20
+        # Any callable returning a telemetry snapshot
+        self.source = source or (lambda: telemetry.snapshot)
+        self.held = {}
+        self.held_since = None
+        self._mutex = threading.Lock()
+
+    def configure(
+        self,
+        enabled,
+        min_free_vram_mb=0,
+        max_temp=0,
+        max_power=0,
+        vram_margin_mb=512,
+        temp_margin=5,
+        power_margin=20,
+    ) -> None:
+        """(Re)configure the limits from the bridge configuration. A limit of 0 is not checked"""
+        with self._mutex:
+            self.enabled = bool(enabled)
+            self.min_free_vram_mb = int(min_free_vram_mb)
+            self.max_temp = int(max_temp)
+            self.max_power = int(max_power)
+            self.vram_margin_mb = int(vram_margin_mb)
+            self.temp_margin = int(temp_margin)
+            self.power_margin = int(power_margin)
+            if not self.enabled:
+                self.held = {}
+        if not self.enabled:
+            self.release(time.time())
+
+    def check(self, gpus, running_jobs) -> dict:
+        """Returns the limits which should hold new jobs, each with a description of the reading"""
+        held = {}
+        if self.min_free_vram_mb and running_jobs:
+            # A model can fill the card on its own, so free VRAM only matters once our jobs are using some of it
+            free = min(gpu["vram_free_mb"] for gpu in gpus)
+            limit = self.min_free_vram_mb + (self.vram_margin_mb if "vram" in self.held else 0)
+            if free < limit:
+                held["vram"] = f"free VRAM {free} MB below {limit} MB"
+        if self.max_temp:
+            temp = max(gpu["temp"] for gpu in gpus)
+            limit = self.max_temp - (self.temp_margin if "temp" in self.held else 0)
+            if temp >= limit:
+                held["temp"] = f"GPU temperature {temp}C at or above {limit}C"
+        if self.max_power:
+            power = max(gpu["power"] for gpu in gpus)
+            limit = self.max_power - (self.power_margin if "power" in self.held else 0)
+            if power >= limit:
+                held["power"] = f"GPU power {power}W at or above {limit}W"
+        return held
+
+    def admit(self, running_jobs=0) -> bool:
+        """True when a new job may start"""
+        if not self.enabled:
+            return True
+        snapshot = self.source()
+        now = time.time()
+        if not snapshot["gpus"] or now - snapshot["time"] > telemetry.interval * STALE_INTERVALS:
+            held = {}
+        else:
+            held = self.check(snapshot["gpus"], running_jobs)
+        with self._mutex:
+            if held.keys() != self.held.keys():
+                if held:
+                    self.hold(held, now)
+                else:
+                    self.release(now)
+                self.held = held
+        return not held
+
+    def hold(self, held, now) -> None:
+        if self.held_since is None:
+            self.held_since = now
+        reasons = ", ".join(held.values())
+        bridge_stats.update_admission_stats(reasons, new_holds=held.keys() - self.held.keys())
+        logger.warning(f"Holding new jobs: {reasons}")
+
+    def release(self, now) -> None:
+        if self.held_since is None:
+            return
+        held_seconds = now - self.held_since
+        self.held_since = None
+        bridge_stats.update_admission_stats(held_seconds=held_seconds)
+        logger.info(f"Resuming new jobs after holding them for {held_seconds:.1f}s")
+
+
+admission = AdmissionController()
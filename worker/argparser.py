@@ -63,6 +63,12 @@ arg_parser.add_argument(
     default=False,
     help="If specified will dump the log to the specified file",
 )
+arg_parser.add_argument(
+    "--structured_log",
+    action="store_true",
+    required=False,
+    help="Also write job events with typed fields to logs/events.jsonl, for use by logstats.py",
+)
 arg_parser.add_argument(
     "-g",
     "--gpu_display",
@@ -82,4 +88,10 @@ arg_parser.add_argument(
     required=False,
     help="The URL at which the KoboldAI Client API can be found.",
 )
+arg_parser.add_argument(
+    "--supervised",
+    type=int,
+    required=False,
+    help="Run as the worker with this index in the workers list of bridgeData.yaml, for horde_scribe_supervisor.py",
+)
 args = arg_parser.parse_args()
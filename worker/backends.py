@@ -0,0 +1,148 @@
+"""The KoboldAI servers a worker serves, the model each of them runs and the jobs running on them"""
+
+import threading
+
+import requests
+
+from worker.logger import logger
+
+
+class KaiBackend:
+    """One KoboldAI compatible server"""
+
+    def __init__(self, url, max_threads=None) -> None:
+        self.url = url
+        # Jobs this server runs at once, None for the worker's max_threads
+        self.max_threads = max_threads
+        self.model = None
+        self.available = False
+        self.softprompts = []
+        self.current_softprompt = None
+        self.running = 0
+        # koboldcpp can abort a generation through /api/extra/abort
+        self.koboldcpp = False
+
+    def validate(self) -> None:
+        """Finds the model and softprompts of the server, marking it unavailable if it doesn't answer"""
+        logger.debug(f"Retrieving settings from KoboldAI Client {self.url}...")
+        try:
+            req = requests.get(self.url + "/api/latest/model", timeout=10)
+            model = req.json()["result"]
+            # Normalize huggingface and local downloaded model names
+            if "/" not in model:
+                model = model.replace("_", "/", 1)
+            if model != self.model:
+                req = requests.get(self.url + "/api/latest/config/soft_prompts_list", timeout=10)
+                self.softprompts = [sp["value"] for sp in req.json()["values"]]
+                self.model = model
+                self.koboldcpp = self.is_koboldcpp()
+            req = requests.get(self.url + "/api/latest/config/soft_prompt", timeout=10)
+            self.current_softprompt = req.json()["value"]
+        except requests.exceptions.JSONDecodeError:
+            logger.error(f"Server {self.url} is up but does not appear to be a KoboldAI server.")
+            self.available = False
+            return
+        except requests.exceptions.ConnectionError:
+            logger.error(f"Server {self.url} is not reachable. Are you sure it's running?")
+            self.available = False
+            return
+        except requests.exceptions.RequestException as ex:
+            logger.error(f"Error reaching {self.url} - {ex}")
+            self.available = False
+            return
+        self.available = True
+
+    def is_koboldcpp(self) -> bool:
+        """Other KoboldAI servers don't serve /api/extra/version, or not as koboldcpp"""
+        try:
+            req = requests.get(self.url + "/api/extra/version", timeout=10)
+            return req.ok and req.json().get("result") == "KoboldCpp"
+        except (requests.exceptions.RequestException, AttributeError):
+            return False
+
+    def threads(self, default) -> int:
+        return self.max_threads or default
+
+    def abort(self, genkey) -> None:
+        """Stops the generation started with this genkey on koboldcpp, other servers finish it"""
+        if not self.koboldcpp:
+            return
+        try:
+            requests.post(self.url + "/api/extra/abort", json={"genkey": genkey}, timeout=5)
+        except requests.exceptions.RequestException as ex:
+            logger.warning(f"Could not abort generation {genkey} on {self.url} - {ex}")
+            return
+        logger.info(f"Aborted generation {genkey} on {self.url}")
+
+
+class BackendPool:
+    """Routes every job to a server running its model, keeping count of the jobs each server runs"""
+
+    def __init__(self) -> None:
+        self.backends = []
+        self._mutex = threading.Lock()
+
+    def configure(self, entries) -> None:
+        """Sets the servers from the kai_backends config, entries are URLs or dicts of url and max_threads"""
+        known = {backend.url: backend for backend in self.backends}
+        backends = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"url": entry}
+            url = entry["url"].rstrip("/")
+            # Servers which stay keep their running jobs and current softprompt
+            backend = known.get(url) or KaiBackend(url)
+            backend.max_threads = entry.get("max_threads")
+            backends.append(backend)
+        with self._mutex:
+            self.backends = backends
+
+    def validate(self) -> None:
+        for backend in list(self.backends):
+            backend.validate()
+
+    def available(self) -> list:
+        return [backend for backend in self.backends if backend.available]
+
+    def models(self) -> list:
+        """Every model run by an available server, in the order of the config"""
+        return list(dict.fromkeys(backend.model for backend in self.available()))
+
+    def threads(self, default, models=None) -> int:
+        """Jobs the servers of these models, or all of them, run at once"""
+        return sum(
+            backend.threads(default) for backend in self.available() if models is None or backend.model in models
+        )
+
+    def softprompts(self, models) -> list:
+        return sorted({softprompt for b in self.available() if b.model in models for softprompt in b.softprompts})
+
+    def acquire(self, model) -> KaiBackend | None:
+        """The least busy available server running the model, counting the job as running on it"""
+        with self._mutex:
+            candidates = [backend for backend in self.backends if backend.available and backend.model == model]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda candidate: candidate.running)
+            backend.running += 1
+            return backend
+
+    def release(self, backend) -> None:
+        with self._mutex:
+            backend.running -= 1
+
+    def status(self, default_threads) -> list:
+        return [
+            {
+                "url": backend.url,
+                "model": backend.model,
+                "available": backend.available,
+                "threads": backend.threads(default_threads),
+                "running": backend.running,
+                "softprompt": backend.current_softprompt,
+            }
+            for backend in list(self.backends)
+        ]
+
+
+backend_pool = BackendPool()
@@ -9,7 +9,8 @@ import yaml
 from loguru import logger
 
 from worker.argparser import args
-from worker.consts import BRIDGE_CONFIG_FILE
+from worker.backends import backend_pool
+from worker.consts import BRIDGE_CONFIG_FILE, LOG_DIR
 
 
 class BridgeData:
@@ -33,8 +34,17 @@ class BridgeData:
         self.api_key = os.environ.get("HORDE_API_KEY", "0000000000")
         self.max_threads = int(os.environ.get("HORDE_MAX_THREADS", 1))
         self.queue_size = int(os.environ.get("HORDE_QUEUE_SIZE", 0))
+        self.queue_policy = os.environ.get("HORDE_QUEUE_POLICY", "fifo")
+        self.pop_ahead = os.environ.get("HORDE_POP_AHEAD", "true") == "true"
+        self.pop_backoff_max = float(os.environ.get("HORDE_POP_BACKOFF_MAX", 4))
         self.stats_output_frequency = int(os.environ.get("STATS_OUTPUT_FREQUENCY", 30))
         self.disable_terminal_ui = os.environ.get("DISABLE_TERMINAL_UI", "false") == "true"
+        self.structured_log = os.environ.get("HORDE_STRUCTURED_LOG", "false") == "true"
+        self.log_compression = os.environ.get("HORDE_LOG_COMPRESSION", "none")
+        self.log_queue = os.environ.get("HORDE_LOG_QUEUE", "false") == "true"
+        self.log_queue_size = int(os.environ.get("HORDE_LOG_QUEUE_SIZE", 10000))
+        self.log_repeat_burst = int(os.environ.get("HORDE_LOG_REPEAT_BURST", 5))
+        self.log_repeat_window = int(os.environ.get("HORDE_LOG_REPEAT_WINDOW", 60))
         self.ui_show_n_gpus = None
         self.initialized = False
         self.kai_available = False
@@ -42,9 +52,31 @@ class BridgeData:
         self.kai_url = "http://localhost:5000"
         self.max_length = int(os.environ.get("HORDE_MAX_LENGTH", "80"))
         self.max_context_length = int(os.environ.get("HORDE_MAX_CONTEXT_LENGTH", "1024"))
+        self.trace_enabled = os.environ.get("HORDE_TRACE_ENABLED", "false") == "true"
+        self.trace_exporter = os.environ.get("HORDE_TRACE_EXPORTER", "jsonl")
+        self.trace_sample_rate = float(os.environ.get("HORDE_TRACE_SAMPLE_RATE", 1.0))
+        self.trace_otlp_endpoint = os.environ.get("HORDE_TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        self.telemetry_interval = float(os.environ.get("HORDE_TELEMETRY_INTERVAL", 0.5))
+        self.telemetry_provider = os.environ.get("HORDE_TELEMETRY_PROVIDER", "nvml")
+        self.admission_enabled = os.environ.get("HORDE_ADMISSION_ENABLED", "false") == "true"
+        self.admission_min_free_vram_mb = int(os.environ.get("HORDE_ADMISSION_MIN_FREE_VRAM_MB", 512))
+        self.admission_max_temp = int(os.environ.get("HORDE_ADMISSION_MAX_TEMP", 83))
+        self.admission_max_power = int(os.environ.get("HORDE_ADMISSION_MAX_POWER", 0))
+        self.control_port = int(os.environ.get("HORDE_CONTROL_PORT", 0))
+        self.dynamic_limits = os.environ.get("HORDE_DYNAMIC_LIMITS", "false") == "true"
+        self.dynamic_limits_min_length = int(os.environ.get("HORDE_DYNAMIC_LIMITS_MIN_LENGTH", 16))
+        self.dynamic_limits_min_context = int(os.environ.get("HORDE_DYNAMIC_LIMITS_MIN_CONTEXT", 512))
+        self.record_traffic = os.environ.get("HORDE_RECORD_TRAFFIC", "false") == "true"
+        # KoboldAI servers to serve instead of kai_url, URLs or dicts of url and max_threads
+        self.kai_backends = []
+        # One entry of settings per worker process run by horde_scribe_supervisor.py
+        self.workers = []
+        self.record_traffic_path = os.environ.get("HORDE_RECORD_TRAFFIC_PATH", f"{LOG_DIR}/traffic.jsonl.gz")
 
         self.softprompts = {}
         self.current_softprompt = None
+        # Settings changed at runtime through the control API, which take precedence over the config file
+        self.overrides = {}
 
     def load_config(self) -> bool:
         # YAML config
@@ -75,8 +107,14 @@ class BridgeData:
             self.queue_size = self.args.queue_size
         if self.args.disable_ui:
             self.disable_terminal_ui = self.args.disable_ui
+        if self.args.structured_log:
+            self.structured_log = self.args.structured_log
         if self.args.gpu_display and self.args.gpu_display > 0:
             self.ui_show_n_gpus = self.args.gpu_display
+        if self.args.supervised is not None:
+            self.apply_worker_entry(self.args.supervised)
+        for key, value in self.overrides.items():
+            setattr(self, key, value)
 
         if not self.initialized or previous_api_key != self.api_key:
             try:
@@ -99,38 +137,36 @@ class BridgeData:
             logger.init(
                 (
                     f"Username '{self.username}'. Server Name '{self.worker_name}'. "
-                    f"Horde URL '{self.horde_url}'. KoboldAI Client URL '{self.kai_url}'"
+                    f"Horde URL '{self.horde_url}'. "
+                    f"KoboldAI Client URL '{', '.join(backend.url for backend in backend_pool.available())}' "
                     "Worker Type: Scribe"
                 ),
                 status="Joining Horde",
             )
 
+    def apply_worker_entry(self, index) -> None:
+        """Applies this worker's entry of the workers list when run by horde_scribe_supervisor.py"""
+        # The supervisor owns the terminal and its control port, workers only get a port if their entry sets one
+        self.disable_terminal_ui = True
+        self.control_port = 0
+        if index >= len(self.workers or []):
+            logger.error(f"No entry {index} in the workers list of {BRIDGE_CONFIG_FILE}")
+            return
+        for key, value in self.workers[index].items():
+            # The GPU is bound by the supervisor before the worker starts
+            if key != "gpu":
+                setattr(self, key, value)
+
     @logger.catch(reraise=True)
     def validate_kai(self) -> None:
-        logger.debug("Retrieving settings from KoboldAI Client...")
-        try:
-            req = requests.get(self.kai_url + "/api/latest/model")
-            self.model = req.json()["result"]
-            # Normalize huggingface and local downloaded model names
-            if "/" not in self.model:
-                self.model = self.model.replace("_", "/", 1)
-
-            if self.model not in self.softprompts:
-                req = requests.get(self.kai_url + "/api/latest/config/soft_prompts_list")
-                self.softprompts[self.model] = [sp["value"] for sp in req.json()["values"]]
-            req = requests.get(self.kai_url + "/api/latest/config/soft_prompt")
-            self.current_softprompt = req.json()["value"]
-        except requests.exceptions.JSONDecodeError:
-            logger.error(f"Server {self.kai_url} is up but does not appear to be a KoboldAI server.")
-            self.kai_available = False
-            return
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Server {self.kai_url} is not reachable. Are you sure it's running?")
-            self.kai_available = False
+        backend_pool.configure(self.kai_backends or [self.kai_url])
+        backend_pool.validate()
+        available = backend_pool.available()
+        self.kai_available = bool(available)
+        if not available:
             return
-        except requests.exceptions.RequestException as ex:
-            logger.error(f"Error reaching {self.kai_url} - {ex}")
-            self.kai_available = False
-            return
-
-        self.kai_available = True
+        # The first server stands for the worker where only one model can be shown
+        self.model = available[0].model
+        self.current_softprompt = available[0].current_softprompt
+        for model in backend_pool.models():
+            self.softprompts[model] = backend_pool.softprompts([model])
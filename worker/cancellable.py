@@ -0,0 +1,73 @@
+"""A requests session whose requests in flight can be cut off from another thread"""
+
+import contextlib
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class CancellableSession(requests.Session):
+    """Remembers the connections it opens, so cancel() can shut their sockets down
+
+    A request blocked reading its response then fails at once with a ConnectionError, and the server sees the
+    connection close. Requests started after cancel() fail as soon as they connect.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.cancelled = False
+        self.connections = []
+        self._mutex = threading.Lock()
+        adapter = TrackingAdapter(self)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def track(self, connection) -> None:
+        with self._mutex:
+            self.connections.append(connection)
+            cancelled = self.cancelled
+        if cancelled:
+            shutdown(connection)
+
+    def cancel(self) -> None:
+        with self._mutex:
+            self.cancelled = True
+            connections = list(self.connections)
+        for connection in connections:
+            shutdown(connection)
+        self.close()
+
+
+def shutdown(connection) -> None:
+    if connection.sock is not None:
+        with contextlib.suppress(OSError):
+            connection.sock.shutdown(socket.SHUT_RDWR)
+
+
+class TrackingAdapter(HTTPAdapter):
+    """Has every connection its pools open report to the session"""
+
+    def __init__(self, session) -> None:
+        self.session = session
+        super().__init__()
+
+    def init_poolmanager(self, *args: object, **kwargs: object) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": self.pool_class(HTTPConnectionPool, HTTPConnection),
+            "https": self.pool_class(HTTPSConnectionPool, HTTPSConnection),
+        }
+
+    def pool_class(self, pool_base, connection_base) -> type:
+        session = self.session
+
+        class TrackedConnection(connection_base):
+            def connect(self) -> None:
+                super().connect()
+                session.track(self)
+
+        return type(pool_base.__name__, (pool_base,), {"ConnectionCls": TrackedConnection})
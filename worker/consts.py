@@ -1,4 +1,8 @@
+import os
+
 BRIDGE_MAJOR_VERSION = 24
 RELEASE_VERSION = f"{BRIDGE_MAJOR_VERSION}.2.6"
 
 BRIDGE_CONFIG_FILE = "bridgeData.yaml"
+# Where logs, spans and recorded traffic go. Each worker run by horde_scribe_supervisor.py gets its own
+LOG_DIR = os.environ.get("HORDE_LOG_DIR", "logs")
@@ -0,0 +1,192 @@
+"""Local HTTP endpoint to inspect the worker and retune it at runtime without editing bridgeData.yaml
+
+GET /status returns the live state as JSON. POST /config takes a JSON object with any of the SETTINGS below,
+validates all of them and only then applies them together, e.g.
+    curl -d '{"max_threads": 2, "log_level": "DEBUG"}' http://127.0.0.1:7002/config
+"""
+
+import json
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from worker.admission import admission
+from worker.backends import backend_pool
+from worker.horde_status import horde_status
+from worker.logger import get_logger_level, logger, set_logger_level
+from worker.stats import bridge_stats
+from worker.telemetry import telemetry
+
+LOG_LEVELS = ["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"]
+
+
+def _count(minimum) -> Callable[[object], int]:
+    def validate(value) -> int:
+        if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+            raise ValueError(f"must be an integer of at least {minimum}")
+        return value
+
+    return validate
+
+
+def _switch(value) -> bool:
+    if not isinstance(value, bool):
+        raise ValueError("must be true or false")
+    return value
+
+
+def _log_level(value) -> str:
+    if not isinstance(value, str) or value.upper() not in LOG_LEVELS:
+        raise ValueError(f"must be one of {', '.join(LOG_LEVELS)}")
+    return value.upper()
+
+
+# Settings which can be changed through POST /config and how their values are validated
+SETTINGS = {
+    "max_threads": _count(1),
+    "queue_size": _count(0),
+    "log_level": _log_level,
+    "paused": _switch,
+    "draining": _switch,
+    "maintenance": _switch,
+}
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    server_version = "HordeScribeControl"
+
+    def send_json(self, status, data) -> None:
+        body = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.rstrip("/") != "/status":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self.send_json(200, self.server.control.status())
+
+    def do_POST(self) -> None:  # noqa: N802
+        if self.path.rstrip("/") != "/config":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            changes = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(changes, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as err:
+            self.send_json(400, {"error": f"Invalid request body: {err}"})
+            return
+        errors = self.server.control.apply(changes)
+        if errors:
+            self.send_json(400, {"errors": errors})
+            return
+        self.send_json(200, self.server.control.status())
+
+    def log_message(self, format, *args: object) -> None:  # noqa: A002
+        logger.debug(f"Control API {self.address_string()} {format % args}")
+
+
+class ControlServer:
+    """Serves the control API for a worker from a background thread"""
+
+    def __init__(self, worker, port, host="127.0.0.1") -> None:
+        self.worker = worker
+        self.host = host
+        self.port = port
+        # As last switched through this API, for when the Horde status poller isn't running
+        self.maintenance = None
+        self.httpd = None
+        self._mutex = threading.Lock()
+
+    def start(self) -> None:
+        try:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), ControlHandler)
+        except OSError as err:
+            logger.error(f"Failed to start the control API on {self.host}:{self.port}: {err}")
+            return
+        self.httpd.daemon_threads = True
+        self.httpd.control = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logger.info(f"Control API listening on http://{self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def status(self) -> dict:
+        worker = self.worker
+        bridge_data = worker.bridge_data
+        now = time.time()
+        return {
+            "worker_name": bridge_data.worker_name,
+            "model": bridge_data.model,
+            "kai_available": bridge_data.kai_available,
+            "backends": backend_pool.status(bridge_data.max_threads),
+            "max_threads": bridge_data.max_threads,
+            "queue_size": bridge_data.queue_size,
+            "queue_policy": worker.waiting_jobs.policy,
+            "pop_backoff": worker.pop_schedule.backoff(),
+            "log_level": get_logger_level(),
+            "paused": worker.paused,
+            "draining": worker.draining,
+            "drained": worker.draining and not worker.running_jobs and not worker.waiting_jobs,
+            "maintenance": (horde_status.worker.data or {}).get("maintenance_mode", self.maintenance),
+            "admission_held": dict(admission.held),
+            "running_jobs": [
+                {
+                    "id": job.current_id,
+                    "model": job.current_model,
+                    "status": job.status.name,
+                    "seconds": round(now - job.start_time, 1),
+                }
+                for _, _, job in list(worker.running_jobs)
+            ],
+            "waiting_jobs": [job.current_id for job in list(worker.waiting_jobs)],
+            "completed_jobs": worker.run_count,
+            "stats": bridge_stats.snapshot(),
+            "telemetry": telemetry.snapshot,
+        }
+
+    def apply(self, changes) -> dict:
+        """Validates every change first and applies none of them if any is invalid. Returns the errors"""
+        errors = {}
+        values = {}
+        for key, value in changes.items():
+            if key not in SETTINGS:
+                errors[key] = "unknown setting"
+                continue
+            try:
+                values[key] = SETTINGS[key](value)
+            except ValueError as err:
+                errors[key] = str(err)
+        if errors:
+            return errors
+        worker = self.worker
+        bridge_data = worker.bridge_data
+        with self._mutex:
+            if "maintenance" in values:
+                horde_status.configure(bridge_data.horde_url, bridge_data.api_key, bridge_data.worker_name)
+                error = horde_status.set_maintenance_mode(values["maintenance"])
+                if error:
+                    return {"maintenance": error}
+                self.maintenance = values["maintenance"]
+            for key in ("max_threads", "queue_size"):
+                if key in values:
+                    # Kept as an override so the periodic reload of bridgeData.yaml doesn't undo it
+                    bridge_data.overrides[key] = values[key]
+                    setattr(bridge_data, key, values[key])
+            # A new max_threads reaches the executor on the worker's own thread, at its next loop
+            if "log_level" in values:
+                set_logger_level(values["log_level"])
+            worker.paused = values.get("paused", worker.paused)
+            worker.draining = values.get("draining", worker.draining)
+        logger.info(f"Control API applied {values}")
+        return {}
@@ -0,0 +1,222 @@
+"""Polls the Horde for this worker's details and the Horde's load from one background thread, for the UI to read"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from urllib import parse
+
+import requests
+
+from worker.consts import RELEASE_VERSION
+from worker.logger import logger
+
+CLIENT_AGENT = f"AI Horde Worker:{RELEASE_VERSION}:https://github.com/TeaSitta/AI-Horde-Worker"
+# Worker ids by Horde URL and worker name, so restarts don't have to look them up again
+WORKER_ID_CACHE = ".horde_worker_ids.json"
+# Failing requests are retried after their interval doubled for each failure, up to this many seconds
+MAX_BACKOFF = 300
+
+
+class Endpoint:
+    """A periodically refreshed Horde API resource, remembering its ETag and backing off on failure"""
+
+    __slots__ = ("interval", "url", "etag", "data", "failures", "due")
+
+    def __init__(self, interval) -> None:
+        self.interval = interval
+        self.url = None
+        self.etag = None
+        self.data = None
+        self.failures = 0
+        self.due = 0
+
+    def succeeded(self, now) -> None:
+        self.failures = 0
+        self.due = now + self.interval
+
+    def failed(self, now) -> None:
+        self.failures += 1
+        self.due = now + min(self.interval * 2**self.failures, MAX_BACKOFF)
+
+
+class HordeStatusPoller:
+    """Keeps the latest worker, Horde performance and model status data for the UI
+
+    Everything is fetched over one session from a single thread. Each resource has its own refresh interval,
+    asks the Horde only for changes when it has an ETag, and backs off when requests fail.
+    """
+
+    def __init__(self) -> None:
+        self.url = None
+        self.api_key = None
+        self.worker_name = None
+        self.worker_id = None
+        self.session = requests.Session()
+        self.session.headers["client-agent"] = CLIENT_AGENT
+        self.worker = Endpoint(5)
+        self.performance = Endpoint(30)
+        self.model_status = Endpoint(30)
+        self._resolve = Endpoint(10)
+        self._thread = None
+        self._mutex = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def configure(self, horde_url, api_key, worker_name) -> None:
+        """Sets the worker to report on, forgetting the previous worker's data if it changed"""
+        with self._mutex:
+            if (horde_url, worker_name) != (self.url, self.worker_name):
+                self.worker_id = None
+                self.worker.data = None
+                self.worker.etag = None
+            self.url = horde_url
+            self.api_key = api_key
+            self.worker_name = worker_name
+
+    def start(self, horde_url, api_key, worker_name) -> None:
+        """Starts polling for the given worker"""
+        self.configure(horde_url, api_key, worker_name)
+        if not self._thread:
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def refresh(self) -> None:
+        """Refresh everything on the next poll"""
+        for endpoint in (self.worker, self.performance, self.model_status):
+            endpoint.due = 0
+        self._wakeup.set()
+
+    def cache_key(self) -> str:
+        return f"{self.url}|{self.worker_name}"
+
+    def load_cached_worker_id(self) -> str | None:
+        with contextlib.suppress(OSError, ValueError), open(WORKER_ID_CACHE, encoding="utf-8") as cachefile:
+            return json.load(cachefile).get(self.cache_key())
+        return None
+
+    def save_cached_worker_id(self, worker_id) -> None:
+        cache = {}
+        with contextlib.suppress(OSError, ValueError), open(WORKER_ID_CACHE, encoding="utf-8") as cachefile:
+            cache = json.load(cachefile)
+        if worker_id:
+            cache[self.cache_key()] = worker_id
+        else:
+            cache.pop(self.cache_key(), None)
+        try:
+            # Named per process, as the workers of horde_scribe_supervisor.py share the cache
+            temporary = f"{WORKER_ID_CACHE}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as cachefile:
+                json.dump(cache, cachefile)
+            os.replace(temporary, WORKER_ID_CACHE)
+        except OSError as err:
+            logger.debug(f"Failed to cache the worker id: {err}")
+
+    def resolve_worker_id(self) -> str | None:
+        """Finds our worker id from the disk cache, or among the workers of our API key"""
+        if self.worker_id:
+            return self.worker_id
+        if worker_id := self.load_cached_worker_id():
+            self.worker_id = worker_id
+            return worker_id
+        r = self.session.get(f"{self.url}/api/v2/find_user", headers={"apikey": self.api_key}, timeout=10)
+        r.raise_for_status()
+        for worker_id in r.json().get("worker_ids") or []:
+            r = self.session.get(f"{self.url}/api/v2/workers/{worker_id}", timeout=10)
+            if r.ok and r.json().get("name") == self.worker_name:
+                logger.info(f"Found worker ID {worker_id}")
+                self.worker_id = worker_id
+                self.save_cached_worker_id(worker_id)
+                return worker_id
+        # Our worker is not yet known to the Horde, it shows up after its first pop
+        return None
+
+    def fetch(self, endpoint, url, now) -> bool:
+        """Refreshes an endpoint's data, True if the Horde answered"""
+        if url != endpoint.url:
+            endpoint.url = url
+            endpoint.etag = None
+        headers = {"If-None-Match": endpoint.etag} if endpoint.etag else {}
+        try:
+            r = self.session.get(url, headers=headers, timeout=10)
+        except requests.exceptions.RequestException as err:
+            logger.debug(f"Horde status request to {url} failed: {err}")
+            endpoint.failed(now)
+            return False
+        if r.status_code == 304:
+            endpoint.succeeded(now)
+            return True
+        if not r.ok:
+            logger.debug(f"Horde status request to {url} failed ({r.status_code})")
+            endpoint.failed(now)
+            if r.status_code == 404:
+                endpoint.data = None
+                return True
+            return False
+        endpoint.etag = r.headers.get("ETag")
+        endpoint.data = r.json()
+        endpoint.succeeded(now)
+        return True
+
+    def poll(self) -> None:
+        now = time.time()
+        if not self.worker_id and now >= self._resolve.due:
+            try:
+                self.resolve_worker_id()
+                self._resolve.succeeded(now)
+            except (requests.exceptions.RequestException, ValueError) as err:
+                logger.debug(f"Failed to find the worker ID: {err}")
+                self._resolve.failed(now)
+        if self.worker_id and now >= self.worker.due:
+            url = f"{self.url}/api/v2/workers/{self.worker_id}"
+            if self.fetch(self.worker, url, now) and (
+                self.worker.data is None or self.worker.data.get("name") != self.worker_name
+            ):
+                # The cached id is stale, e.g. the worker was renamed or deleted
+                logger.debug(f"Worker ID {self.worker_id} no longer belongs to {self.worker_name}")
+                self.worker_id = None
+                self.worker.data = None
+                self.save_cached_worker_id(None)
+        if now >= self.performance.due:
+            self.fetch(self.performance, f"{self.url}/api/v2/status/performance", now)
+        models = (self.worker.data or {}).get("models")
+        if models and now >= self.model_status.due:
+            # Must double encode forward slashes in model names for this horde API call
+            model = parse.quote(parse.quote(models[0], safe=""), safe="")
+            self.fetch(self.model_status, f"{self.url}/api/v2/status/models/{model}", now)
+
+    def run(self) -> None:
+        while True:
+            with contextlib.suppress(Exception):
+                self.poll()
+            due = [self.performance.due, self.model_status.due]
+            due.append(self.worker.due if self.worker_id else self._resolve.due)
+            self._wakeup.wait(max(0.5, min(due) - time.time()))
+            self._wakeup.clear()
+
+    def set_maintenance_mode(self, enabled) -> str | None:
+        """Switches maintenance mode on the Horde. Returns an error message on failure"""
+        try:
+            worker_id = self.resolve_worker_id()
+            if not worker_id:
+                return "worker not yet known to the Horde"
+            if enabled:
+                logger.warning("Attempting to enable maintenance mode.")
+            else:
+                logger.warning("Attempting to disable maintenance mode.")
+            r = self.session.put(
+                f"{self.url}/api/v2/workers/{worker_id}",
+                json={"maintenance": enabled},
+                headers={"apikey": self.api_key},
+                timeout=10,
+            )
+        except (requests.exceptions.RequestException, ValueError) as err:
+            return str(err)
+        if not r.ok:
+            return r.text
+        self.refresh()
+        return None
+
+
+horde_status = HordeStatusPoller()
@@ -0,0 +1,133 @@
+"""The local queue of jobs popped from the Horde and waiting for a thread"""
+
+import heapq
+import itertools
+import time
+from collections.abc import Iterator
+
+from worker.logger import logger
+
+# Seconds the Horde gives a job from its pop to its submit, when the pop doesn't say
+DEFAULT_TTL = 1200
+# Seconds a submit takes on top of the generation
+SUBMIT_SECONDS = 2
+# Weight of the latest job in the average seconds per token
+SPEED_WEIGHT = 0.2
+
+
+def fifo_key(job, sequence) -> tuple:
+    return (sequence,)
+
+
+def edf_key(job, sequence) -> tuple:
+    return (job.deadline, sequence)
+
+
+def sjf_key(job, sequence) -> tuple:
+    return (job.current_payload.get("max_length", 80), sequence)
+
+
+# Orders of the queue by name: first in first out, earliest deadline first and shortest job first
+POLICIES = {"fifo": fifo_key, "edf": edf_key, "sjf": sjf_key}
+
+
+class JobQueue:
+    """Waiting jobs kept in a heap per model, ordered by the configured policy
+
+    Jobs whose deadline can no longer be met are taken out by expire(), so they can be returned to the Horde
+    before they take up a thread.
+    """
+
+    def __init__(self, policy="fifo") -> None:
+        self.policy = policy
+        self.heaps = {}
+        self.sequence = itertools.count()
+        # Average seconds per generated token, None until a job finished
+        self.seconds_per_token = None
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self.heaps.values())
+
+    def __iter__(self) -> Iterator:
+        """The waiting jobs in arrival order"""
+        entries = [entry for heap in list(self.heaps.values()) for entry in list(heap)]
+        return iter([job for _, _, job in sorted(entries, key=lambda entry: entry[1])])
+
+    def configure(self, policy) -> None:
+        """Orders the queue by the policy from the bridge configuration from now on"""
+        if policy not in POLICIES:
+            logger.warning(f"Unknown queue_policy '{policy}', use one of {', '.join(POLICIES)}. Using fifo")
+            policy = "fifo"
+        if policy == self.policy:
+            return
+        self.policy = policy
+        jobs = list(self)
+        self.heaps = {}
+        for job in jobs:
+            self.push(job)
+
+    def push(self, job) -> None:
+        sequence = next(self.sequence)
+        key = POLICIES[self.policy](job, sequence)
+        heapq.heappush(self.heaps.setdefault(job.current_model, []), (key, sequence, job))
+
+    def extend(self, jobs) -> None:
+        for job in jobs:
+            self.push(job)
+
+    def pop(self, models, threads=None) -> tuple:
+        """The first job in policy order among these models, and whether arrival order would have let it expire
+
+        threads maps models to the jobs their servers run at once, one if missing.
+        """
+        heads = [heap[0] for model in models if (heap := self.heaps.get(model))]
+        if not heads:
+            return None, False
+        _, sequence, job = min(heads)
+        heap = self.heaps[job.current_model]
+        model_threads = (threads or {}).get(job.current_model, 1)
+        saved = self.policy != "fifo" and self.saved_by_order(job, sequence, heap, model_threads)
+        heapq.heappop(heap)
+        return job, saved
+
+    def expected_seconds(self, job) -> float:
+        """Seconds from starting the job to its submit"""
+        if self.seconds_per_token is None:
+            return SUBMIT_SECONDS
+        return job.current_payload.get("max_length", 80) * self.seconds_per_token + SUBMIT_SECONDS
+
+    def saved_by_order(self, job, sequence, heap, threads) -> bool:
+        """True when the job meets its deadline, but not after the older jobs of its model had run first"""
+        now = time.time()
+        expected = self.expected_seconds(job)
+        if now + expected > job.deadline:
+            return False
+        older = sum(self.expected_seconds(other) for _, other_sequence, other in heap if other_sequence < sequence)
+        return now + older / threads + expected > job.deadline
+
+    def expire(self) -> list:
+        """Removes and returns the jobs which would miss their deadline even if they started now"""
+        now = time.time()
+        expired = []
+        for model, heap in self.heaps.items():
+            keep = []
+            for entry in heap:
+                if now + self.expected_seconds(entry[2]) <= entry[2].deadline:
+                    keep.append(entry)
+                else:
+                    expired.append(entry[2])
+            if len(keep) < len(heap):
+                heapq.heapify(keep)
+                self.heaps[model] = keep
+        return expired
+
+    def record(self, job) -> None:
+        """Learns the generation speed from a finished job"""
+        max_length = job.current_payload.get("max_length")
+        if not job.generation_seconds or not max_length:
+            return
+        speed = job.generation_seconds / max_length
+        if self.seconds_per_token is None:
+            self.seconds_per_token = speed
+        else:
+            self.seconds_per_token += SPEED_WEIGHT * (speed - self.seconds_per_token)
@@ -3,17 +3,22 @@
 import contextlib
 import copy
 import json
-import sys
 import threading
 import time
 import traceback
 
 import requests
 
+from worker.backends import backend_pool
+from worker.cancellable import CancellableSession
 from worker.consts import RELEASE_VERSION
 from worker.enums import JobStatus
+from worker.job_queue import DEFAULT_TTL
+from worker.limits import advertised_limits
 from worker.logger import logger
+from worker.recorder import recorder
 from worker.stats import bridge_stats
+from worker.tracing import NOOP_SPAN, tracer
 
 
 class HordeJob:
@@ -21,9 +26,10 @@ class HordeJob:
 
     retry_interval = 1
 
-    def __init__(self, bd, pop) -> None:
+    def __init__(self, bd, pop, node="unknown") -> None:
         self.bridge_data = copy.deepcopy(bd)
         self.pop = pop
+        self.node = node
         self.loop_retry = 0
         self.status = JobStatus.INIT
         self.start_time = time.time()
@@ -31,6 +37,14 @@ class HordeJob:
         self.stale_time = None
         self.submit_dict = {}
         self.headers = {"apikey": self.bridge_data.api_key}
+        # The KoboldAI server to run on, chosen by the worker when it starts the job
+        self.backend = None
+        # Set by cancel(), the job's thread stops at its next check and leaves the job to the submit cancel started
+        self.cancelled = threading.Event()
+        self._submit_started = False
+        self._submit_lock = threading.Lock()
+        # Root span of this job's trace. Opened by the extending class once the job id is known
+        self.trace = NOOP_SPAN
 
     def is_finished(self):
         """Check if the job is finished"""
@@ -68,6 +82,7 @@ class HordeJob:
         """Starts a job from a pop request
         This method MUST be extended with the specific logic for this worker
         At the end it MUST create a new thread to submit the results to the horde"""
+        self.trace.child("queue_wait", start=self.start_time).end()
         # Pop new request from the Horde
         if self.pop is None:
             self.pop = self.get_job_from_server()
@@ -85,9 +100,30 @@ class HordeJob:
         # Continue with the specific worker logic from here
         # At the end, you must call self.start_submit_thread()
 
+    def cancel(self, reason) -> None:
+        """Faults the job back to the Horde at once, while its thread stops as soon as it checks self.cancelled"""
+        self.cancelled.set()
+        self.trace.set_error(reason)
+        self.start_submit_thread()
+
+    def fault(self) -> None:
+        """Faults the job back to the Horde, unless a cancel did already"""
+        with self._submit_lock:
+            if self._submit_started:
+                return
+            self.status = JobStatus.FAULTED
+        self.start_submit_thread()
+
     def start_submit_thread(self) -> None:
         """Starts a thread with submit_job so that we don't wait for the upload to complete
         # Not a daemon, so that it can survive after this class is garbage collected"""
+        # Only once, whether the job finished or was cancelled first
+        with self._submit_lock:
+            if self._submit_started:
+                return
+            self._submit_started = True
+            if self.cancelled.is_set():
+                self.status = JobStatus.FAULTED
         submit_thread = threading.Thread(target=self.submit_job, args=())
         submit_thread.start()
         logger.debug("Finished job in threadpool")
@@ -107,6 +143,11 @@ class HordeJob:
         else:
             self.status = JobStatus.FINALIZING
             self.prepare_submit_payload()
+        submit_span = self.trace.child("submit")
+        # Serialise the payload once, every attempt posts the same body
+        submit_body = json.dumps(self.submit_dict).encode("utf-8")
+        submit_headers = {**self.headers, "Content-Type": "application/json"}
+        payload_kb = round(len(submit_body) / 1024, 1)
         # Submit back to horde
         while self.is_finalizing():
             if self.loop_retry > 10:
@@ -114,17 +155,29 @@ class HordeJob:
                 self.status = JobStatus.FAULTED
                 break
             self.loop_retry += 1
+            submit_start = time.time()
             try:
-                logger.debug(
-                    f"posting payload with size of {round(sys.getsizeof(json.dumps(self.submit_dict)) / 1024,1)} kb",
+                logger.bind(event="payload", job_id=self.current_id, payload_kb=payload_kb).debug(
+                    "posting payload with size of {} kb",
+                    payload_kb,
                 )
-                submit_req = requests.post(
-                    self.bridge_data.horde_url + endpoint,
-                    json=self.submit_dict,
-                    headers=self.headers,
-                    timeout=60,
+                with submit_span.child("submit_request", attempt=self.loop_retry) as request_span:
+                    submit_req = requests.post(
+                        self.bridge_data.horde_url + endpoint,
+                        data=submit_body,
+                        headers=submit_headers,
+                        timeout=60,
+                    )
+                    request_span.set_attribute("status_code", submit_req.status_code)
+                recorder.record_response(
+                    "submit",
+                    submit_start,
+                    self.current_id,
+                    self.loop_retry,
+                    submit_req,
+                    bytes=len(submit_body),
                 )
-                logger.debug(f"Upload completed in {submit_req.elapsed.total_seconds()}")
+                logger.debug("Upload completed in {}", submit_req.elapsed.total_seconds())
                 try:
                     submit = submit_req.json()
                 except json.decoder.JSONDecodeError:
@@ -164,9 +217,16 @@ class HordeJob:
                 with contextlib.suppress(ValueError):
                     reward = float(reward)
 
-                logger.info(
+                time_since_queued = round(time.time() - self.start_time, 1)
+                logger.bind(
+                    event="job_submit",
+                    job_id=self.current_id,
+                    kudos=reward,
+                    seconds=time_since_queued,
+                    process_seconds=time_spent_processing,
+                ).info(
                     f"Submitted job with id {self.current_id} and contributed for {reward:.1f}. "
-                    f"Job took {round(time.time() - self.start_time,1)} seconds since queued "
+                    f"Job took {time_since_queued} seconds since queued "
                     f"and {time_spent_processing} since start.",
                 )
 
@@ -177,6 +237,7 @@ class HordeJob:
                     self.status = JobStatus.DONE
                 break
             except requests.exceptions.ConnectionError:
+                recorder.record_response("submit", submit_start, self.current_id, self.loop_retry, error="unavailable")
                 logger.warning(
                     f"Server {self.bridge_data.horde_url} unavailable during submit. "
                     f"Waiting 10 seconds...  (Retry {self.loop_retry}/10)",
@@ -184,12 +245,19 @@ class HordeJob:
                 time.sleep(10)
                 continue
             except requests.exceptions.ReadTimeout:
+                recorder.record_response("submit", submit_start, self.current_id, self.loop_retry, error="timeout")
                 logger.warning(
                     f"Server {self.bridge_data.horde_url} timed out during submit. "
                     f"Waiting 10 seconds...  (Retry {self.loop_retry}/10)",
                 )
                 time.sleep(10)
                 continue
+        submit_span.set_attribute("attempts", self.loop_retry)
+        submit_span.end()
+        self.trace.set_attribute("status", self.status.name)
+        if self.status == JobStatus.FAULTED:
+            self.trace.set_error("faulted")
+        self.trace.end()
 
     def prepare_submit_payload(self) -> None:
         """Should be overriden and prepare a self.submit_dict dictionary with the payload needed
@@ -198,17 +266,32 @@ class HordeJob:
 
 
 class ScribeHordeJob(HordeJob):
-    def __init__(self, bd, pop) -> None:
-        super().__init__(bd, pop)
+    def __init__(self, bd, pop, node="unknown") -> None:
+        super().__init__(bd, pop, node)
         self.current_model = None
         self.seed = None
         self.text = None
-        self.current_model = self.bridge_data.model
+        self.current_model = self.pop.get("model") or self.bridge_data.model
         self.current_id = self.pop["id"]
+        # The Horde gives the job to another worker unless we submit it by then
+        self.deadline = self.start_time + (self.pop.get("ttl") or DEFAULT_TTL)
         self.current_payload = self.pop["payload"]
         self.current_payload["quiet"] = True
+        # Names this job's generation to koboldcpp, so cancel() aborts it and not another job's
+        self.genkey = f"horde-{self.current_id}"
+        # Generates over its own connection, which cancel() closes to stop waiting on the server
+        self.session = CancellableSession()
         self.requested_softprompt = self.current_payload.get("softprompt")
         self.max_seconds = None
+        self.generation_seconds = None
+        self.trace = tracer.start_span(
+            "job",
+            tracer.job_trace_id(self.current_id),
+            start=self.start_time,
+            job_id=self.current_id,
+            model=self.current_model,
+            node=self.node,
+        )
 
     @logger.catch(reraise=True)
     def start_job(self) -> None:
@@ -219,6 +302,12 @@ class ScribeHordeJob(HordeJob):
         if self.status == JobStatus.FAULTED:
             self.start_submit_thread()
             return
+        if not self.backend:
+            logger.error(f"No KoboldAI server is running {self.current_model}. Aborting job {self.current_id}")
+            self.fault()
+            return
+        if self.backend.koboldcpp:
+            self.current_payload["genkey"] = self.genkey
         # we also re-use this for the https timeout to llm inference
         self.max_seconds = (self.current_payload.get("max_length", 80) / 2) + 10
         self.stale_time = time.time() + self.max_seconds
@@ -226,97 +315,142 @@ class ScribeHordeJob(HordeJob):
         gen_payload = self.current_payload
         if "width" in gen_payload or "length" in gen_payload or "steps" in gen_payload:
             logger.error(f"Stable Horde payload detected. Aborting. ({gen_payload})")
-            self.status = JobStatus.FAULTED
-            self.start_submit_thread()
+            self.fault()
             return
         try:
-            logger.info(
+            logger.bind(
+                event="job_start",
+                job_id=self.current_id,
+                model=self.current_model,
+                node=self.node,
+                max_length=self.current_payload["max_length"],
+                context=self.current_payload["max_context_length"],
+                prompt_chars=len(self.current_payload["prompt"]),
+            ).info(
                 f"Starting generation for id {self.current_id}: {self.current_model} @ "
                 f"{self.current_payload['max_length']}:{self.current_payload['max_context_length']} "
                 f"Prompt length is {len(self.current_payload['prompt'])} characters",
             )
             time_state = time.time()
-            if self.requested_softprompt != self.bridge_data.current_softprompt:
-                requests.put(
-                    self.bridge_data.kai_url + "/api/latest/config/soft_prompt",
-                    json={"value": self.requested_softprompt},
-                )
-                time.sleep(1)  # Wait a second to unload the softprompt
-            loop_retry = 0
-            gen_success = False
-            while not gen_success and loop_retry < 5:
-                try:
-                    gen_req = requests.post(
-                        self.bridge_data.kai_url + "/api/latest/generate",
-                        json=self.current_payload,
-                        timeout=self.max_seconds,
-                    )
-                except requests.exceptions.ConnectionError:
-                    logger.error(f"Worker {self.bridge_data.kai_url} unavailable. Retrying in 3 seconds...")
-                    loop_retry += 1
-                    time.sleep(3)
-                    continue
-                except requests.exceptions.ReadTimeout:
-                    logger.error(f"Worker {self.bridge_data.kai_url} request timeout. Aborting.")
-                    self.status = JobStatus.FAULTED
-                    self.start_submit_thread()
-                    return
-                if not isinstance(gen_req.json(), dict):
-                    logger.error(
-                        (
-                            f"KAI instance {self.bridge_data.kai_url} API unexpected response on generate: {gen_req}. "
-                            "Retrying in 3 seconds..."
-                        ),
-                    )
-                    time.sleep(3)
-                    loop_retry += 1
-                    continue
-                if gen_req.status_code == 503:
-                    logger.debug(
-                        f"KAI instance {self.bridge_data.kai_url} Busy (attempt {loop_retry}). Will try again...",
+            if self.requested_softprompt != self.backend.current_softprompt:
+                with self.trace.child("softprompt", softprompt=self.requested_softprompt):
+                    softprompt_start = time.time()
+                    requests.put(
+                        self.backend.url + "/api/latest/config/soft_prompt",
+                        json={"value": self.requested_softprompt},
                     )
-                    time.sleep(3)
-                    loop_retry += 1
-                    continue
-                if gen_req.status_code == 422:
-                    logger.error(
-                        f"KAI instance {self.bridge_data.kai_url} reported validation error.",
+                    time.sleep(1)  # Wait a second to unload the softprompt
+                    self.backend.current_softprompt = self.requested_softprompt
+                    recorder.record(
+                        "softprompt",
+                        softprompt_start,
+                        time.time() - softprompt_start,
+                        job=self.current_id,
+                        softprompt=self.requested_softprompt,
                     )
-                    self.status = JobStatus.FAULTED
-                    self.start_submit_thread()
-                    return
-                try:
-                    req_json = gen_req.json()
-                except json.decoder.JSONDecodeError:
-                    logger.error(
-                        (
-                            f"Something went wrong when trying to generate on {self.bridge_data.kai_url}. "
-                            "Please check the health of the KAI worker. Retrying 3 seconds...",
-                        ),
-                    )
-                    loop_retry += 1
-                    time.sleep(3)
-                    continue
-                try:
-                    self.text = req_json["results"][0]["text"]
-                except KeyError:
-                    logger.error(
-                        (
-                            f"Unexpected response received from {self.bridge_data.kai_url}: {req_json}. "
-                            "Please check the health of the KAI worker. Retrying in 3 seconds..."
-                        ),
-                    )
-                    logger.debug(self.current_payload)
-                    loop_retry += 1
-                    time.sleep(3)
-                    continue
-                gen_success = True
+            loop_retry = 0
+            gen_success = False
+            with self.trace.child("generate") as generate_span, self.session:
+                while not gen_success and loop_retry < 5:
+                    if self.cancelled.is_set():
+                        return
+                    kai_start = time.time()
+                    try:
+                        with generate_span.child("kai_request", attempt=loop_retry + 1) as request_span:
+                            gen_req = self.session.post(
+                                self.backend.url + "/api/latest/generate",
+                                json=self.current_payload,
+                                timeout=self.max_seconds,
+                            )
+                            request_span.set_attribute("status_code", gen_req.status_code)
+                    except requests.exceptions.ConnectionError:
+                        recorder.record_response(
+                            "gen",
+                            kai_start,
+                            self.current_id,
+                            loop_retry + 1,
+                            error="unavailable",
+                        )
+                        if self.cancelled.is_set():
+                            return
+                        logger.error(f"Worker {self.backend.url} unavailable. Retrying in 3 seconds...")
+                        loop_retry += 1
+                        time.sleep(3)
+                        continue
+                    except requests.exceptions.ReadTimeout:
+                        recorder.record_response("gen", kai_start, self.current_id, loop_retry + 1, error="timeout")
+                        if self.cancelled.is_set():
+                            return
+                        advertised_limits.record(None)
+                        logger.error(f"Worker {self.backend.url} request timeout. Aborting.")
+                        self.fault()
+                        return
+                    recorder.record_response("gen", kai_start, self.current_id, loop_retry + 1, gen_req)
+                    if self.cancelled.is_set():
+                        logger.info(f"Dropped the generation of cancelled job {self.current_id}")
+                        return
+                    if not isinstance(gen_req.json(), dict):
+                        logger.error(
+                            (
+                                f"KAI instance {self.backend.url} API unexpected response on generate: "
+                                f"{gen_req}. Retrying in 3 seconds..."
+                            ),
+                        )
+                        time.sleep(3)
+                        loop_retry += 1
+                        continue
+                    if gen_req.status_code == 503:
+                        logger.debug(
+                            "KAI instance {} Busy (attempt {}). Will try again...",
+                            self.backend.url,
+                            loop_retry,
+                        )
+                        time.sleep(3)
+                        loop_retry += 1
+                        continue
+                    if gen_req.status_code == 422:
+                        logger.error(
+                            f"KAI instance {self.backend.url} reported validation error.",
+                        )
+                        self.fault()
+                        return
+                    try:
+                        req_json = gen_req.json()
+                    except json.decoder.JSONDecodeError:
+                        logger.error(
+                            (
+                                f"Something went wrong when trying to generate on {self.backend.url}. "
+                                "Please check the health of the KAI worker. Retrying 3 seconds...",
+                            ),
+                        )
+                        loop_retry += 1
+                        time.sleep(3)
+                        continue
+                    try:
+                        self.text = req_json["results"][0]["text"]
+                    except KeyError:
+                        logger.error(
+                            (
+                                f"Unexpected response received from {self.backend.url}: {req_json}. "
+                                "Please check the health of the KAI worker. Retrying in 3 seconds..."
+                            ),
+                        )
+                        logger.opt(lazy=True).debug("{}", lambda: self.current_payload)
+                        loop_retry += 1
+                        time.sleep(3)
+                        continue
+                    gen_success = True
+                    self.generation_seconds = time.time() - kai_start
+                    advertised_limits.record(self.generation_seconds / self.max_seconds)
+                generate_span.set_attribute("attempts", loop_retry + 1)
             self.seed = 0
             logger.info(
                 f"Generation for id {self.current_id} finished successfully"
                 f" in {round(time.time() - time_state,1)} seconds.",
             )
         except Exception as err:
+            if self.cancelled.is_set():
+                return
             stack_payload = gen_payload
             stack_payload["request_type"] = "text2text"
             stack_payload["model"] = self.current_model
@@ -326,14 +460,23 @@ class ScribeHordeJob(HordeJob):
                 "Please check your trace.log file for the full stack trace. "
                 f"Payload: {stack_payload}",
             )
-            trace = "".join(traceback.format_exception(type(err), err, err.__traceback__))
-            logger.trace(trace)
-            self.status = JobStatus.FAULTED
-            self.start_submit_thread()
+            logger.opt(lazy=True).trace(
+                "{}",
+                lambda error=err: "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+            )
+            self.fault()
             self.bridge_data.kai_available = False
             return
         self.start_submit_thread()
 
+    def cancel(self, reason) -> None:
+        super().cancel(reason)
+        # Closing the connection unblocks the job's thread, and tells the server nobody waits for the generation
+        self.session.cancel()
+        if self.backend and self.backend.koboldcpp:
+            # Off the worker's loop, a busy server may be slow to answer
+            threading.Thread(target=self.backend.abort, args=(self.genkey,), daemon=True).start()
+
     def prepare_submit_payload(self) -> None:
         self.submit_dict = {
             "id": self.current_id,
@@ -342,11 +485,14 @@ class ScribeHordeJob(HordeJob):
         }
 
     def post_submit_tasks(self, submit_req) -> None:
-        bridge_stats.update_inference_stats(self.current_model, submit_req.json()["reward"])
+        reward = submit_req.json()["reward"]
+        bridge_stats.update_inference_stats(self.current_model, reward)
+        if self.generation_seconds:
+            with contextlib.suppress(TypeError, ValueError):
+                bridge_stats.update_gpu_stats(float(reward), self.generation_seconds)
 
 
 class JobPopper:
-    retry_interval = 1
     BRIDGE_AGENT = f"AI Horde Worker:{RELEASE_VERSION}:https://github.com/TeaSitta/AI-Horde-Worker"
 
     def __init__(self, bd) -> None:
@@ -355,9 +501,25 @@ class JobPopper:
         self.headers = {"apikey": self.bridge_data.api_key}
         # This should be set by the extending class
         self.endpoint = None
+        self.node = "unknown"
+        self.pop_span = None
+        # Seconds to wait after a failed pop before the worker carries on
+        self.retry_wait = 0
+        # True once the Horde answered the pop with no job for us
+        self.empty = False
 
     def horde_pop(self):
         """Get a job from the horde"""
+        self.retry_wait = 0
+        with tracer.start_span("pop", endpoint=self.endpoint) as self.pop_span:
+            pops = self.request_pop()
+        # The wait after a failed pop is no part of the pop, the span ended before it
+        time.sleep(self.retry_wait)
+        return pops
+
+    def request_pop(self):
+        """Sends the pop request and decodes the response"""
+        pop_start = time.time()
         try:
             # logger.debug(self.headers)
             # logger.debug(self.pop_payload)
@@ -368,43 +530,59 @@ class JobPopper:
                 timeout=40,
             )
             # logger.debug(self.pop_payload)
-            node = pop_req.headers.get("horde-node", "unknown")
-            logger.debug(f"Job pop took {pop_req.elapsed.total_seconds()} (node: {node})")
-            bridge_stats.update_pop_stats(node, pop_req.elapsed.total_seconds())
+            self.node = pop_req.headers.get("horde-node", "unknown")
+            self.pop_span.set_attribute("node", self.node)
+            self.pop_span.set_attribute("status_code", pop_req.status_code)
+            pop_seconds = pop_req.elapsed.total_seconds()
+            logger.bind(event="pop", pop_seconds=pop_seconds, node=self.node).debug(
+                "Job pop took {} (node: {})",
+                pop_seconds,
+                self.node,
+            )
+            bridge_stats.update_pop_stats(self.node, pop_seconds)
         except requests.exceptions.ConnectionError:
+            recorder.record_pop(pop_start, "unavailable")
             logger.warning(f"Server {self.bridge_data.horde_url} unavailable during pop. Waiting 10 seconds...")
-            time.sleep(10)
+            self.retry_wait = 10
             return None
         except TypeError:
             logger.warning(f"Server {self.bridge_data.horde_url} unavailable during pop. Waiting 2 seconds...")
-            time.sleep(2)
+            self.retry_wait = 2
             return None
         except requests.exceptions.ReadTimeout:
+            recorder.record_pop(pop_start, "timeout")
             logger.warning(f"Server {self.bridge_data.horde_url} timed out during pop. Waiting 2 seconds...")
-            time.sleep(2)
+            self.retry_wait = 2
             return None
         except requests.exceptions.InvalidHeader:
             logger.warning(
                 f"Server {self.bridge_data.horde_url} Something is wrong with the API key you are sending. "
                 "Please check your bridgeData api_key variable. Waiting 10 seconds...",
             )
-            time.sleep(10)
+            self.retry_wait = 10
             return None
 
         try:
             self.pop = pop_req.json()  # I'll use it properly later
+            recorder.record_pop(pop_start, pop_req.status_code, self.node, self.pop)
         except json.decoder.JSONDecodeError:
+            recorder.record_pop(pop_start, pop_req.status_code, self.node)
             logger.error(
                 f"Could not decode response from {self.bridge_data.horde_url} as json. "
                 "Please inform its administrator!",
             )
-            time.sleep(2)
+            self.retry_wait = 2
             return None
+        if job_id := self.pop.get("id"):
+            # Attach the pop to the trace of the job it returned
+            self.pop_span.set_trace_id(tracer.job_trace_id(job_id))
+            self.pop_span.set_attribute("job_id", job_id)
         if not pop_req.ok:
+            self.pop_span.set_error(self.pop.get("message", pop_req.status_code))
             logger.warning(f"{self.pop['message']} ({pop_req.status_code})")
             if "errors" in self.pop:
                 logger.warning(f"Detailed Request Errors: {self.pop['errors']}")
-            time.sleep(3)
+            self.retry_wait = 3
             return None
         return [self.pop]
 
@@ -414,25 +592,37 @@ class JobPopper:
             self.skipped_info = f" Skipped Info: {job_skipped_info}."
         else:
             self.skipped_info = ""
-        logger.info(f"Server {self.bridge_data.horde_url} has no valid generations for us to do.{self.skipped_info}")
-        time.sleep(self.retry_interval)
+        bridge_stats.update_skipped_stats(job_skipped_info or {})
+        logger.bind(
+            event="skipped",
+            skipped=job_skipped_info or {},
+            max_length=self.pop_payload.get("max_length"),
+            context=self.pop_payload.get("max_context_length"),
+        ).info(f"Server {self.bridge_data.horde_url} has no valid generations for us to do.{self.skipped_info}")
+        # The worker backs off before popping again
+        self.empty = True
 
 
 class ScribePopper(JobPopper):
-    def __init__(self, bd) -> None:
+    def __init__(self, bd, models=None) -> None:
         super().__init__(bd)
         self.endpoint = "/api/v2/generate/text/pop"
-        # KAI Only ever offers one single model, so we just add it to the Horde's expected array form.
-        self.available_models = [self.bridge_data.model]
+        # Every KAI offers one single model, one pop asks for jobs of the models of all of them, or those given
+        self.available_models = models or backend_pool.models() or [self.bridge_data.model]
+        max_length, max_context_length = advertised_limits.limits(
+            self.bridge_data.max_length,
+            self.bridge_data.max_context_length,
+        )
 
         self.pop_payload = {
             "name": self.bridge_data.worker_name,
             "models": self.available_models,
-            "max_length": self.bridge_data.max_length,
-            "max_context_length": self.bridge_data.max_context_length,
-            "softprompts": self.bridge_data.softprompts[self.bridge_data.model],
+            "max_length": max_length,
+            "max_context_length": max_context_length,
+            "softprompts": backend_pool.softprompts(self.available_models),
             "bridge_agent": self.BRIDGE_AGENT,
-            "threads": self.bridge_data.max_threads,
+            "threads": backend_pool.threads(self.bridge_data.max_threads, self.available_models)
+            or self.bridge_data.max_threads,
         }
 
     def horde_pop(self):
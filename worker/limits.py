@@ -0,0 +1,146 @@
+"""Moves the max_length and max_context_length advertised to the Horde within configured bounds"""
+
+import threading
+import time
+
+from worker.logger import logger
+from worker.stats import bridge_stats
+
+# A window of generations is judged once this many finished, or after WINDOW_SECONDS with at least MIN_JOBS
+WINDOW_JOBS = 10
+WINDOW_SECONDS = 300
+MIN_JOBS = 3
+# Generations which took more than this share of their deadline nearly missed it
+NEAR_MISS = 0.9
+# The context shrinks once more than this share of a window missed or nearly missed its deadline
+MAX_MISS_RATE = 0.1
+# The context grows while even the slowest generation of a window took less than this share of its deadline
+HEADROOM = 0.5
+# Every change multiplies or divides a limit by this
+STEP = 1.25
+# max_length turns back when kudos per GPU second fell by more than this share after it moved
+KUDOS_TOLERANCE = 0.05
+
+
+class AdvertisedLimits:
+    """Decides from how recent generations went which limits the worker should advertise
+
+    Generations missing their deadline shrink the context, then max_length once the context is at its minimum.
+    Generations well within their deadline grow the context back. In between, max_length climbs towards the kudos
+    per GPU second the worker earns, moving one step per window and turning back when a step earned less.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.min_length = 16
+        self.max_length = 80
+        self.min_context = 512
+        self.max_context = 1024
+        self.length = None
+        self.context = None
+        # Of the next max_length step. Shorter first, as most Horde requests are short
+        self.direction = -1
+        # Kudos per GPU second of the last window, while max_length was the last thing to change
+        self.previous_rate = None
+        self.outcomes = []
+        self.window_start = time.time()
+        self._mutex = threading.Lock()
+
+    def configure(self, enabled, max_length, max_context, min_length=16, min_context=512) -> None:
+        """(Re)configure the bounds from the bridge configuration, the configured limits being the maximums"""
+        with self._mutex:
+            self.enabled = bool(enabled)
+            self.max_length = int(max_length)
+            self.max_context = int(max_context)
+            self.min_length = min(int(min_length), self.max_length)
+            self.min_context = min(int(min_context), self.max_context)
+            if not self.enabled:
+                self.length = None
+                self.context = None
+                self.outcomes = []
+                return
+            # Start from the configured limits and stay inside the bounds when they change
+            self.length = max(self.min_length, min(self.length or self.max_length, self.max_length))
+            self.context = max(self.min_context, min(self.context or self.max_context, self.max_context))
+
+    def limits(self, max_length, max_context) -> tuple:
+        """The max_length and max_context_length to advertise instead of the configured ones"""
+        if not self.enabled:
+            return max_length, max_context
+        return self.length, self.context
+
+    def record(self, fraction) -> None:
+        """Records the share of its deadline a generation took, None when it ran out of time"""
+        if not self.enabled:
+            return
+        with self._mutex:
+            self.outcomes.append(fraction)
+
+    def evaluate(self) -> None:
+        """Judges the current window once it is complete, changing at most one limit"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._mutex:
+            count = len(self.outcomes)
+            if count < WINDOW_JOBS and (count < MIN_JOBS or now - self.window_start < WINDOW_SECONDS):
+                return
+            outcomes = self.outcomes
+            self.outcomes = []
+            rate = bridge_stats.kudos_per_gpu_second(self.window_start)
+            self.window_start = now
+            self.adjust(outcomes, rate)
+
+    def adjust(self, outcomes, rate) -> None:
+        misses = sum(1 for fraction in outcomes if fraction is None or fraction > NEAR_MISS)
+        if misses / len(outcomes) > MAX_MISS_RATE:
+            reason = f"{misses} of {len(outcomes)} recent generations missed or nearly missed their deadline"
+            if self.context > self.min_context:
+                self.change(self.length, max(self.min_context, round(self.context / STEP)), reason)
+            elif self.length > self.min_length:
+                self.change(max(self.min_length, round(self.length / STEP)), self.context, reason)
+            # Kudos earned before a change for the deadlines can't tell whether the next length step pays
+            self.previous_rate = None
+            return
+        slowest = max(outcomes)
+        if slowest < HEADROOM and self.context < self.max_context:
+            reason = f"the slowest of {len(outcomes)} recent generations took {slowest:.0%} of its deadline"
+            self.change(self.length, min(self.max_context, round(self.context * STEP)), reason)
+            self.previous_rate = None
+            return
+        if rate is None:
+            return
+        if self.previous_rate is not None and rate < self.previous_rate * (1 - KUDOS_TOLERANCE):
+            self.direction = -self.direction
+            reason = f"kudos per GPU second fell from {self.previous_rate:.3f} to {rate:.3f}"
+        else:
+            reason = f"kudos per GPU second at {rate:.3f}"
+        if self.direction < 0:
+            length = max(self.min_length, round(self.length / STEP))
+        else:
+            length = min(self.max_length, round(self.length * STEP))
+        if length == self.length:
+            # At a bound, try the other way next window
+            self.direction = -self.direction
+            self.previous_rate = None
+            return
+        self.change(length, self.context, reason)
+        self.previous_rate = rate
+
+    def change(self, length, context, reason) -> None:
+        if (length, context) == (self.length, self.context):
+            return
+        changed = ", ".join(
+            f"{name} {old} -> {new}"
+            for name, old, new in (("max_length", self.length, length), ("max_context_length", self.context, context))
+            if old != new
+        )
+        logger.bind(event="advertised_limits", max_length=length, max_context_length=context).info(
+            f"Advertising {changed}: {reason}",
+        )
+        self.length = length
+        self.context = context
+        bridge_stats.update_limit_stats(length, context, reason)
+
+
+advertised_limits = AdvertisedLimits()
@@ -1,15 +1,31 @@
+import copy
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
 import sys
+import threading
+import time
 from functools import partialmethod
 
 from loguru import logger
 
+from worker.consts import LOG_DIR
+
 STDOUT_LEVELS = ["GENERATION", "PROMPT"]
 INIT_LEVELS = ["INIT", "INIT_OK", "INIT_WARN", "INIT_ERR"]
 MESSAGE_LEVELS = ["MESSAGE"]
 STATS_LEVELS = ["STATS"]
+EVENTS_LOG = f"{LOG_DIR}/events.jsonl"
 # By default we're at error level or higher
 verbosity = 20
 quiet = 0
+# Sinks each level is routed to, worked out once per level and cleared when the verbosity changes
+level_routes = {}
+# Rotated log files are compressed in the background with this format: "gz", "zst" or "none"
+log_compression = "none"
 
 
 def set_logger_verbosity(count) -> None:
@@ -18,62 +34,444 @@ def set_logger_verbosity(count) -> None:
     # While count 5 means maximum verbosity
     # So the more count we have, the lowe we drop the versbosity maximum
     verbosity = 20 - (count * 10)
+    level_routes.clear()
 
 
 def quiesce_logger(count) -> None:
     global quiet
     # The bigger the count, the more silent we want our logger
     quiet = count * 10
+    level_routes.clear()
+
+
+def set_logger_level(level) -> None:
+    """Shows this level and above on screen, replacing the --verbosity and --quiet counts"""
+    global verbosity, quiet
+    verbosity = logger.level(level).no
+    quiet = 0
+    level_routes.clear()
+
+
+def get_logger_level() -> str:
+    """Name of the lowest standard level shown on screen"""
+    threshold = verbosity + quiet
+    levels = ["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"]
+    return next((level for level in levels if logger.level(level).no >= threshold), "CRITICAL")
+
+
+def route_level(level) -> frozenset:
+    """Works out which sinks a level goes to, once per level instead of once per record"""
+    routes = {"stats" if level.name in STATS_LEVELS else "bridge"}
+    if level.name in ["TRACE", "ERROR"]:
+        routes.add("trace")
+    if level.no >= verbosity + quiet:
+        if level.name in STDOUT_LEVELS:
+            routes.add("stdout")
+        elif level.name in INIT_LEVELS:
+            routes.add("init")
+        elif level.name in MESSAGE_LEVELS:
+            routes.add("message")
+        elif level.name not in STATS_LEVELS:
+            routes.add("stderr")
+    return frozenset(routes)
+
+
+def get_routes(record) -> frozenset:
+    if "_repeated" in record["extra"]:
+        return frozenset()
+    routes = level_routes.get(record["level"].name)
+    if routes is None:
+        routes = level_routes[record["level"].name] = route_level(record["level"])
+    return routes
 
 
 def is_stdout_log(record) -> bool:
-    if record["level"].name not in STDOUT_LEVELS:
-        return False
-    if record["level"].no < verbosity + quiet:
-        return False
-    return True
+    return "stdout" in get_routes(record)
 
 
 def is_init_log(record) -> bool:
-    if record["level"].name not in INIT_LEVELS:
-        return False
-    if record["level"].no < verbosity + quiet:
-        return False
-    return True
+    return "init" in get_routes(record)
 
 
 def is_msg_log(record) -> bool:
-    if record["level"].name not in MESSAGE_LEVELS:
-        return False
-    if record["level"].no < verbosity + quiet:
-        return False
-    return True
+    return "message" in get_routes(record)
 
 
 def is_stderr_log(record) -> bool:
-    if record["level"].name in STDOUT_LEVELS + INIT_LEVELS + MESSAGE_LEVELS + STATS_LEVELS:
-        return False
-    if record["level"].no < verbosity + quiet:
-        return False
-    return True
+    return "stderr" in get_routes(record)
 
 
 def is_stats_log(record) -> bool:
-    if record["level"].name not in STATS_LEVELS:
-        return False
-    return True
+    return "stats" in get_routes(record)
 
 
 def is_not_stats_log(record) -> bool:
-    if record["level"].name in STATS_LEVELS:
-        return False
-    return True
+    return "bridge" in get_routes(record)
 
 
 def is_trace_log(record) -> bool:
-    if record["level"].name not in ["TRACE", "ERROR"]:
-        return False
-    return True
+    return "trace" in get_routes(record)
+
+
+def is_not_repeated_log(record) -> bool:
+    return "_repeated" not in record["extra"]
+
+
+class RepeatBucket:
+    """Token bucket of one message key, and the repeats it has held back"""
+
+    __slots__ = ("tokens", "updated", "repeated", "since", "level", "message", "origin")
+
+    def __init__(self, tokens, now, record) -> None:
+        self.tokens = tokens
+        self.updated = now
+        self.repeated = 0
+        self.since = None
+        self.level = record["level"].name
+        self.message = record["message"]
+        self.origin = {key: record[key] for key in ("name", "module", "function", "line", "file")}
+
+
+class LogDeduplicator:
+    """Collapses a message repeated in a tight loop, e.g. while the Horde or KAI is down, into a single count
+
+    Every message key (call site and text) has a token bucket allowing `burst` records per `window` seconds.
+    Records beyond that are flagged in their extra so all sinks skip them, and are logged as one
+    "repeated N times in X s" line once the window has passed. A background thread sweeps every SWEEP_INTERVAL
+    seconds from the first held back record on, so the count comes out even when nothing else is logged.
+    """
+
+    SWEEP_INTERVAL = 1
+
+    def __init__(self, burst=5, window=60, min_level=30) -> None:
+        self.burst = burst
+        self.window = window
+        self.min_level = min_level
+        self.buckets = {}
+        self._mutex = threading.Lock()
+        self._last_sweep = 0
+        self._thread = None
+
+    def configure(self, burst, window) -> None:
+        with self._mutex:
+            self.burst = burst
+            self.window = window
+            self.buckets = {}
+
+    def patch(self, record) -> None:
+        """Loguru patcher, runs once per record before any sink sees it"""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.SWEEP_INTERVAL:
+            self.sweep(now)
+        if (
+            record["level"].no < self.min_level
+            or not self.burst
+            or "event" in record["extra"]
+            or "_repeat_summary" in record["extra"]
+        ):
+            return
+        key = (record["name"], record["line"], record["message"])
+        with self._mutex:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = RepeatBucket(self.burst, now, record)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.burst / self.window)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return
+            if not bucket.repeated:
+                bucket.since = now
+            bucket.repeated += 1
+            if not self._thread:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+        record["extra"]["_repeated"] = True
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.SWEEP_INTERVAL)
+            self.sweep(time.monotonic())
+
+    def sweep(self, now, flush=False) -> None:
+        """Logs the count of every window which has passed, and forgets keys which have gone quiet"""
+        summaries = []
+        with self._mutex:
+            self._last_sweep = now
+            for key, bucket in list(self.buckets.items()):
+                if bucket.repeated and (flush or now - bucket.since >= self.window):
+                    summaries.append((bucket, bucket.repeated, now - bucket.since))
+                    bucket.repeated = 0
+                elif not bucket.repeated and now - bucket.updated >= self.window:
+                    del self.buckets[key]
+        for bucket, repeated, seconds in summaries:
+            logger.bind(_repeat_summary=True).patch(lambda record, bucket=bucket: record.update(bucket.origin)).log(
+                bucket.level,
+                f"{bucket.message} (repeated {repeated} times in {seconds:.0f} s)",
+            )
+
+    def flush(self) -> None:
+        self.sweep(time.monotonic(), flush=True)
+
+
+log_deduplicator = LogDeduplicator()
+
+
+def deduplicate_log(record) -> None:
+    # A plain function rather than the bound method, so the logger can still be deep copied
+    log_deduplicator.patch(record)
+
+
+def set_log_deduplication(burst, window) -> None:
+    """A burst of 0 logs every repeat"""
+    log_deduplicator.configure(burst, window)
+
+
+class LogCompressor:
+    """Compresses rotated log files on a background thread, so a rotation never blocks logging"""
+
+    def __init__(self) -> None:
+        self.queue = queue.Queue()
+        self.thread = None
+        self._mutex = threading.Lock()
+
+    def submit(self, path) -> None:
+        with self._mutex:
+            if not self.thread:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.queue.put(path)
+
+    def run(self) -> None:
+        while True:
+            path = self.queue.get()
+            try:
+                compress_file(path, log_compression)
+            except Exception as err:
+                logger.warning(f"Failed to compress rotated log {path}: {err}")
+
+
+def compress_file(path, compression) -> None:
+    if compression == "none" or not os.path.exists(path):
+        return
+    opener = gzip.open
+    if compression == "zst":
+        try:
+            import zstandard
+
+            opener = zstandard.open
+        except ImportError:
+            compression = "gz"
+    compressed_path = f"{path}.{compression}"
+    temp_path = f"{compressed_path}.tmp"
+    stat = os.stat(path)
+    with open(path, "rb") as infile, opener(temp_path, "wb") as outfile:
+        shutil.copyfileobj(infile, outfile, 1024 * 1024)
+    # Keep the original modification time, log retention goes by it
+    os.utime(temp_path, (stat.st_atime, stat.st_mtime))
+    os.replace(temp_path, compressed_path)
+    os.remove(path)
+
+
+log_compressor = LogCompressor()
+
+
+def compress_rotated_log(path) -> None:
+    """Loguru compression hook. It runs inside the logging call which triggered the rotation, so only queue it"""
+    if log_compression != "none":
+        log_compressor.submit(path)
+
+
+def set_log_compression(compression) -> None:
+    global log_compression
+    log_compression = compression
+    if compression == "none":
+        return
+    # Pick up files rotated by an earlier run which exited before compressing them
+    for handler in config["handlers"] + log_queue.handlers:
+        if isinstance(handler["sink"], str) and handler.get("rotation"):
+            root, ext = os.path.splitext(handler["sink"])
+            for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+                log_compressor.submit(path)
+
+
+# Options only loguru's file sinks take, they stay with the file while records are formatted on their own
+FILE_SINK_OPTIONS = ("rotation", "retention", "compression", "delay", "watch", "mode", "buffering", "encoding")
+# Characters of a queued record kept for sinks with diagnose, whose variable dumps can run long in deep stacks
+MAX_DIAGNOSE_CHARS = 32768
+
+
+class LogQueue:
+    """Bounded queue between the logging calls and the file sinks, drained in batches by a background writer
+
+    The records are formatted by a copy of the logger which only the writer thread logs to, with the settings of
+    each file sink, and every drained batch goes to each file in one write. When the queue is full, records are
+    dropped and counted rather than holding up the thread which logged them.
+    """
+
+    def __init__(self) -> None:
+        self.queue = None
+        self.batch_size = 256
+        self.handlers = []
+        # (path, formatted records of the current batch, character cap of a record) per file sink
+        self.buffers = []
+        self.file_logger = None
+        self.batch_logger = None
+        self.thread = None
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self._reported_dropped = 0
+        self._record = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, handlers, max_size) -> None:
+        self.handlers = handlers
+        self.queue = queue.Queue(max_size)
+        # A deep copy keeps our custom levels, but none of the handlers
+        logger.remove()
+        self.file_logger = copy.deepcopy(logger)
+        # Replaces the copied deduplication patcher, records were deduplicated before they were queued
+        self.file_logger.configure(patcher=self._restore_record)
+        self.batch_logger = copy.deepcopy(logger)
+        self.batch_logger.configure(patcher=lambda record: None)
+        self.handlers = []
+        for handler in handlers:
+            self.add(handler)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, handler) -> None:
+        """Formats the records for a file sink into a buffer, which the writer appends to the file once per batch"""
+        self.handlers.append(handler)
+        path = handler["sink"]
+        lines = []
+        formatting = {key: value for key, value in handler.items() if key not in FILE_SINK_OPTIONS}
+        self.file_logger.add(**{**formatting, "sink": lines.append, "colorize": False})
+        file_options = {key: value for key, value in handler.items() if key in FILE_SINK_OPTIONS}
+        self.batch_logger.add(
+            path,
+            level="TRACE",
+            filter=lambda record: record["extra"].get("path") == path,
+            **file_options,
+        )
+        self.buffers.append((path, lines, MAX_DIAGNOSE_CHARS if handler.get("diagnose") else None))
+
+    def write(self, message) -> None:
+        """Loguru sink, called on the logging thread"""
+        try:
+            self.queue.put_nowait(message.record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _restore_record(self, record) -> None:
+        # Records are logged again on the writer thread, keep their original time, caller and exception
+        if self._record is not None:
+            record.update(self._record)
+
+    def run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    stopping = True
+                    break
+                self._record = record
+                self.file_logger.log(record["level"].name, record["message"])
+                self.written += 1
+            self._record = None
+            if self.dropped > self._reported_dropped:
+                self.file_logger.warning(f"Log queue full, dropped {self.dropped - self._reported_dropped} messages")
+                self._reported_dropped = self.dropped
+            self.write_batch()
+
+    def write_batch(self) -> None:
+        """Appends the records formatted since the last batch to each file, in one write per file"""
+        for path, lines, max_chars in self.buffers:
+            if not lines:
+                continue
+            if max_chars:
+                lines[:] = [
+                    line if len(line) <= max_chars else f"{line[:max_chars]}... (truncated)\n" for line in lines
+                ]
+            self.batch_logger.bind(path=path).opt(raw=True).log("TRACE", "".join(lines))
+            lines.clear()
+        self.batches += 1
+
+    def stop(self) -> None:
+        """Writes out the records still queued and closes the file sinks"""
+        if not self.running:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=10)
+        self.file_logger.remove()
+        self.batch_logger.remove()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize() if self.queue else 0,
+            "max_size": self.queue.maxsize if self.queue else 0,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+        }
+
+
+log_queue = LogQueue()
+
+
+def enable_log_queue(max_size=10000) -> None:
+    """Moves the file sinks behind a bounded queue, so slow disks never hold up the job threads"""
+    if log_queue.running:
+        return
+    file_handlers = [handler for handler in config["handlers"] if isinstance(handler["sink"], str)]
+    config["handlers"] = [handler for handler in config["handlers"] if handler not in file_handlers]
+    log_queue.start(file_handlers, max_size)
+    config["handlers"].append(
+        {"sink": log_queue.write, "format": "{message}", "level": "TRACE", "filter": is_not_repeated_log},
+    )
+    logger.configure(**config)
+
+
+def is_event_log(record) -> bool:
+    return "event" in record["extra"]
+
+
+def event_formatter(record) -> str:
+    """Formats a job event as one compact JSON object per line, carrying only its typed fields"""
+    fields = {"time": record["time"].timestamp(), **record["extra"]}
+    record["extra"]["_json"] = json.dumps(fields, separators=(",", ":"), default=str)
+    return "{extra[_json]}\n"
+
+
+def enable_structured_log() -> None:
+    """Adds the JSONL sink for job events (logger.bind(event=...)) used by logstats.py"""
+    if any(handler["sink"] == EVENTS_LOG for handler in config["handlers"] + log_queue.handlers):
+        return
+    handler = {
+        "sink": EVENTS_LOG,
+        "format": event_formatter,
+        "level": "DEBUG",
+        "colorize": False,
+        "filter": is_event_log,
+        "retention": "7 days",
+        "rotation": "1 days",
+        "compression": compress_rotated_log,
+    }
+    if log_queue.running:
+        log_queue.add(handler)
+        return
+    config["handlers"].append(handler)
+    logger.add(**handler)
 
 
 def test_logger() -> None:
@@ -118,6 +516,9 @@ try:
 except TypeError:
     pass
 
+# DEBUG and TRACE messages pass their values as arguments, logger.debug("took {}", seconds), instead of f-strings,
+# so loguru only formats them once a sink takes records of that level. Arguments which are expensive to build are
+# passed as callables, logger.opt(lazy=True).debug("{}", func), which loguru then only calls in that case
 logger.__class__.generation = partialmethod(logger.__class__.log, "GENERATION")
 logger.__class__.prompt = partialmethod(logger.__class__.log, "PROMPT")
 logger.__class__.init = partialmethod(logger.__class__.log, "INIT")
@@ -157,34 +558,38 @@ config = {
             "filter": is_msg_log,
         },
         {
-            "sink": "logs/bridge.log",
+            "sink": f"{LOG_DIR}/bridge.log",
             "format": logfmt,
             "level": "DEBUG",
             "colorize": False,
             "filter": is_not_stats_log,
             "retention": "2 days",
             "rotation": "3 hours",
+            "compression": compress_rotated_log,
         },
         {
-            "sink": "logs/stats.log",
+            "sink": f"{LOG_DIR}/stats.log",
             "format": logfmt,
             "level": "STATS",
             "colorize": False,
             "filter": is_stats_log,
             "retention": "7 days",
             "rotation": "1 days",
+            "compression": compress_rotated_log,
         },
         {
-            "sink": "logs/trace.log",
+            "sink": f"{LOG_DIR}/trace.log",
             "format": logfmt,
             "level": "TRACE",
             "colorize": False,
             "filter": is_trace_log,
             "retention": "3 days",
             "rotation": "1 days",
+            "compression": compress_rotated_log,
             "backtrace": True,
             "diagnose": True,
         },
     ],
+    "patcher": deduplicate_log,
 }
 logger.configure(**config)
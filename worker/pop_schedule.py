@@ -0,0 +1,72 @@
+"""When the worker pops next: backing off while the Horde has nothing for us, and ahead of threads freeing up"""
+
+import time
+
+from worker.logger import logger
+from worker.stats import bridge_stats
+
+# Seconds to wait after the first empty pop, doubling with every further one up to the configured maximum
+MIN_BACKOFF = 1
+# Seconds added to the average pop time, for the loop to notice a thread is about to free up
+POP_AHEAD_MARGIN = 0.25
+
+
+class PopSchedule:
+    """Holds back pops after empty ones, and tells when a running job will free its thread within one pop
+
+    An empty pop delays the next by MIN_BACKOFF seconds, doubling up to max_backoff. The first pop which returns
+    a job puts the worker back to popping as soon as it has room.
+    """
+
+    def __init__(self) -> None:
+        self.max_backoff = 4
+        self.pop_ahead = True
+        # Empty pops in a row and the earliest time of the next pop after them
+        self.empty_pops = 0
+        self.next_pop = 0.0
+
+    def configure(self, max_backoff, pop_ahead) -> None:
+        """(Re)configure from the bridge configuration"""
+        self.max_backoff = max(MIN_BACKOFF, float(max_backoff))
+        self.pop_ahead = bool(pop_ahead)
+        self.next_pop = min(self.next_pop, time.time() + self.max_backoff)
+
+    def due(self) -> bool:
+        """False while backing off from empty pops"""
+        return time.time() >= self.next_pop
+
+    def backoff(self) -> float:
+        """Seconds to wait before the next pop, after the empty pops so far"""
+        if not self.empty_pops:
+            return 0
+        return min(MIN_BACKOFF * 2 ** (self.empty_pops - 1), self.max_backoff)
+
+    def record(self, empty) -> None:
+        """Backs off further after an empty pop, resets after one which returned a job"""
+        if not empty:
+            if self.empty_pops:
+                logger.debug("Jobs are back after {} empty pops", self.empty_pops)
+            self.empty_pops = 0
+            self.next_pop = 0.0
+            return
+        self.empty_pops += 1
+        delay = self.backoff()
+        self.next_pop = time.time() + delay
+        logger.debug("{} empty pops in a row, popping again in {:g}s", self.empty_pops, delay)
+
+    def lead_seconds(self) -> float:
+        """How long before a thread frees up to pop for it, so the next job arrives as the current one ends"""
+        return bridge_stats.stats.get("pop_time_avg_5_mins", 0) + POP_AHEAD_MARGIN
+
+    def frees_soon(self, jobs, seconds_per_token) -> bool:
+        """True when one of these running jobs is expected to finish its generation within one pop
+
+        seconds_per_token is the generation speed learned from finished jobs, None until one finished.
+        """
+        if not self.pop_ahead or seconds_per_token is None:
+            return False
+        finish_by = time.time() + self.lead_seconds()
+        return any(
+            job.process_time + job.current_payload.get("max_length", 80) * seconds_per_token <= finish_by
+            for job in jobs
+        )
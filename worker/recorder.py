@@ -0,0 +1,135 @@
+"""Records the shape and timing of Horde and KAI traffic, for replay by benchmarks/replay_traffic.py"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from worker.consts import LOG_DIR
+from worker.logger import logger
+
+
+def prompt_digest(prompt) -> str:
+    """Prompts are never recorded, only a short hash so repeated prompts can still be recognised"""
+    return hashlib.sha256(prompt.encode("utf-8", "replace")).hexdigest()[:16]
+
+
+class TrafficRecorder:
+    """Appends one compact JSON line per pop, softprompt change, generation and submit attempt to a gzip file
+
+    Records are buffered and written by a background thread. Recording is off unless configured, and then
+    record() costs a dict and a list append.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.path = f"{LOG_DIR}/traffic.jsonl.gz"
+        self.max_bytes = 50 * 1024 * 1024
+        self.backups = 5
+        self.flush_interval = 5
+        self._buffer = []
+        self._mutex = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_thread = None
+
+    def configure(self, enabled, path=None) -> None:
+        """(Re)configure the recorder from the bridge configuration"""
+        if enabled and not self.enabled:
+            logger.info(f"Recording Horde and KAI traffic to {path or self.path}")
+        self.enabled = bool(enabled)
+        if path:
+            self.path = path
+        if self.enabled and not self._flush_thread:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+
+    def record(self, kind, start, seconds, **fields: object) -> None:
+        """Records an exchange of the given kind which started at start (epoch) and took seconds"""
+        if not self.enabled:
+            return
+        entry = {"k": kind, "t": round(start, 3), "d": round(seconds, 4), **fields}
+        with self._mutex:
+            self._buffer.append(entry)
+
+    def record_pop(self, start, status, node=None, pop=None) -> None:
+        """Records a pop from its decoded response, or the status or error which prevented one"""
+        if not self.enabled:
+            return
+        fields = {"s": status, "node": node}
+        if pop and pop.get("id"):
+            payload = pop.get("payload", {})
+            fields.update(
+                job=pop["id"],
+                model=pop.get("model"),
+                max_length=payload.get("max_length"),
+                context=payload.get("max_context_length"),
+                prompt_chars=len(payload.get("prompt", "")),
+                prompt_hash=prompt_digest(payload.get("prompt", "")),
+                softprompt=payload.get("softprompt"),
+            )
+        elif pop:
+            fields["skipped"] = pop.get("skipped")
+        self.record("pop", start, time.time() - start, **fields)
+
+    def record_response(self, kind, start, job_id, attempt, response=None, error=None, **fields: object) -> None:
+        """Records a generation or submit attempt from its response, or the error which prevented one"""
+        if not self.enabled:
+            return
+        seconds = time.time() - start
+        if response is None:
+            self.record(kind, start, seconds, job=job_id, attempt=attempt, s=error, **fields)
+            return
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if kind == "gen" and response.ok and isinstance(data, dict) and data.get("results"):
+            fields["chars"] = len(data["results"][0].get("text") or "")
+        if kind == "submit" and response.ok and isinstance(data, dict):
+            fields["reward"] = data.get("reward")
+        self.record(kind, start, seconds, job=job_id, attempt=attempt, s=response.status_code, **fields)
+
+    def rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def flush(self) -> None:
+        with self._mutex:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self.rotate()
+            # Every flush appends a gzip member, which gzip readers see as one continuous stream
+            with gzip.open(self.path, "at", encoding="utf-8") as outfile:
+                outfile.write("".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries))
+        except OSError as err:
+            logger.debug(f"Failed to write {len(entries)} traffic records: {err}")
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def shutdown(self) -> None:
+        if self.enabled:
+            self.flush()
+
+
+def read_traffic(path):
+    """Yields the records of a traffic file in the order they were written"""
+    with gzip.open(path, "rt", encoding="utf-8") as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+recorder = TrafficRecorder()
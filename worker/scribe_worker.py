@@ -2,18 +2,37 @@
 
 import threading
 import time
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 
+from worker.admission import admission
+from worker.backends import backend_pool
+from worker.control import ControlServer
+from worker.job_queue import JobQueue
 from worker.jobs import ScribeHordeJob, ScribePopper
-from worker.logger import logger
+from worker.limits import advertised_limits
+from worker.logger import log_queue, logger
+from worker.pop_schedule import PopSchedule
+from worker.recorder import recorder
+from worker.skipped import capacity_advice
 from worker.stats import bridge_stats
+from worker.telemetry import telemetry
+from worker.tracing import tracer
+
+# Executor threads kept for cancelled jobs winding down, on top of those for the running jobs
+MAX_CANCELLED_THREADS = 4
+# Executors still finishing jobs after they were replaced. Beyond this, new jobs wait for a thread instead
+MAX_RETIRED_EXECUTORS = 2
 
 
 class ScribeWorker:
     def __init__(self, this_bridge_data) -> None:
         self.bridge_data = this_bridge_data
         self.running_jobs = []
-        self.waiting_jobs = []
+        self.waiting_jobs = JobQueue()
+        self.pop_schedule = PopSchedule()
+        # Threads of cancelled jobs still winding down, which hold an executor thread until they do
+        self.cancelled_threads = []
         self.run_count = 0
         self.last_config_reload = 0
         self.is_daemon = False
@@ -22,10 +41,19 @@ class ScribeWorker:
         self.consecutive_failed_jobs = 0
         self.out_of_memory_jobs = 0
         self.soft_restarts = 0
+        # Set through the control API. Paused starts no new jobs, draining finishes the local queue but pops no more
+        self.paused = False
+        self.draining = False
+        self.control = None
         self.executor = None
+        self.executor_size = 0
+        # (executor, futures) of executors replaced by a new one, finishing the jobs they still run
+        self.retired_executors = []
         self.ui = None
         self.ui_class = None
         self.last_stats_time = time.time()
+        self.last_loop_time = time.time()
+        self.was_idle = True
         self.PopperClass = ScribePopper
         self.JobClass = ScribeHordeJob
         self.shutdown_event = threading.Event()
@@ -51,12 +79,17 @@ class ScribeWorker:
     @logger.catch(reraise=True)
     def stop(self) -> None:
         self.shutdown_event.set()
+        if self.control:
+            self.control.stop()
         self.ui_class.stop()
         logger.info("Stop methods called")
 
     @logger.catch(reraise=True)
     def start(self) -> None:
         self.reload_data()
+        if self.bridge_data.control_port:
+            self.control = ControlServer(self, self.bridge_data.control_port)
+            self.control.start()
 
         # Moved out of the loop to capture failure across soft-restarts
         self.consecutive_failed_jobs = 0
@@ -68,7 +101,8 @@ class ScribeWorker:
                 self.on_restart()
                 self.run_count = 0
 
-            with ThreadPoolExecutor(max_workers=self.bridge_data.max_threads) as self.executor:
+            self.executor = self.new_executor()
+            try:
                 while not self.shutdown_event.is_set():
                     if self.should_restart:
                         self.executor.shutdown(wait=False)
@@ -90,30 +124,61 @@ class ScribeWorker:
                         return
                     else:  # noqa: RET505
                         break
+            finally:
+                for executor in [*(executor for executor, _ in self.retired_executors), self.executor]:
+                    executor.shutdown(wait=True)
+                self.retired_executors = []
 
     def process_jobs(self) -> None:
+        self.account_utilization()
         if time.time() - self.last_config_reload > 30:
             self.reload_bridge_data()
         if not self.can_process_jobs():
             time.sleep(3)
             return
+        self.expire_waiting_jobs()
+
+        # Only this thread submits to the executor, so only this thread replaces it
+        self.resize_executor()
+        # Don't pick up or start more jobs while paused, or the GPU is short of VRAM, too hot or at its power limit
+        if not self.paused and admission.admit(len(self.running_jobs)):
+            # Add job to queue if we have space, or without a queue, if a thread is about to free up
+            if not self.draining and self.pop_schedule.due():
+                self.add_job_to_queue()
 
-        # Add job to queue if we have space
-        if len(self.waiting_jobs) < self.bridge_data.queue_size:
-            self.add_job_to_queue()
+            while len(self.running_jobs) < self.thread_limit() and self.start_job():
+                pass
+            self.account_utilization()
 
-        while len(self.running_jobs) < self.bridge_data.max_threads and self.start_job():
-            pass
+        advertised_limits.evaluate()
 
-            # Check if any jobs are done
-        for job_thread, start_time, job in self.running_jobs:
+        # Check if any jobs are done
+        for job_thread, start_time, job in list(self.running_jobs):
             self.check_running_job_status(job_thread, start_time, job)
+        self.account_utilization()
+        # Also while idle, when the skipped jobs tell the most
+        self.log_stats()
 
         if self.should_restart or self.shutdown_event.is_set() or not self.bridge_data.kai_available:
             return
         # Give the CPU a break
         time.sleep(0.02)
 
+    def expire_waiting_jobs(self) -> None:
+        """Returns the queued jobs which can no longer finish in time to the Horde, before they take a thread"""
+        for job in self.waiting_jobs.expire():
+            logger.warning(f"Returning job {job.current_id} to the Horde, it can no longer finish before its deadline")
+            job.trace.set_error("expired")
+            job.fault()
+            bridge_stats.update_queue_stats(expired=1)
+
+    def account_utilization(self) -> None:
+        """Counts the time since the last call as idle if no job was running at that call"""
+        now = time.time()
+        bridge_stats.update_utilization_stats(now - self.last_loop_time, idle=self.was_idle)
+        self.last_loop_time = now
+        self.was_idle = not self.running_jobs
+
     def can_process_jobs(self):
         """This function returns true when this worker can start polling for jobs from the AI Horde
         This function MUST be overriden, according to the logic for this worker type"""
@@ -123,22 +188,57 @@ class ScribeWorker:
             self.last_config_reload = time.time() - 55
         return kai_avail
 
+    def thread_limit(self) -> int:
+        """Jobs all KoboldAI servers together run at once"""
+        return max(1, backend_pool.threads(self.bridge_data.max_threads))
+
+    def models_with_room(self, queue=False) -> list:
+        """The models whose servers have a thread free, or with queue, room for more waiting jobs"""
+        running = Counter(job.current_model for _, _, job in self.running_jobs)
+        if queue:
+            running.update(job.current_model for job in self.waiting_jobs)
+        threads = self.bridge_data.max_threads
+        return [
+            model
+            for model in backend_pool.models()
+            if running[model] < backend_pool.threads(threads, [model]) + (self.queue_room(model) if queue else 0)
+        ]
+
+    def queue_room(self, model) -> int:
+        """Jobs of the model to hold on top of its threads: queue_size, or without a queue, one popped ahead of a
+        running job expected to finish within one pop"""
+        if self.bridge_data.queue_size:
+            return self.bridge_data.queue_size
+        jobs = [job for _, _, job in self.running_jobs if job.current_model == model]
+        return int(self.pop_schedule.frees_soon(jobs, self.waiting_jobs.seconds_per_token))
+
     def add_job_to_queue(self) -> None:
         """Picks up a job from the horde and adds it to the local queue
         Returns the job object created, if any"""
-        if jobs := self.pop_job():
+        models = self.models_with_room(queue=True)
+        popping_ahead = not self.bridge_data.queue_size
+        if popping_ahead:
+            # Without a queue, start_job pops for free threads, only models with every thread busy pop ahead here
+            free = self.models_with_room()
+            models = [model for model in models if model not in free]
+        if models and (jobs := self.pop_job(models)):
             self.waiting_jobs.extend(jobs)
+            if popping_ahead:
+                bridge_stats.update_queue_stats(popped_ahead=len(jobs))
 
-    def pop_job(self):
+    def pop_job(self, models=None):
         """Polls the AI Horde for new jobs and creates as many Job classes needed
         As the amount of jobs returned"""
-        job_popper = self.PopperClass(self.bridge_data)
+        job_popper = self.PopperClass(self.bridge_data, models)
         pops = job_popper.horde_pop()
+        # Failed pops wait on their own, only the Horde having nothing for us backs off
+        if pops or job_popper.empty:
+            self.pop_schedule.record(empty=not pops)
         if not pops:
             return None
         new_jobs = []
         for pop in pops:
-            new_job = self.JobClass(self.bridge_data, pop)
+            new_job = self.JobClass(self.bridge_data, pop, job_popper.node)
             new_jobs.append(new_job)
         return new_jobs
 
@@ -146,17 +246,25 @@ class ScribeWorker:
         """Starts a job previously picked up from the horde
         Returns True to continue starting jobs until queue is full
         Returns False to break out of the loop and poll the horde again"""
-        job = None
-        # Queue disabled
-        if self.bridge_data.queue_size == 0:
-            if jobs := self.pop_job():
+        models = self.models_with_room()
+        if not models:
+            return False
+        # The first job in queue_policy order whose model has a thread free, busy models don't hold up the others
+        threads = {model: backend_pool.threads(self.bridge_data.max_threads, [model]) for model in models}
+        job, saved = self.waiting_jobs.pop(models, threads)
+        if saved:
+            bridge_stats.update_queue_stats(saved=1)
+        if self.bridge_data.queue_size == 0 and not job:
+            # Queue disabled and nothing popped ahead, pop for the free thread now unless backing off from empty pops
+            if self.draining or not self.pop_schedule.due():
+                return False
+            if jobs := self.pop_job(models):
                 job = jobs[0]
-        elif len(self.waiting_jobs) > 0:
-            job = self.waiting_jobs.pop(0)
-        else:
+        elif not job:
             return False
         # Run the job
         if job:
+            job.backend = backend_pool.acquire(job.current_model)
             self.running_jobs.append((self.executor.submit(job.start_job), time.monotonic(), job))
             logger.debug("New job processing")
         else:
@@ -199,32 +307,85 @@ class ScribeWorker:
                 self.consecutive_failed_jobs = 0
                 self.consecutive_executor_restarts = 0
             self.run_count += 1
-            logger.debug(f"Job finished successfully in {runtime:.3f}s (Total Completed: {self.run_count})")
+            logger.debug("Job finished successfully in {:.3f}s (Total Completed: {})", runtime, self.run_count)
             self.running_jobs.remove((job_thread, start_time, job))
+            if job.backend:
+                backend_pool.release(job.backend)
+            self.waiting_jobs.record(job)
             return
 
-        # check if any job has run for more than 180 seconds
+        # check if any job has run past its deadline
         if job_thread.running() and job.is_stale():
-            logger.warning("Restarting all jobs, as a job is stale " f": {runtime:.3f}s")
-            for (
-                inner_job_thread,
-                inner_start_time,
-                inner_job,
-            ) in self.running_jobs:  # Sometimes it's already removed
-                self.running_jobs.remove((inner_job_thread, inner_start_time, inner_job))
-                job_thread.cancel()
-            self.should_restart = True
+            logger.warning(f"Cancelling job {job.current_id}, as it is stale: {runtime:.3f}s")
+            advertised_limits.record(None)
+            self.cancel_job(job_thread, start_time, job, "stale")
+
+    def cancel_job(self, job_thread, start_time, job, reason) -> None:
+        """Faults the job back to the Horde and frees its thread at once, leaving the other jobs running"""
+        job.cancel(reason)
+        self.running_jobs.remove((job_thread, start_time, job))
+        if job.backend:
+            backend_pool.release(job.backend)
+        self.cancelled_threads.append(job_thread)
+        self.resize_executor()
+
+    def new_executor(self) -> ThreadPoolExecutor:
+        """An executor with room for the jobs the servers run at once, and up to as many cancelled ones winding
+        down. Its threads only start as jobs are submitted, so the spare room costs nothing until it is used"""
+        self.executor_size = self.thread_limit() + min(self.thread_limit(), MAX_CANCELLED_THREADS)
+        return ThreadPoolExecutor(max_workers=self.executor_size)
+
+    def resize_executor(self) -> None:
+        """Moves new jobs to a new executor once max_threads outgrew this one, or cancelled jobs fill its spare
+        room. The jobs still running in the old one finish there. Only called from the worker's loop"""
+        self.cancelled_threads = [thread for thread in self.cancelled_threads if not thread.done()]
+        self.retired_executors = [
+            (executor, futures)
+            for executor, futures in self.retired_executors
+            if not all(future.done() for future in futures)
+        ]
+        if self.thread_limit() + len(self.cancelled_threads) <= self.executor_size:
             return
+        grown = self.thread_limit() + min(self.thread_limit(), MAX_CANCELLED_THREADS) > self.executor_size
+        if not grown and len(self.retired_executors) >= MAX_RETIRED_EXECUTORS:
+            # Stuck cancelled jobs don't get to pile up threads, new jobs queue until one of them ends
+            return
+        self.executor.shutdown(wait=False)
+        # Running jobs may have been submitted to an earlier executor, waiting on them as well is harmless
+        futures = [future for future, _, _ in self.running_jobs] + self.cancelled_threads
+        self.retired_executors.append((self.executor, [future for future in futures if not future.done()]))
+        self.executor = self.new_executor()
+        # They hold threads of the old executor only
+        self.cancelled_threads = []
 
-        # Check periodically if any interesting stats should be announced
+    def log_stats(self) -> None:
+        """Check periodically if any interesting stats should be announced"""
         if (
-            self.bridge_data.stats_output_frequency
-            and (time.time() - self.last_stats_time) > self.bridge_data.stats_output_frequency
+            not self.bridge_data.stats_output_frequency
+            or (time.time() - self.last_stats_time) <= self.bridge_data.stats_output_frequency
         ):
-            bonus_per_hour = self.get_uptime_kudos()
-            self.last_stats_time = time.time()
-            kph = bridge_stats.stats.get("kudos_per_hour", 0) + bonus_per_hour
-            logger.info(f"Estimated average kudos per hour: {kph}")
+            return
+        bonus_per_hour = self.get_uptime_kudos()
+        self.last_stats_time = time.time()
+        stats = bridge_stats.snapshot()
+        kph = stats.get("kudos_per_hour", 0) + bonus_per_hour
+        logger.info(f"Estimated average kudos per hour: {kph}")
+        if utilization := stats.get("utilization"):
+            logger.info(f"Idle {utilization['idle_share']:.0%} of the time with no job running")
+        if skipped := stats.get("skipped"):
+            max_length, max_context_length = advertised_limits.limits(
+                self.bridge_data.max_length,
+                self.bridge_data.max_context_length,
+            )
+            for advice in capacity_advice(skipped["reasons"], max_length, max_context_length)[:3]:
+                logger.info(f"Over {skipped['empty_pops']} empty pops, {advice}")
+        if admission.held:
+            logger.info(f"New jobs are on hold: {', '.join(admission.held.values())}")
+        if log_queue.running:
+            logger.opt(lazy=True).debug(
+                "Log queue depth {0[depth]}/{0[max_size]}, {0[dropped]} messages dropped",
+                log_queue.stats,
+            )
 
     def get_uptime_kudos(self) -> int:
         """Returns the expected uptime kudos for this worker
@@ -238,8 +399,31 @@ class ScribeWorker:
         # Daemons are fed the configuration externally
         if not self.is_daemon:
             self.bridge_data.reload_data()
+        tracer.configure(
+            self.bridge_data.trace_enabled,
+            self.bridge_data.trace_sample_rate,
+            self.bridge_data.trace_exporter,
+            self.bridge_data.trace_otlp_endpoint,
+        )
+        telemetry.configure(self.bridge_data.telemetry_interval, self.bridge_data.telemetry_provider)
+        self.waiting_jobs.configure(self.bridge_data.queue_policy)
+        self.pop_schedule.configure(self.bridge_data.pop_backoff_max, self.bridge_data.pop_ahead)
+        admission.configure(
+            self.bridge_data.admission_enabled,
+            self.bridge_data.admission_min_free_vram_mb,
+            self.bridge_data.admission_max_temp,
+            self.bridge_data.admission_max_power,
+        )
+        recorder.configure(self.bridge_data.record_traffic, self.bridge_data.record_traffic_path)
+        advertised_limits.configure(
+            self.bridge_data.dynamic_limits,
+            self.bridge_data.max_length,
+            self.bridge_data.max_context_length,
+            self.bridge_data.dynamic_limits_min_length,
+            self.bridge_data.dynamic_limits_min_context,
+        )
 
     def reload_bridge_data(self) -> None:
         self.reload_data()
-        self.executor._max_workers = self.bridge_data.max_threads
+        self.resize_executor()
         self.last_config_reload = time.time()
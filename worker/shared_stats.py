@@ -0,0 +1,170 @@
+"""Worker stats in a memory mapped file, written by the workers of horde_scribe_supervisor.py and read by it
+
+Every worker owns one slot and is the only one writing it. A slot starts with a sequence number which is odd while
+its worker writes, so a reader can tell when it caught a slot half written and read it again. Nothing is locked and
+no messages pass between the processes.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+from worker.admission import admission
+from worker.logger import logger
+from worker.stats import bridge_stats
+
+MAGIC = b"HSST"
+# What every worker publishes, all as doubles
+FIELDS = (
+    "pid",
+    "started",
+    "heartbeat",
+    "jobs",
+    "kudos",
+    "running_jobs",
+    "waiting_jobs",
+    "kudos_per_hour",
+    "jobs_per_hour",
+    "pop_time",
+    "held",
+)
+HEADER = struct.Struct("<4sII")
+SEQUENCE = struct.Struct("<Q")
+VALUES = struct.Struct("<" + "d" * len(FIELDS))
+SLOT_SIZE = SEQUENCE.size + VALUES.size
+
+
+class SharedStats:
+    """A memory mapped file of one stats slot per worker"""
+
+    def __init__(self) -> None:
+        self.path = None
+        self.slots = 0
+        self._file = None
+        self._map = None
+
+    def create(self, path, slots) -> None:
+        """Creates the file with every slot empty, replacing any left over from a previous run"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as statsfile:
+            statsfile.write(HEADER.pack(MAGIC, slots, len(FIELDS)))
+            statsfile.write(bytes(SLOT_SIZE * slots))
+        self.attach(path)
+
+    def attach(self, path) -> None:
+        self.close()
+        self._file = open(path, "r+b")  # noqa: SIM115
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, slots, fields = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or fields != len(FIELDS):
+            self.close()
+            raise ValueError(f"{path} is not a stats file of this version")
+        self.path = path
+        self.slots = slots
+
+    def close(self) -> None:
+        if self._map:
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+
+    def _offset(self, slot) -> int:
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"No stats slot {slot}")
+        return HEADER.size + slot * SLOT_SIZE
+
+    def write(self, slot, values) -> None:
+        """Publishes the values of a slot. Only the slot's owner may call this"""
+        offset = self._offset(slot)
+        (sequence,) = SEQUENCE.unpack_from(self._map, offset)
+        SEQUENCE.pack_into(self._map, offset, sequence + 1)
+        VALUES.pack_into(self._map, offset + SEQUENCE.size, *(float(values.get(field, 0)) for field in FIELDS))
+        SEQUENCE.pack_into(self._map, offset, sequence + 2)
+
+    def clear(self, slot) -> None:
+        self.write(slot, {})
+
+    def read(self, slot) -> dict | None:
+        """The values of a slot, or None while no worker publishes in it"""
+        offset = self._offset(slot)
+        while True:
+            (before,) = SEQUENCE.unpack_from(self._map, offset)
+            if before % 2:
+                time.sleep(0)
+                continue
+            values = VALUES.unpack_from(self._map, offset + SEQUENCE.size)
+            (after,) = SEQUENCE.unpack_from(self._map, offset)
+            if before == after:
+                break
+        stats = dict(zip(FIELDS, values, strict=True))
+        return stats if stats["pid"] else None
+
+    def read_all(self) -> list:
+        return [self.read(slot) for slot in range(self.slots)]
+
+
+def aggregate(slots) -> dict:
+    """The totals over every worker which is publishing"""
+    live = [stats for stats in slots if stats]
+    pop_times = [stats["pop_time"] for stats in live if stats["pop_time"]]
+    totals = {"workers": len(live)}
+    for field in ("jobs", "kudos", "running_jobs", "waiting_jobs", "kudos_per_hour", "jobs_per_hour", "held"):
+        totals[field] = round(sum(stats[field] for stats in live), 2)
+    totals["pop_time"] = round(sum(pop_times) / len(pop_times), 2) if pop_times else 0
+    return totals
+
+
+class StatsPublisher:
+    """Publishes a worker's stats to its slot from a background thread"""
+
+    def __init__(self, shared, slot, worker, interval=1.0) -> None:
+        self.shared = shared
+        self.slot = slot
+        self.worker = worker
+        self.interval = interval
+        self.started = time.time()
+
+    def collect(self) -> dict:
+        stats = bridge_stats.snapshot()
+        inference = stats.get("inference", {}).values()
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "heartbeat": time.time(),
+            "jobs": sum(model["count"] for model in inference),
+            "kudos": sum(model["kudos"] for model in inference),
+            "running_jobs": len(self.worker.running_jobs),
+            "waiting_jobs": len(self.worker.waiting_jobs),
+            "kudos_per_hour": stats.get("kudos_per_hour", 0),
+            "jobs_per_hour": stats.get("jobs_per_hour", 0),
+            "pop_time": stats.get("pop_time_avg_5_mins", 0),
+            "held": bool(admission.held or self.worker.paused),
+        }
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.shared.write(self.slot, self.collect())
+            except Exception as err:
+                logger.debug(f"Failed to publish stats: {err}")
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        threading.Thread(target=self.run, daemon=True).start()
+
+
+def publish_worker_stats(worker, slot) -> None:
+    """Publishes the stats of a worker run by horde_scribe_supervisor.py to the file it named"""
+    path = os.environ.get("HORDE_SHARED_STATS")
+    if not path:
+        return
+    shared = SharedStats()
+    try:
+        shared.attach(path)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Not publishing stats to the supervisor: {err}")
+        return
+    StatsPublisher(shared, slot, worker).start()
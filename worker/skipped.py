@@ -0,0 +1,41 @@
+"""Why the Horde skipped its waiting jobs for us, and what would have matched them"""
+
+# The reasons the Horde reports in the skipped field of an empty pop, with what would have matched those jobs
+SKIP_REASONS = {
+    "max_context_length": "raising max_context_length above {max_context_length}",
+    "max_length": "raising max_length above {max_length}",
+    "models": "serving the models they asked for",
+    "matching_softprompt": "offering the softprompts they asked for",
+    "performance": "generating faster",
+    "untrusted": "being a trusted worker",
+    "worker_id": None,
+    "kudos": None,
+    "nsfw": None,
+    "blacklist": None,
+    "bridge_version": "updating the worker",
+}
+
+
+def skipped_shares(reasons) -> list:
+    """(reason, share) of the skip reasons reported for every reason, most reported first"""
+    total = sum(reasons.values())
+    if not total:
+        return []
+    return sorted(((reason, count / total) for reason, count in reasons.items() if count), key=lambda item: -item[1])
+
+
+def capacity_advice(reasons, max_length, max_context_length) -> list:
+    """One line per reason the Horde skipped jobs for, saying what would address it where we can act on it
+
+    The Horde counts every job again on every pop which skipped it, so the shares are of the skip reasons
+    reported over all empty pops, not of distinct jobs.
+    """
+    advice = []
+    for reason, share in skipped_shares(reasons):
+        action = SKIP_REASONS.get(reason)
+        if action:
+            action = action.format(max_length=max_length, max_context_length=max_context_length)
+            advice.append(f"{reason} accounted for {share:.0%} of skip reasons reported, try {action}")
+        else:
+            advice.append(f"{reason} accounted for {share:.0%} of skip reasons reported")
+    return advice
@@ -1,6 +1,7 @@
 """Bridge Stats Tracker"""
 
 # import json
+import copy
 import threading
 import time
 from collections import deque
@@ -14,6 +15,7 @@ class BridgeStats:
     def __init__(self) -> None:
         self.kudos_record = deque()
         self.pop_record = deque()
+        self.gpu_record = deque()
         # We are called from diverse thread contexts
         self._mutex = threading.Lock()
 
@@ -21,8 +23,14 @@ class BridgeStats:
         with self._mutex:
             self.kudos_record = deque()
             self.pop_record = deque()
+            self.gpu_record = deque()
             BridgeStats.stats = {}
 
+    def snapshot(self) -> dict:
+        """A copy of the stats which is safe to read from another thread"""
+        with self._mutex:
+            return copy.deepcopy(self.stats)
+
     def update_pop_stats(self, node, pop_time) -> None:
         with self._mutex:
             self.pop_record.append((node, pop_time, time.time()))
@@ -80,6 +88,76 @@ class BridgeStats:
                 self.stats["jobs_per_hour"] = round(jobs_per_hour)
                 self.stats["avg_kudos_per_job"] = round(total_kudos / jobs_per_hour, 1)
 
+    def update_gpu_stats(self, kudos, gpu_seconds) -> None:
+        """Records the kudos a job earned for the seconds it kept the backend generating"""
+        with self._mutex:
+            now = time.time()
+            self.gpu_record.append((kudos, gpu_seconds, now))
+            # only keep the last hour
+            while self.gpu_record and self.gpu_record[0][2] < now - 3600:
+                self.gpu_record.popleft()
+            seconds = sum(record[1] for record in self.gpu_record)
+            if seconds:
+                self.stats["kudos_per_gpu_second"] = round(sum(record[0] for record in self.gpu_record) / seconds, 3)
+
+    def kudos_per_gpu_second(self, since) -> float | None:
+        """Kudos per second of generation for the jobs submitted since then, None without any"""
+        with self._mutex:
+            recent = [record for record in self.gpu_record if record[2] >= since]
+        seconds = sum(record[1] for record in recent)
+        return sum(record[0] for record in recent) / seconds if seconds else None
+
+    def update_limit_stats(self, max_length, max_context_length, reason) -> None:
+        """Records the limits advertised to the Horde and why they last changed"""
+        with self._mutex:
+            stats = self.stats.setdefault("advertised_limits", {"changes": 0})
+            stats["max_length"] = max_length
+            stats["max_context_length"] = max_context_length
+            stats["reason"] = reason
+            stats["changes"] += 1
+
+    def update_skipped_stats(self, skipped) -> None:
+        """Adds up why the Horde skipped its waiting jobs for us, from a pop which returned none"""
+        with self._mutex:
+            stats = self.stats.setdefault("skipped", {"empty_pops": 0, "reasons": {}})
+            stats["empty_pops"] += 1
+            for reason, count in skipped.items():
+                if isinstance(count, int | float):
+                    stats["reasons"][reason] = stats["reasons"].get(reason, 0) + count
+
+    def update_utilization_stats(self, seconds, idle) -> None:
+        """Adds seconds the worker spent with no job running, or busy with at least one"""
+        with self._mutex:
+            stats = self.stats.setdefault("utilization", {"idle_seconds": 0.0, "busy_seconds": 0.0, "idle_share": 0})
+            stats["idle_seconds" if idle else "busy_seconds"] += seconds
+            total = stats["idle_seconds"] + stats["busy_seconds"]
+            if total:
+                stats["idle_share"] = round(stats["idle_seconds"] / total, 3)
+
+    def update_queue_stats(self, expired=0, saved=0, popped_ahead=0) -> None:
+        """Counts queued jobs returned to the Horde as they could no longer meet their deadline, jobs the queue
+        policy started in time where arrival order would have made them miss it, and jobs popped ahead of a thread
+        freeing up"""
+        with self._mutex:
+            stats = self.stats.setdefault("queue", {"expired": 0, "expirations_avoided": 0, "popped_ahead": 0})
+            stats["expired"] += expired
+            stats["expirations_avoided"] += saved
+            stats["popped_ahead"] += popped_ahead
+
+    def update_admission_stats(self, reasons=None, new_holds=(), held_seconds=0.0) -> None:
+        """Records which limits are holding back new jobs, reasons is None once they are released"""
+        with self._mutex:
+            stats = self.stats.setdefault(
+                "admission",
+                {"held": False, "reasons": None, "holds": {}, "held_seconds": 0},
+            )
+            stats["held"] = reasons is not None
+            stats["reasons"] = reasons
+            # How often each limit started holding jobs back
+            for limit in new_holds:
+                stats["holds"][limit] = stats["holds"].get(limit, 0) + 1
+            stats["held_seconds"] = round(stats["held_seconds"] + held_seconds, 1)
+
     # def get_pretty_stats(self):
     #     """Returns a pretty string of the stats"""
     #     with self._mutex:
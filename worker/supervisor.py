@@ -0,0 +1,170 @@
+"""Runs one bridge process per entry of the workers list in bridgeData.yaml and restarts those which exit"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from worker.consts import LOG_DIR
+from worker.control import ControlServer
+from worker.logger import logger
+from worker.shared_stats import SharedStats, aggregate
+
+BRIDGE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "horde_scribe_bridge.py")
+STATS_FILE = f"{LOG_DIR}/supervisor_stats.bin"
+# A worker which exits is restarted after this many seconds, doubled for every exit in a row up to MAX_BACKOFF
+RESTART_BACKOFF = 5
+MAX_BACKOFF = 300
+# Workers which ran this long before they exited are restarted without waiting
+STABLE_SECONDS = 300
+# Seconds the workers get to finish their jobs once the supervisor stops
+STOP_TIMEOUT = 120
+
+
+class WorkerProcess:
+    """One supervised worker, its process and its restarts"""
+
+    def __init__(self, index, entry) -> None:
+        self.index = index
+        self.entry = entry
+        self.name = entry.get("worker_name", f"worker{index}")
+        self.gpu = entry.get("gpu")
+        self.log_dir = os.path.join(LOG_DIR, f"worker{index}")
+        self.process = None
+        self.started = 0
+        self.failures = 0
+        self.restarts = 0
+        self.due = 0
+
+    def start(self, argv, stats_path) -> None:
+        env = {**os.environ, "HORDE_LOG_DIR": self.log_dir, "HORDE_SHARED_STATS": os.path.abspath(stats_path)}
+        if self.gpu is not None:
+            env["CUDA_VISIBLE_DEVICES"] = str(self.gpu)
+        command = [sys.executable, BRIDGE_SCRIPT, *argv, "--supervised", str(self.index), "--disable_ui"]
+        # In their own session, so Ctrl+C reaches only the supervisor which then stops the workers in turn
+        self.process = subprocess.Popen(command, env=env, start_new_session=os.name != "nt")
+        self.started = time.time()
+        logger.info(f"Started worker {self.name} (pid {self.process.pid}, GPU {self.gpu}, logs in {self.log_dir})")
+
+    def exited(self, now) -> int | None:
+        """The exit code once the process ended, scheduling its restart"""
+        code = self.process.poll()
+        if code is None:
+            return None
+        self.process = None
+        if now - self.started >= STABLE_SECONDS:
+            self.failures = 0
+        self.failures += 1
+        self.due = now + min(RESTART_BACKOFF * 2 ** (self.failures - 1), MAX_BACKOFF)
+        return code
+
+    def interrupt(self) -> None:
+        """Asks the worker to finish its jobs and stop, as Ctrl+C would"""
+        if not self.process:
+            return
+        if os.name == "nt":
+            self.process.terminate()
+        else:
+            self.process.send_signal(signal.SIGINT)
+
+
+class SupervisorControl(ControlServer):
+    """Serves GET /status with the stats of every worker. Settings are changed on a worker's own control_port"""
+
+    def status(self) -> dict:
+        return self.worker.status()
+
+    def apply(self, changes) -> dict:
+        return {key: "not supported by the supervisor, set control_port in the worker's entry" for key in changes}
+
+
+class Supervisor:
+    def __init__(self, bridge_data, argv) -> None:
+        self.bridge_data = bridge_data
+        # The command line is passed on to every worker
+        self.argv = argv
+        self.workers = [WorkerProcess(index, entry) for index, entry in enumerate(bridge_data.workers)]
+        self.shared = SharedStats()
+        self.shutdown_event = threading.Event()
+        self.control = None
+        self.last_stats_time = time.time()
+
+    def check(self, worker, now) -> None:
+        if worker.process:
+            code = worker.exited(now)
+            if code is None:
+                return
+            self.shared.clear(worker.index)
+            logger.warning(
+                f"Worker {worker.name} exited with code {code}, restarting it in {worker.due - now:.0f} seconds",
+            )
+        if now >= worker.due:
+            if worker.started:
+                worker.restarts += 1
+            worker.start(self.argv, self.shared.path)
+
+    def status(self) -> dict:
+        slots = self.shared.read_all()
+        now = time.time()
+        return {
+            "total": aggregate(slots),
+            "workers": [
+                {
+                    "name": worker.name,
+                    "gpu": worker.gpu,
+                    "pid": worker.process.pid if worker.process else None,
+                    "running": worker.process is not None,
+                    "restarts": worker.restarts,
+                    "stats": stats,
+                    "stats_age": round(now - stats["heartbeat"], 1) if stats else None,
+                }
+                for worker, stats in zip(self.workers, slots, strict=True)
+            ],
+        }
+
+    def log_stats(self) -> None:
+        totals = aggregate(self.shared.read_all())
+        running = sum(1 for worker in self.workers if worker.process)
+        logger.info(
+            f"{running}/{len(self.workers)} workers running {totals['running_jobs']:.0f} jobs. "
+            f"{totals['jobs']:.0f} jobs done, {totals['kudos_per_hour']:.0f} kudos and "
+            f"{totals['jobs_per_hour']:.0f} jobs per hour, average pop time {totals['pop_time']}s",
+        )
+
+    def run(self) -> None:
+        self.shared.create(STATS_FILE, len(self.workers))
+        if self.bridge_data.control_port:
+            self.control = SupervisorControl(self, self.bridge_data.control_port)
+            self.control.start()
+        logger.info(f"Supervising {len(self.workers)} workers")
+        while not self.shutdown_event.is_set():
+            now = time.time()
+            for worker in self.workers:
+                self.check(worker, now)
+            frequency = self.bridge_data.stats_output_frequency
+            if frequency and now - self.last_stats_time > frequency:
+                self.last_stats_time = now
+                self.log_stats()
+            self.shutdown_event.wait(1)
+
+    def stop(self) -> None:
+        """Stops every worker, giving them STOP_TIMEOUT seconds to finish their jobs"""
+        self.shutdown_event.set()
+        if self.control:
+            self.control.stop()
+        for worker in self.workers:
+            worker.interrupt()
+        deadline = time.time() + STOP_TIMEOUT
+        for worker in self.workers:
+            if not worker.process:
+                continue
+            try:
+                worker.process.wait(max(0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {worker.name} did not stop in time, killing it")
+                worker.process.kill()
+                worker.process.wait()
+        self.shared.close()
+        logger.info("All workers stopped")
@@ -0,0 +1,245 @@
+"""Background sampling of CPU, RAM and GPU telemetry, published as one snapshot for every consumer"""
+
+import contextlib
+import math
+import os
+import threading
+import time
+
+import psutil
+import pynvml
+
+from worker.logger import logger
+
+# Running averages cover this many seconds of samples
+AVERAGE_WINDOW = 300
+
+
+class RingBuffer:
+    """Fixed size sample history with an O(1) running average"""
+
+    __slots__ = ("values", "index", "count", "total")
+
+    def __init__(self, size) -> None:
+        self.values = [0.0] * max(1, size)
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def append(self, value) -> None:
+        if self.count == len(self.values):
+            self.total -= self.values[self.index]
+        else:
+            self.count += 1
+        self.values[self.index] = value
+        self.total += value
+        self.index = (self.index + 1) % len(self.values)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def history(self) -> list:
+        """Samples from oldest to newest"""
+        if self.count < len(self.values):
+            return self.values[: self.count]
+        return self.values[self.index :] + self.values[: self.index]
+
+
+def visible_devices():
+    """The GPUs named by CUDA_VISIBLE_DEVICES, as NVML indexes or GPU/MIG UUIDs, or None for all of them"""
+    devices = os.getenv("CUDA_VISIBLE_DEVICES")
+    if devices is None:
+        return None
+    visible = []
+    for device in devices.split(","):
+        device = device.strip()
+        if device.isdigit():
+            visible.append(int(device))
+        elif device.startswith(("GPU-", "MIG-")):
+            visible.append(device)
+        elif device:
+            # CUDA ignores every device from the first one it can't parse, e.g. -1 hides them all
+            break
+    return visible
+
+
+class NvmlProvider:
+    """Reads only the counters we show through NVML device handles, static properties are read once"""
+
+    def __init__(self) -> None:
+        pynvml.nvmlInit()
+        self.handles = self.visible_handles()
+        self.static = [self._static(handle) for handle in self.handles]
+
+    @staticmethod
+    def visible_handles() -> list:
+        """Handles of the GPUs CUDA_VISIBLE_DEVICES names, or of every GPU when one of them can't be found"""
+        devices = visible_devices()
+        if devices is not None:
+            handles = []
+            for device in devices:
+                try:
+                    if isinstance(device, int):
+                        handles.append(pynvml.nvmlDeviceGetHandleByIndex(device))
+                    else:
+                        handles.append(pynvml.nvmlDeviceGetHandleByUUID(device.encode()))
+                except pynvml.NVMLError as err:
+                    logger.warning(
+                        f"GPU {device} in CUDA_VISIBLE_DEVICES not found ({err}), reading telemetry from every GPU",
+                    )
+                    break
+            else:
+                return handles
+        return [pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(pynvml.nvmlDeviceGetCount())]
+
+    @staticmethod
+    def _read(function, *args: object, default=None) -> object:
+        # Not every counter is supported on every GPU
+        try:
+            return function(*args)
+        except pynvml.NVMLError:
+            return default
+
+    def _static(self, handle) -> dict:
+        name = self._read(pynvml.nvmlDeviceGetName, handle, default="unknown")
+        memory = self._read(pynvml.nvmlDeviceGetMemoryInfo, handle)
+        return {
+            "product": name.decode() if isinstance(name, bytes) else name,
+            "pci_gen": self._read(pynvml.nvmlDeviceGetCurrPcieLinkGeneration, handle, default="?"),
+            "pci_width": self._read(pynvml.nvmlDeviceGetCurrPcieLinkWidth, handle, default="?"),
+            "vram_total_mb": memory.total // 1048576 if memory else 0,
+        }
+
+    def sample(self) -> list:
+        samples = []
+        for handle in self.handles:
+            memory = self._read(pynvml.nvmlDeviceGetMemoryInfo, handle)
+            utilization = self._read(pynvml.nvmlDeviceGetUtilizationRates, handle)
+            temperature = self._read(pynvml.nvmlDeviceGetTemperature, handle, pynvml.NVML_TEMPERATURE_GPU, default=0)
+            samples.append(
+                {
+                    "load": utilization.gpu if utilization else 0,
+                    "temp": temperature,
+                    "power": self._read(pynvml.nvmlDeviceGetPowerUsage, handle, default=0) // 1000,
+                    "fan_speed": self._read(pynvml.nvmlDeviceGetFanSpeed, handle, default=0),
+                    "vram_used_mb": memory.used // 1048576 if memory else 0,
+                    "vram_free_mb": memory.free // 1048576 if memory else 0,
+                },
+            )
+        return samples
+
+
+class FakeGpuProvider:
+    """Stands in for NVML on machines without a GPU. Tests and benchmarks change its readings with set()"""
+
+    def __init__(self, num_gpus=1, product="Fake GPU", vram_total_mb=24576) -> None:
+        self.static = [
+            {"product": product, "pci_gen": 4, "pci_width": 16, "vram_total_mb": vram_total_mb}
+            for _ in range(num_gpus)
+        ]
+        self.readings = [
+            {"load": 0, "temp": 40, "power": 30, "fan_speed": 30, "vram_used_mb": 0, "vram_free_mb": vram_total_mb}
+            for _ in range(num_gpus)
+        ]
+
+    def set(self, device=0, **readings: object) -> None:
+        self.readings[device] = {**self.readings[device], **readings}
+
+    def sample(self) -> list:
+        return [dict(readings) for readings in self.readings]
+
+
+class TelemetrySampler:
+    """Samples telemetry on a background thread at a fixed cadence
+
+    Consumers read the latest `snapshot`, a dict replaced whole on every sample, so reading it costs nothing.
+    """
+
+    def __init__(self) -> None:
+        self.interval = 0.5
+        self.provider = None
+        self.provider_name = None
+        self.snapshot = {"time": 0, "cpu": 0, "avg_cpu": 0, "ram_free_mb": 0, "ram_free_percent": 0, "gpus": []}
+        self.samples = 0
+        self._cpu = None
+        self._gpu_history = []
+        self._thread = None
+        self._mutex = threading.Lock()
+
+    def configure(self, interval=0.5, provider="nvml") -> None:
+        """(Re)configure the sampler from the bridge configuration and start it"""
+        with self._mutex:
+            if provider != self.provider_name:
+                self.provider_name = provider
+                self.provider = self.create_provider(provider)
+                self._gpu_history = []
+            if float(interval) != self.interval or self._cpu is None:
+                self.interval = float(interval)
+                self._cpu = self.new_history()
+                self._gpu_history = []
+            if not self._thread:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+
+    def use_provider(self, provider) -> None:
+        """Samples from the given provider object from now on, e.g. a FakeGpuProvider"""
+        with self._mutex:
+            self.provider = provider
+            self.provider_name = type(provider).__name__
+            self._gpu_history = []
+
+    @staticmethod
+    def create_provider(name) -> "NvmlProvider | FakeGpuProvider | None":
+        if name == "fake":
+            return FakeGpuProvider()
+        try:
+            return NvmlProvider()
+        except Exception as err:
+            logger.debug(f"GPU telemetry unavailable: {err}")
+            return None
+
+    def new_history(self) -> RingBuffer:
+        return RingBuffer(math.ceil(AVERAGE_WINDOW / self.interval))
+
+    def sample(self) -> dict:
+        with self._mutex:
+            if self._cpu is None:
+                self._cpu = self.new_history()
+            cpu = psutil.cpu_percent()
+            memory = psutil.virtual_memory()
+            self._cpu.append(cpu)
+            gpus = []
+            if self.provider:
+                for device, readings in enumerate(self.provider.sample()):
+                    if device >= len(self._gpu_history):
+                        self._gpu_history.append({key: self.new_history() for key in ("load", "temp", "power")})
+                    history = self._gpu_history[device]
+                    for key, ring in history.items():
+                        ring.append(readings[key])
+                    gpus.append(
+                        {
+                            **self.provider.static[device],
+                            **readings,
+                            **{f"avg_{key}": round(ring.average) for key, ring in history.items()},
+                        },
+                    )
+            self.snapshot = {
+                "time": time.time(),
+                "cpu": cpu,
+                "avg_cpu": round(self._cpu.average),
+                "ram_free_mb": memory.available // 1048576,
+                "ram_free_percent": round(100 - memory.percent),
+                "gpus": gpus,
+            }
+            self.samples += 1
+            return self.snapshot
+
+    def run(self) -> None:
+        while True:
+            with contextlib.suppress(Exception):
+                self.sample()
+            time.sleep(self.interval)
+
+
+telemetry = TelemetrySampler()
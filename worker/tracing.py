@@ -0,0 +1,294 @@
+"""Per-job phase tracing with batched local span exporters"""
+
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+import requests
+
+from worker.consts import LOG_DIR
+from worker.logger import logger
+
+SERVICE_NAME = "horde-scribe-worker"
+
+
+class Span:
+    """A timed phase of a job. Use as a context manager or call end() explicitly"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "start", "end_time", "attributes", "status")
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, start=None, attributes=None) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = start if start is not None else time.time()
+        self.end_time = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+
+    def set_attribute(self, key, value) -> None:
+        self.attributes[key] = value
+
+    def set_trace_id(self, trace_id) -> None:
+        """Spans opened before a job id is known (e.g. the pop) can be attached to the job trace later"""
+        self.trace_id = trace_id
+
+    def set_error(self, message) -> None:
+        self.status = "error"
+        self.attributes["error"] = message
+
+    def end(self, end_time=None) -> None:
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        self.tracer.finish(self)
+
+    def child(self, name, start=None, **attributes: object):
+        """Open a span nested under this one, inheriting its attributes"""
+        return self.tracer.start_span(
+            name,
+            self.trace_id,
+            parent=self,
+            start=start,
+            **{**self.attributes, **attributes},
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end_time,
+            "duration": round(self.end_time - self.start, 6),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        if exc_type is not None:
+            self.set_error(f"{exc_type.__name__}: {exc_value}")
+        self.end()
+
+
+class NoopSpan:
+    """Returned when tracing is disabled so instrumented code needs no conditionals"""
+
+    __slots__ = ()
+
+    trace_id = None
+    span_id = None
+    attributes = {}
+
+    def set_attribute(self, key, value) -> None:
+        pass
+
+    def set_trace_id(self, trace_id) -> None:
+        pass
+
+    def set_error(self, message) -> None:
+        pass
+
+    def end(self, end_time=None) -> None:
+        pass
+
+    def child(self, name, start=None, **attributes: object):
+        return self
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class JsonlSpanExporter:
+    """Appends span batches to a JSONL file, rotating it once it grows past max_bytes"""
+
+    def __init__(self, path=f"{LOG_DIR}/spans.jsonl", max_bytes=50 * 1024 * 1024, backups=5) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    def rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def export(self, spans) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self.rotate()
+        with open(self.path, "a", encoding="utf-8") as outfile:
+            outfile.write("".join(json.dumps(span, separators=(",", ":")) + "\n" for span in spans))
+
+
+class OtlpSpanExporter:
+    """Sends span batches to a local OpenTelemetry collector using OTLP/HTTP JSON"""
+
+    def __init__(self, endpoint="http://localhost:4318/v1/traces") -> None:
+        self.endpoint = endpoint
+        self.session = requests.Session()
+
+    @staticmethod
+    def _attribute(key, value) -> dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _otlp_span(self, span) -> dict:
+        otlp_span = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(span["start"] * 1e9)),
+            "endTimeUnixNano": str(int(span["end"] * 1e9)),
+            "attributes": [self._attribute(key, value) for key, value in span["attributes"].items()],
+            "status": {"code": 2 if span["status"] == "error" else 1},
+        }
+        if span["parent_id"]:
+            otlp_span["parentSpanId"] = span["parent_id"]
+        return otlp_span
+
+    def export(self, spans) -> None:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [self._attribute("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._otlp_span(span) for span in spans],
+                        },
+                    ],
+                },
+            ],
+        }
+        self.session.post(self.endpoint, json=payload, timeout=5)
+
+
+class Tracer:
+    """Collects finished spans and hands them to the exporter in batches from a background thread"""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.exporter = None
+        # (exporter, otlp_endpoint, path) the exporter was created with
+        self.exporter_settings = None
+        self.batch_size = 256
+        self.flush_interval = 5
+        self.max_buffer = 10000
+        self.dropped_spans = 0
+        self._buffer = []
+        self._mutex = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_thread = None
+
+    def configure(self, enabled, sample_rate=1.0, exporter="jsonl", otlp_endpoint=None, path=None) -> None:
+        """(Re)configure the tracer from the bridge configuration"""
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if not enabled:
+            self.enabled = False
+            return
+        settings = (exporter, otlp_endpoint, path)
+        if self.enabled and self.exporter is not None and settings == self.exporter_settings:
+            return
+        if self.exporter is not None:
+            # The spans buffered so far go where they were meant to go
+            self.flush()
+        if exporter == "otlp":
+            self.exporter = OtlpSpanExporter(otlp_endpoint) if otlp_endpoint else OtlpSpanExporter()
+        else:
+            self.exporter = JsonlSpanExporter(path) if path else JsonlSpanExporter()
+        self.exporter_settings = settings
+        self.enabled = True
+        if not self._flush_thread:
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+        logger.debug(f"Tracing enabled with {exporter} exporter at sample rate {self.sample_rate}")
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def job_trace_id(job_id) -> str:
+        """Horde job ids are UUIDs, which conveniently fit the 16 byte trace id format"""
+        try:
+            return uuid.UUID(str(job_id)).hex
+        except ValueError:
+            return uuid.uuid5(uuid.NAMESPACE_OID, str(job_id)).hex
+
+    def is_sampled(self, trace_id) -> bool:
+        """Sampling is decided by trace id, so a job's spans are all kept or all dropped"""
+        if self.sample_rate >= 1:
+            return True
+        return (zlib.crc32(trace_id.encode()) % 10000) < self.sample_rate * 10000
+
+    def start_span(self, name, trace_id=None, parent=None, start=None, **attributes: object):
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is not None:
+            trace_id = parent.trace_id
+        return Span(
+            self,
+            name,
+            trace_id or self.new_trace_id(),
+            parent.span_id if parent is not None else None,
+            start,
+            attributes,
+        )
+
+    def finish(self, span) -> None:
+        if not self.enabled or not self.is_sampled(span.trace_id):
+            return
+        with self._mutex:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped_spans += 1
+                return
+            self._buffer.append(span.to_dict())
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self) -> None:
+        with self._mutex:
+            spans, self._buffer = self._buffer, []
+        if not spans or self.exporter is None:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as err:
+            logger.debug(f"Failed to export {len(spans)} spans: {err}")
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def shutdown(self) -> None:
+        if self.enabled:
+            self.flush()
+
+
+tracer = Tracer()
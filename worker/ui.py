@@ -7,18 +7,16 @@ import os
 import re
 import sys
 import textwrap
-import threading
 import time
 from collections import deque
 from math import trunc
-from urllib import parse
-
-import psutil
-import requests
 
 from worker.consts import RELEASE_VERSION
-from worker.logger import config, logger
+from worker.horde_status import horde_status
+from worker.logger import config, is_not_repeated_log, logger
+from worker.skipped import skipped_shares
 from worker.stats import bridge_stats
+from worker.telemetry import telemetry
 from worker.utils.gpuinfo import GPUInfo
 
 
@@ -45,14 +43,44 @@ class DequeOutputCollector:
         pass
 
 
+class LogRecordCollector:
+    """Loguru sink which keeps the records themselves, so the UI never parses formatted log lines"""
+
+    def __init__(self) -> None:
+        self.deque = deque()
+
+    def write(self, message) -> None:
+        self.deque.append(message.record)
+
+
+class LogEntry:
+    """A log record as shown in the log pane, with its message wrapped for the last width it was shown at"""
+
+    __slots__ = ("level", "timestamp", "source", "message", "wrap_width", "lines")
+
+    def __init__(self, level, timestamp, source, message) -> None:
+        self.level = level
+        self.timestamp = timestamp
+        self.source = source
+        self.message = message
+        self.wrap_width = None
+        self.lines = None
+
+    def wrap(self, width):
+        if width != self.wrap_width:
+            self.wrap_width = width
+            self.lines = textwrap.wrap(self.message, width)
+        return self.lines
+
+
 class TerminalUI:
-    LOGURU_REGEX = re.compile(
-        r"(\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d).*\| "
-        r"(INIT_OK|INIT_ERR|INIT_WARN|INIT|DEBUG|INFO|WARNING|ERROR).*\| (.*) - (.*)$",
-    )
-    KUDOS_REGEX = re.compile(r".*average kudos per hour: (\d+)")
+    LOG_LEVELS = {"INIT_OK", "INIT_ERR", "INIT_WARN", "INIT", "DEBUG", "INFO", "WARNING", "ERROR"}
+    LOG_PREFIXES = {"INIT_OK": "OK: ", "INIT_WARN": "Warning: ", "INIT_ERR": "Error: "}
+    # Log entries kept for laying the pane out again after a resize or toggle
+    LOG_HISTORY = 1000
+    KUDOS_REGEX = re.compile(r"average kudos per hour: (\d+)")
     JOBDONE_REGEX = re.compile(
-        r".*(Generation for id.*finished successfully|Finished interrogation.*)",
+        r"(Generation for id.*finished successfully|Finished interrogation.*)",
     )
 
     ART = {
@@ -67,11 +95,6 @@ class TerminalUI:
         "progress": "▓",
     }
 
-    # Refresh interval in seconds to call API for remote worker stats
-    REMOTE_STATS_REFRESH = 5
-    # Refresh interval in seconds for API calls to get overall ai horde stats
-    REMOTE_HORDE_STATS_REFRESH = 30
-
     COLOUR_RED = 1
     COLOUR_GREEN = 2
     COLOUR_YELLOW = 3
@@ -80,7 +103,13 @@ class TerminalUI:
     COLOUR_CYAN = 6
     COLOUR_WHITE = 7
 
-    DELIM = "::::"
+    LOG_COLOURS = {
+        "ERROR": COLOUR_RED,
+        "INIT_OK": COLOUR_GREEN,
+        "INIT_WARN": COLOUR_YELLOW,
+        "INIT_ERR": COLOUR_RED,
+        "WARNING": COLOUR_YELLOW,
+    }
 
     # Number of seconds between audio alerts
     ALERT_INTERVAL = 5
@@ -90,8 +119,7 @@ class TerminalUI:
         "Result = True",
         "Try again with a different prompt and/or seed.",
     ]
-
-    CLIENT_AGENT = f"AI Horde Worker:{RELEASE_VERSION}:https://github.com/TeaSitta/AI-Horde-Worker"
+    JUNK_REGEX = re.compile("|".join(re.escape(junk) for junk in JUNK), re.IGNORECASE)
 
     def __init__(self, bridge_data, shutdown_event) -> None:
         self.shutdown_event = shutdown_event
@@ -101,10 +129,23 @@ class TerminalUI:
             self.url = self.bridge_data.horde_url
         elif hasattr(self.bridge_data, "kai_url"):
             self.url = self.bridge_data.kai_url
-        self._worker_info_thread = None
-        self._horde_stats_thread = None
-        self._worker_model_info_thread = None
         self.main = None
+        self.log_win = None
+        # Retained frame state, what is on screen now so only changes are drawn
+        # log_rows is the number of rows used in the log pane
+        self.layout = None
+        self.fields = {}
+        self.log_rows = 0
+        self.last_log_timestamp = ""
+        self.log_entries = deque(maxlen=TerminalUI.LOG_HISTORY)
+        self.new_log_entries = []
+        self.log_layout = None
+        self.frames = 0
+        self.frame_time = 0
+        self.total_frame_time = 0
+        # UTF-8 bytes of the text handed to addstr, not what curses sends to the terminal after its diffing
+        self.text_bytes_drawn = 0
+        self.frame_text_bytes = 0
         self.width = 0
         self.height = 0
         self.status_height = 17
@@ -112,17 +153,12 @@ class TerminalUI:
         self.show_debug = False
         self.last_key = None
         self.pause_log = False
-        self.input = DequeOutputCollector()
-        self.output = DequeOutputCollector()
-        self.worker_id = None
-        threading.Thread(target=self.load_worker_id, daemon=True).start()
-        self.last_stats_refresh = time.time() - (TerminalUI.REMOTE_STATS_REFRESH - 3)
-        self.last_horde_stats_refresh = time.time() - (TerminalUI.REMOTE_HORDE_STATS_REFRESH - 3)
+        self.input = LogRecordCollector()
+        horde_status.start(self.url, self.bridge_data.api_key, self.worker_name)
         self.maintenance_mode = False
         self.gpu = GPUInfo()
         self.gpu.samples_per_second = 5
         self.commit_hash = self.get_commit_hash()
-        self.cpu_average = []
         self.audio_alerts = False
         self.last_audio_alert = 0
         self.stdout = DequeOutputCollector()
@@ -137,12 +173,12 @@ class TerminalUI:
         sys.stdout = self.stdout
         # Remove all loguru sinks
         logger.remove()
-        handlers = [sink for sink in config["handlers"] if isinstance(sink["sink"], str)]
+        handlers = [sink for sink in config["handlers"] if sink["sink"] not in (self._bck_stdout, self._bck_stderr)]
         # Re-initialise loguru
         newconfig = {"handlers": handlers}
         logger.configure(**newconfig)
         # Add our own handler
-        logger.add(self.input, level="DEBUG")
+        logger.add(self.input, level="DEBUG", format="{message}", filter=is_not_repeated_log)
         locale.setlocale(locale.LC_ALL, "")
         self.initialise_main_window()
         self.resize()
@@ -150,38 +186,30 @@ class TerminalUI:
     def load_log(self) -> None:
         self.load_log_queue()
 
-    def parse_log_line(self, line):
-        if regex := TerminalUI.LOGURU_REGEX.match(line):
-            if not self.show_debug and regex.group(2) == "DEBUG":
-                return None
-            if regex.group(2) == "ERROR":
-                self.error_count += 1
-            elif regex.group(2) == "WARNING":
-                self.warning_count += 1
-            return f"{regex.group(2)}::::{regex.group(1)}::::{regex.group(3)}::::{regex.group(4)}"
-        return None
-
     def load_log_queue(self) -> None:
-        lines = list(self.input.deque)
-        self.input.deque.clear()
-        for line in lines:
-            ignore = False
-            for skip in TerminalUI.JUNK:
-                if skip.lower() in line.lower():
-                    ignore = True
-            if ignore:
-                continue
-            log_line = self.parse_log_line(line)
-            if not log_line:
+        while self.input.deque:
+            record = self.input.deque.popleft()
+            level = record["level"].name
+            message = record["message"]
+            if level not in TerminalUI.LOG_LEVELS or TerminalUI.JUNK_REGEX.search(message):
                 continue
-            self.output.write(log_line)
-            if regex := TerminalUI.KUDOS_REGEX.match(line):
+            if level == "ERROR":
+                self.error_count += 1
+            elif level == "WARNING":
+                self.warning_count += 1
+            entry = LogEntry(
+                level,
+                record["time"].strftime("%Y-%m-%d %H:%M:%S"),
+                f"{record['name']}:{record['function']}:{record['line']}",
+                f"{TerminalUI.LOG_PREFIXES.get(level, '')}{message}",
+            )
+            self.log_entries.append(entry)
+            self.new_log_entries.append(entry)
+            if regex := TerminalUI.KUDOS_REGEX.search(message):
                 self.kudos_per_hour = int(regex.group(1))
-            if regex := TerminalUI.JOBDONE_REGEX.match(line):
+            if regex := TerminalUI.JOBDONE_REGEX.search(message):
                 self.jobs_done += 1
 
-        self.output.set_size(self.height)
-
     def initialise_main_window(self) -> None:
         # getch doesn't block
         self.main.nodelay(True)
@@ -202,6 +230,8 @@ class TerminalUI:
         curses.update_lines_cols()
         # Determine terminal size
         self.height, self.width = self.main.getmaxyx()
+        # Everything is drawn again on the next frame
+        self.layout = None
 
     def print(self, win, y, x, text, colour=None) -> None:
         # Ensure we're going to fit
@@ -211,12 +241,24 @@ class TerminalUI:
         # Always highlight certain text
         if text == "Pending":
             colour = curses.color_pair(TerminalUI.COLOUR_YELLOW)
+        self.frame_text_bytes += len(text.encode("utf-8"))
         with contextlib.suppress(curses.error):
             if not colour:
                 win.addstr(y, x, text)
             else:
                 win.addstr(y, x, text, colour)
 
+    def print_field(self, y, x, text, colour=None) -> None:
+        """Prints a status value only when it differs from the last frame"""
+        previous = self.fields.get((y, x))
+        if previous == (text, colour):
+            return
+        self.fields[(y, x)] = (text, colour)
+        # Blank out the rest of a longer previous value
+        if previous and len(previous[0]) > len(text):
+            text = text.ljust(len(previous[0]))
+        self.print(self.main, y, x, text, colour)
+
     def draw_line(self, win, y, label) -> None:
         height, width = win.getmaxyx()
         self.print(
@@ -298,74 +340,56 @@ class TerminalUI:
         self.model_queue = "Pending"
         self.model_eta = "Pending"
         self.model_threads = "Pending"
+        self.idle = "Pending"
+        self.most_skipped = "Pending"
+        # The Horde data last shown, so it is only picked up again once the status poller replaces it
+        self.remote_data = (None, None, None)
         self.error_count = 0
         self.warning_count = 0
 
     def print_switch(self, y, x, label, switch):
         colour = curses.color_pair(TerminalUI.COLOUR_CYAN) if switch else curses.color_pair(TerminalUI.COLOUR_WHITE)
-        self.print(self.main, y, x, label, colour)
+        self.print_field(y, x, label, colour)
         return x + len(label) + 2
 
     def get_free_ram(self) -> str:
-        mem = psutil.virtual_memory().available
-        percent = 100 - trunc(psutil.virtual_memory().percent)
-        mem /= 1048576
+        snapshot = telemetry.snapshot
+        mem = snapshot["ram_free_mb"]
         unit = "MB"
         if mem >= 1024:
             mem /= 1024
             unit = "GB"
         mem = trunc(mem)
-        return f"{mem} {unit} ({percent}%)"
+        return f"{mem} {unit} ({snapshot['ram_free_percent']}%)"
 
     def get_cpu_usage(self) -> str:
-        cpu = psutil.cpu_percent()
-        self.cpu_average.append(cpu)
-        self.cpu_average = self.cpu_average[-(self.gpu.samples_per_second * 60 * 5) :]
-        avg_cpu = trunc(sum(self.cpu_average) / len(self.cpu_average))
-        cpu = f"{trunc(cpu)}%".ljust(3)
-        return f"{cpu} ({avg_cpu}%)"
+        snapshot = telemetry.snapshot
+        cpu = f"{trunc(snapshot['cpu'])}%".ljust(3)
+        return f"{cpu} ({snapshot['avg_cpu']}%)"
 
-    def print_status(self) -> None:
-        # This is the design template: (80 columns)
-        # ╔═Horde Worker Name═════════════════════════════════════════(25.10.10)══000000═╗
-        # ║   Uptime: 0:14:35      Jobs Completed: 6        Avg Kudos Per Job: 103       ║
-        # ║ pop time: 0.58s        Kudos Per Hour: 5283         Jobs Per Hour: 524966    ║
-        # ║    Model: Llama2...          Warnings: 9999                Errors: 10        ║
-        # ║ CPU Load: 99% (99%)          Free RAM: 2 GB (10%)       Job Fetch: 2.32s     ║
-        # ╟─NVIDIA GeForce RTX 6090──────────────────────────────────────────────────────╢
-        # ║    Load: 100% (90%)        VRAM Total: 24576MiB         Fan Speed: 100%      ║
-        # ║    Temp: 100C (58C)         VRAM Used: 16334MiB           PCI Gen: 6         ║
-        # ║   Power: 460W (178W)        VRAM Free: 8241MiB          PCI Width: 32x       ║
-        # ╟─Worker───────────────────────────────────────────────────────────────────────╢
-        # ║  Threads: 6               Worker Kudos: 9385297         Total Jobs: 701138   ║
-        # ║  Context: 8192            Total Uptime: 34d 19h 14m    Jobs Failed: 972      ║
-        # ╟───Horde──────────────────────────────────────────────────────────────────────╢
-        # ║  Model Queue: 43           Jobs Queued: 99999        Total Workers: 100      ║
-        # ║    Model ETA: 120s                                   Total Threads: 1000     ║
-        # ║ Model Threads: 8                                                             ║
-        # ║     (m)aintenance  (s)ource  (d)ebug  (p)ause log  (a)lerts  (r)eset  (q)uit ║
-        # ╙──────────────────────────────────────────────────────────────────────────────╜
-
-        # Define three colums centres
-        col_left = 12
-        col_mid = self.width // 2
-        col_right = self.width - 12
-
-        # How many GPUs are we using?
-        num_gpus = self.bridge_data.ui_show_n_gpus if self.bridge_data.ui_show_n_gpus else self.gpu.get_num_gpus()
-
-        # Define rows on which sections start
-        row_local = 0
-        row_gpu = row_local + 5
-        row_total = row_gpu + (4 * num_gpus)
-        row_horde = row_total + 3
-        self.status_height = row_horde + 6
+    def draw_chrome(self, num_gpus, cols, rows) -> None:
+        """Draws the parts of the status box which don't change between frames and resets the frame state"""
+        col_left, col_mid, col_right = cols
+        row_local, row_gpu, row_total, row_horde = rows
 
         def label(y, x, label) -> None:
             self.print(self.main, y, x - len(label) - 1, label)
 
+        self.main.erase()
+        self.fields = {}
+        self.log_rows = 0
+        self.log_layout = None
+        self.log_win = None
+        if self.height > self.status_height:
+            with contextlib.suppress(curses.error):
+                self.log_win = self.main.derwin(self.height - self.status_height, self.width, self.status_height, 0)
+                # New log lines scroll the pane rather than redrawing it. scrollok is only on around the explicit
+                # scroll() in render_log, so a row ending in the last column can't scroll the pane by itself
+                self.log_win.idlok(True)
+
         self.draw_box(0, 0, self.width, self.status_height)
-        self.draw_line(self.main, row_gpu, "")
+        for gpu_i in range(max(num_gpus, 1)):
+            self.draw_line(self.main, row_gpu + 4 * gpu_i, "")
         self.draw_line(self.main, row_total, "Worker")
         self.draw_line(self.main, row_horde, "Horde")
         self.print(self.main, row_local, 2, f"{self.worker_name}")
@@ -410,22 +434,66 @@ class TerminalUI:
         label(row_horde + 2, col_left + 5, "Model ETA:")
         label(row_horde + 3, col_left + 5, "Model Threads:")
         label(row_horde + 1, col_mid, "Total Jobs Queued:")
+        label(row_horde + 2, col_mid, "Idle:")
+        label(row_horde + 3, col_mid, "Most Skipped For:")
         # label(row_horde + 2, col_mid, "Total Workers:")
         label(row_horde + 1, col_right, "Total Workers:")
         # label(row_horde + 1, col_right, "Total Queue Time:")
         label(row_horde + 2, col_right, "Total Threads:")
 
-        self.print(self.main, row_local + 1, col_left, f"{self.get_uptime()}")
-        self.print(self.main, row_local + 1, col_mid, f"{self.jobs_done}")
-        self.print(self.main, row_local + 1, col_right, f"{self.avg_kudos_per_job}")
+    def print_status(self) -> None:
+        # This is the design template: (80 columns)
+        # ╔═Horde Worker Name═════════════════════════════════════════(25.10.10)══000000═╗
+        # ║   Uptime: 0:14:35      Jobs Completed: 6        Avg Kudos Per Job: 103       ║
+        # ║ pop time: 0.58s        Kudos Per Hour: 5283         Jobs Per Hour: 524966    ║
+        # ║    Model: Llama2...          Warnings: 9999                Errors: 10        ║
+        # ║ CPU Load: 99% (99%)          Free RAM: 2 GB (10%)       Job Fetch: 2.32s     ║
+        # ╟─NVIDIA GeForce RTX 6090──────────────────────────────────────────────────────╢
+        # ║    Load: 100% (90%)        VRAM Total: 24576MiB         Fan Speed: 100%      ║
+        # ║    Temp: 100C (58C)         VRAM Used: 16334MiB           PCI Gen: 6         ║
+        # ║   Power: 460W (178W)        VRAM Free: 8241MiB          PCI Width: 32x       ║
+        # ╟─Worker───────────────────────────────────────────────────────────────────────╢
+        # ║  Threads: 6               Worker Kudos: 9385297         Total Jobs: 701138   ║
+        # ║  Context: 8192            Total Uptime: 34d 19h 14m    Jobs Failed: 972      ║
+        # ╟───Horde──────────────────────────────────────────────────────────────────────╢
+        # ║  Model Queue: 43           Jobs Queued: 99999        Total Workers: 100      ║
+        # ║    Model ETA: 120s                Idle: 12%          Total Threads: 1000     ║
+        # ║ Model Threads: 8      Most Skipped For: max_length (38%)                     ║
+        # ║     (m)aintenance  (s)ource  (d)ebug  (p)ause log  (a)lerts  (r)eset  (q)uit ║
+        # ╙──────────────────────────────────────────────────────────────────────────────╜
+
+        # Define three colums centres
+        col_left = 12
+        col_mid = self.width // 2
+        col_right = self.width - 12
+
+        # How many GPUs are we using?
+        num_gpus = self.bridge_data.ui_show_n_gpus if self.bridge_data.ui_show_n_gpus else self.gpu.get_num_gpus()
+
+        # Define rows on which sections start
+        row_local = 0
+        row_gpu = row_local + 5
+        row_total = row_gpu + (4 * num_gpus)
+        row_horde = row_total + 3
+        self.status_height = row_horde + 6
+
+        # The box and labels only change with the terminal size or the number of GPUs
+        layout = (self.width, self.height, num_gpus)
+        if layout != self.layout:
+            self.layout = layout
+            self.draw_chrome(num_gpus, (col_left, col_mid, col_right), (row_local, row_gpu, row_total, row_horde))
+
+        self.print_field(row_local + 1, col_left, f"{self.get_uptime()}")
+        self.print_field(row_local + 1, col_mid, f"{self.jobs_done}")
+        self.print_field(row_local + 1, col_right, f"{self.avg_kudos_per_job}")
 
-        self.print(self.main, row_local + 2, col_left, f"{self.pop_time} s")
-        self.print(self.main, row_local + 2, col_mid, f"{self.kudos_per_hour}")
-        self.print(self.main, row_local + 2, col_right, f"{self.jobs_per_hour}")
+        self.print_field(row_local + 2, col_left, f"{self.pop_time} s")
+        self.print_field(row_local + 2, col_mid, f"{self.kudos_per_hour}")
+        self.print_field(row_local + 2, col_right, f"{self.jobs_per_hour}")
 
-        self.print(self.main, row_local + 3, col_left, f"{self.modelname}")
-        self.print(self.main, row_local + 3, col_mid, f"{self.warning_count}")
-        self.print(self.main, row_local + 3, col_right, f"{self.error_count}")
+        self.print_field(row_local + 3, col_left, f"{self.modelname}")
+        self.print_field(row_local + 3, col_mid, f"{self.warning_count}")
+        self.print_field(row_local + 3, col_right, f"{self.error_count}")
 
         # Add some warning colours to free ram
         ram = self.get_free_ram()
@@ -438,12 +506,11 @@ class TerminalUI:
                 curses.beep()
             ram_colour = curses.color_pair(TerminalUI.COLOUR_RED)
 
-        self.print(self.main, row_local + 4, col_left, f"{self.get_cpu_usage()}")
-        self.print(
-            self.main,
+        self.print_field(row_local + 4, col_left, f"{self.get_cpu_usage()}")
+        self.print_field(
             row_local + 4,
             col_mid,
-            f"{self.get_free_ram()}",
+            f"{ram}",
             ram_colour,
         )
 
@@ -465,76 +532,72 @@ class TerminalUI:
                 gpu_name = gpu["product"]
                 if num_gpus > 1:
                     gpu_name = f"{gpu_name} #{gpu_i}"
-                self.draw_line(self.main, row_gpu, gpu_name)
+                self.print_field(row_gpu, 2, gpu_name)
 
-                self.print(
-                    self.main,
+                self.print_field(
                     row_gpu + 1,
                     col_left,
                     f"{gpu['load']:4} ({gpu['avg_load']})",
                 )
-                self.print(self.main, row_gpu + 1, col_mid, f"{gpu['vram_total']}")
-                self.print(self.main, row_gpu + 1, col_right, f"{gpu['fan_speed']}")
+                self.print_field(row_gpu + 1, col_mid, f"{gpu['vram_total']}")
+                self.print_field(row_gpu + 1, col_right, f"{gpu['fan_speed']}")
 
-                self.print(
-                    self.main,
+                self.print_field(
                     row_gpu + 2,
                     col_left,
                     f"{gpu['temp']:4} ({gpu['avg_temp']})",
                 )
-                self.print(self.main, row_gpu + 2, col_mid, f"{gpu['vram_used']}")
-                self.print(self.main, row_gpu + 2, col_right, f"{gpu['pci_gen']}")
+                self.print_field(row_gpu + 2, col_mid, f"{gpu['vram_used']}")
+                self.print_field(row_gpu + 2, col_right, f"{gpu['pci_gen']}")
 
-                self.print(
-                    self.main,
+                self.print_field(
                     row_gpu + 3,
                     col_left,
                     f"{gpu['power']:4} ({gpu['avg_power']})",
                 )
-                self.print(
-                    self.main,
+                self.print_field(
                     row_gpu + 3,
                     col_mid,
                     f"{gpu['vram_free']}",
                     vram_colour,
                 )
-                self.print(self.main, row_gpu + 3, col_right, f"{gpu['pci_width']}")
+                self.print_field(row_gpu + 3, col_right, f"{gpu['pci_width']}")
 
                 row_gpu += 4
 
-        self.print(self.main, row_total + 1, col_left, f"{self.threads}")
-        self.print(self.main, row_total + 1, col_mid, f"{self.total_kudos}")
-        self.print(self.main, row_total + 1, col_right, f"{self.total_jobs}")
+        self.print_field(row_total + 1, col_left, f"{self.threads}")
+        self.print_field(row_total + 1, col_mid, f"{self.total_kudos}")
+        self.print_field(row_total + 1, col_right, f"{self.total_jobs}")
 
-        self.print(
-            self.main,
+        self.print_field(
             row_total + 2,
             col_left,
             f"{self.bridge_data.max_context_length}",
         )
-        self.print(
-            self.main,
+        self.print_field(
             row_total + 2,
             col_mid,
             f"{self.seconds_to_timestring(self.total_uptime)}",
         )
-        self.print(self.main, row_total + 2, col_right, f"{self.total_failed_jobs}")
+        self.print_field(row_total + 2, col_right, f"{self.total_failed_jobs}")
 
-        self.print(self.main, row_horde + 1, col_left + 5, f"{self.model_queue} jobs")
-        self.print(self.main, row_horde + 1, col_mid, f"{self.queued_requests}")
+        self.print_field(row_horde + 1, col_left + 5, f"{self.model_queue} jobs")
+        self.print_field(row_horde + 1, col_mid, f"{self.queued_requests}")
         # self.print(
         #     self.main,
         #     row_horde + 1,
         #     col_right,
         #     f"{self.seconds_to_timestring(self.queue_time)}",
         # )
-        self.print(self.main, row_horde + 1, col_right, f"{self.worker_count}")
+        self.print_field(row_horde + 1, col_right, f"{self.worker_count}")
 
-        self.print(self.main, row_horde + 2, col_left + 5, f"{self.model_eta}s")
-        # self.print(self.main, row_horde + 2, col_mid, f"{self.worker_count}")
-        self.print(self.main, row_horde + 2, col_right, f"{self.thread_count}")
+        self.print_field(row_horde + 2, col_left + 5, f"{self.model_eta}s")
+        # self.print_field(row_horde + 2, col_mid, f"{self.worker_count}")
+        self.print_field(row_horde + 2, col_right, f"{self.thread_count}")
 
-        self.print(self.main, row_horde + 3, col_left + 5, f"{self.model_threads}")
+        self.print_field(row_horde + 3, col_left + 5, f"{self.model_threads}")
+        self.print_field(row_horde + 2, col_mid, f"{self.idle}")
+        self.print_field(row_horde + 3, col_mid, f"{self.most_skipped}")
 
         inputs = [
             "(m)aintenance",
@@ -555,244 +618,118 @@ class TerminalUI:
         x = self.print_switch(y, x, inputs[5], False)
         x = self.print_switch(y, x, inputs[6], False)
 
-    def fit_output_to_term(self, output):
-        # How many lines of output can we fit, after line wrapping?
-        termrows = self.height - self.status_height
-        linecount = 0
-        maxrows = 0
-        for i, fullline in enumerate(reversed(output)):
-            line = fullline.split(TerminalUI.DELIM)[-1:][0]
-            # 21 is the timestamp length
-            linecount += len(textwrap.wrap(line, self.width - 21))
-            if self.show_module:
-                linecount += 1
-            if linecount > termrows:
-                maxrows = i
-                break
-        # Truncate the output so it fits
-        return output[-maxrows:]
+    def log_entry_rows(self, entry, last_timestamp):
+        """Rows of (x, text, colour) segments for one log entry"""
+        colour = TerminalUI.LOG_COLOURS.get(entry.level, TerminalUI.COLOUR_WHITE)
+
+        # Timestamp
+        when = entry.timestamp if entry.timestamp != last_timestamp else ""
+        length = len(entry.timestamp) + 2
+        segments = [(1, when, curses.color_pair(TerminalUI.COLOUR_GREEN))]
+        rows = []
+
+        # Source file name
+        if self.show_module:
+            rows.append((*segments, (length, entry.source, curses.color_pair(TerminalUI.COLOUR_GREEN))))
+            segments = []
+
+        # Actual log message, wrapping is cached on the entry until the width changes. The last column stays empty,
+        # curses moves the cursor past a row which fills it
+        for line in entry.wrap(self.width - length - 1):
+            rows.append((*segments, (length, line, curses.color_pair(colour))))
+            segments = []
+        if segments:
+            rows.append(tuple(segments))
+        return rows
 
     def print_log(self) -> None:
         if not self.pause_log:
             self.load_log()
-        output = list(self.output.deque)
-        if not output:
+        if not self.log_win:
+            self.new_log_entries = []
             return
-
-        output = self.fit_output_to_term(output)
-
-        y = self.status_height
-        inputrow = 0
-        last_timestamp = ""
-        while y < self.height and inputrow < len(output):
-            # Print any log info we have
-            cat, nextwhen, source, msg = output[inputrow].split(TerminalUI.DELIM)
-            colour = TerminalUI.COLOUR_WHITE
-            if cat == "DEBUG":
-                colour = TerminalUI.COLOUR_WHITE
-            elif cat == "ERROR":
-                colour = TerminalUI.COLOUR_RED
-            elif cat in ["INIT"]:
-                colour = TerminalUI.COLOUR_WHITE
-            elif cat in ["INIT_OK"]:
-                colour = TerminalUI.COLOUR_GREEN
-                msg = f"OK: {msg}"
-            elif cat in ["INIT_WARN"]:
-                colour = TerminalUI.COLOUR_YELLOW
-                msg = f"Warning: {msg}"
-            elif cat in ["INIT_ERR"]:
-                colour = TerminalUI.COLOUR_RED
-                msg = f"Error: {msg}"
-            elif cat == "WARNING":
-                colour = TerminalUI.COLOUR_YELLOW
-
-            # Timestamp
-            when = nextwhen if nextwhen != last_timestamp else ""
-            last_timestamp = nextwhen
-            length = len(last_timestamp) + 2
-            self.print(
-                self.main,
-                y,
-                1,
-                f"{when}",
-                curses.color_pair(TerminalUI.COLOUR_GREEN),
-            )
-
-            # Source file name
-            if self.show_module:
-                self.print(
-                    self.main,
-                    y,
-                    length,
-                    f"{source}",
-                    curses.color_pair(TerminalUI.COLOUR_GREEN),
-                )
-                y += 1
-                if y > self.height:
+        pane_height = self.height - self.status_height
+        layout = (self.width, pane_height, self.show_module, self.show_debug)
+
+        if layout != self.log_layout:
+            # Resized or toggled, lay out the newest entries which fill the pane
+            self.log_layout = layout
+            rows = []
+            visible = [entry for entry in self.log_entries if self.show_debug or entry.level != "DEBUG"]
+            for index in range(len(visible) - 1, -1, -1):
+                previous = visible[index - 1].timestamp if index else ""
+                rows[:0] = self.log_entry_rows(visible[index], previous)
+                if len(rows) >= pane_height:
                     break
+            self.last_log_timestamp = visible[-1].timestamp if visible else ""
+            self.new_log_entries = []
+            self.render_log(rows[-pane_height:], redraw=True)
+            return
 
-            # Actual log message
-            text = textwrap.wrap(msg, self.width - length)
-            for line in text:
-                self.print(self.main, y, length, line, curses.color_pair(colour))
-                y += 1
-                if y > self.height:
-                    break
-            inputrow += 1
-
-    def load_worker_id(self) -> None:
-        try:
-            while not self.worker_id:
-                if not self.worker_name:
-                    logger.warning("Still waiting to determine worker name")
-                    time.sleep(5)
-                    continue
-                workers_url = f"{self.url}/api/v2/workers"
-                try:
-                    r = requests.get(
-                        workers_url,
-                        headers={"client-agent": TerminalUI.CLIENT_AGENT},
-                        timeout=5,
-                    )
-                except requests.exceptions.Timeout:
-                    logger.warning(f"Timeout while waiting for worker ID from {self.url}")
-                except requests.exceptions.RequestException as ex:
-                    logger.error(f"Failed to get worker ID {ex}")
-                if r.ok:
-                    worker_json = r.json()
-                    self.worker_id = next(
-                        (item["id"] for item in worker_json if item["name"] == self.worker_name),
-                        None,
-                    )
-                    if self.worker_id:
-                        logger.warning(f"Found worker ID {self.worker_id}")
-                    else:
-                        # Our worker is not yet in the worker results from the API (cache delay)
-                        logger.warning(
-                            f"Waiting for Worker ID from {self.url} (Maintenance mode toggle currently unavailable)",
-                        )
-                else:
-                    logger.warning(f"Failed to get worker ID {r.status_code}")
-                if self.shutdown_event.is_set():
-                    break
-                time.sleep(5)
-        except Exception as ex:
-            logger.warning(str(ex))
+        # Otherwise only entries logged since the last frame are laid out
+        rows = []
+        for entry in self.new_log_entries:
+            if not self.show_debug and entry.level == "DEBUG":
+                continue
+            rows.extend(self.log_entry_rows(entry, self.last_log_timestamp))
+            self.last_log_timestamp = entry.timestamp
+        self.new_log_entries = []
+        if rows:
+            self.render_log(rows[-pane_height:])
+
+    def render_log(self, rows, redraw=False) -> None:
+        """Draws the whole pane, or appends rows to it, scrolling the older rows up when it is full"""
+        pane_height = self.height - self.status_height
+        if redraw:
+            self.log_win.erase()
+            self.log_rows = 0
+        overflow = self.log_rows + len(rows) - pane_height
+        if overflow > 0:
+            with contextlib.suppress(curses.error):
+                self.log_win.scrollok(True)
+                self.log_win.scroll(overflow)
+            self.log_win.scrollok(False)
+            self.log_rows -= overflow
+        for y, row in enumerate(rows, self.log_rows):
+            for x, text, colour in row:
+                self.print(self.log_win, y, x, text, colour)
+        self.log_rows += len(rows)
 
     def set_maintenance_mode(self, enabled) -> None:
-        if not self.bridge_data.api_key or not self.worker_id:
+        if not self.bridge_data.api_key:
             return
-        header = {
-            "apikey": self.bridge_data.api_key,
-            "client-agent": TerminalUI.CLIENT_AGENT,
-        }
-        payload = {"maintenance": enabled}
-        if enabled:
-            logger.warning("Attempting to enable maintenance mode.")
-        else:
-            logger.warning("Attempting to disable maintenance mode.")
-        worker_URL = f"{self.url}/api/v2/workers/{self.worker_id}"
-        res = requests.put(worker_URL, json=payload, headers=header)
-        if not res.ok:
-            logger.error(f"Maintenance mode failed: {res.text}")
-
-    def get_remote_worker_info(self) -> None:
-        """API call for worker ID (Maint mode, kudos, uptime, etc)"""
-        try:
-            if not self.worker_id:
-                return
-            worker_URL = f"{self.url}/api/v2/workers/{self.worker_id}"
-
-            # request worker data from horde API
-            try:
-                r = requests.get(
-                    worker_URL,
-                    headers={"client-agent": TerminalUI.CLIENT_AGENT},
-                    timeout=5,
-                )
-            except requests.exceptions.Timeout:
-                logger.warning("Worker info API failed to respond in time")
-                return
-            except requests.exceptions.RequestException:
-                logger.warning("Worker info API request failed {ex}")
-                return
-            if not r.ok:
-                logger.warning(
-                    f"Calling Worker information API failed ({r.status_code})",
-                )
-                return
-            data = r.json()
-
-            self.maintenance_mode = data.get("maintenance_mode", False)
-            self.total_worker_kudos = data.get("kudos_details", {}).get("generated", 0)
+        if error := horde_status.set_maintenance_mode(enabled):
+            logger.error(f"Maintenance mode failed: {error}")
+
+    def update_remote_stats(self) -> None:
+        """Picks up Horde data the status poller fetched since the last frame"""
+        worker = horde_status.worker.data
+        if worker and worker is not self.remote_data[0]:
+            self.maintenance_mode = worker.get("maintenance_mode", False)
+            self.total_worker_kudos = worker.get("kudos_details", {}).get("generated", 0)
             if self.total_worker_kudos is not None:
                 self.total_worker_kudos = int(self.total_worker_kudos)
-            self.total_jobs = data.get("requests_fulfilled", 0)
-            self.total_kudos = int(data.get("kudos_rewards", 0))
-            self.threads = data.get("threads", 0)
-            self.total_uptime = data.get("uptime", 0)
-            self.total_failed_jobs = data.get("uncompleted_jobs", 0)
-            self.modelname = data.get("models")[0]
-        except Exception as ex:
-            logger.warning(str(ex))
-
-    def get_remote_horde_stats(self) -> None:
-        try:
-            url = f"{self.url}/api/v2/status/performance"
-            try:
-                r = requests.get(
-                    url,
-                    headers={"client-agent": TerminalUI.CLIENT_AGENT},
-                    timeout=10,
-                )
-            except requests.exceptions.Timeout:
-                pass
-            except requests.exceptions.RequestException:
-                return
-            if not r.ok:
-                logger.warning(f"Calling AI Horde stats API failed ({r.status_code})")
-                return
-
-            data = r.json()
-            self.queued_requests = int(data.get("queued_requests", 0))
-            self.worker_count = int(data.get("worker_count", 1))
-            self.thread_count = int(data.get("thread_count", 0))
-            # self.queued_mps = int(data.get("queued_megapixelsteps", 0))
-            # self.last_minute_mps = int(data.get("past_minute_megapixelsteps", 0))
+            self.total_jobs = worker.get("requests_fulfilled", 0)
+            self.total_kudos = int(worker.get("kudos_rewards", 0))
+            self.threads = worker.get("threads", 0)
+            self.total_uptime = worker.get("uptime", 0)
+            self.total_failed_jobs = worker.get("uncompleted_jobs", 0)
+            if worker.get("models"):
+                self.modelname = worker["models"][0]
+        performance = horde_status.performance.data
+        if performance and performance is not self.remote_data[1]:
+            self.queued_requests = int(performance.get("queued_requests", 0))
+            self.worker_count = int(performance.get("worker_count", 1))
+            self.thread_count = int(performance.get("thread_count", 0))
+            # self.queued_mps = int(performance.get("queued_megapixelsteps", 0))
+            # self.last_minute_mps = int(performance.get("past_minute_megapixelsteps", 0))
             # self.queue_time = (self.queued_mps / self.last_minute_mps) * 60
-
-            # Get model queue stats
-            if self.modelname == "Pending" or not self.worker_id:
-                # logger.info(f"Skipping model info API call")
-                return
-            # Must double encode forward slashes in model names for this horde API call
-            modelname_singleenc = parse.quote(self.modelname, safe="")
-            modelname_doubleenc = parse.quote(modelname_singleenc, safe="")
-            models_url = f"{self.url}/api/v2/status/models/{modelname_doubleenc}"
-            try:
-                r_models = requests.get(
-                    models_url,
-                    headers={"client-agent": TerminalUI.CLIENT_AGENT},
-                    timeout=5,
-                )
-            except requests.exceptions.Timeout:
-                return
-            except requests.exceptions.RequestException as ex:
-                logger.warning(f"Models info API request failed {ex}")
-                return
-            if not r_models.ok:
-                logger.warning(
-                    f"Calling Models information API failed ({r_models.status_code})",
-                )
-                return
-            models_json = r_models.json()
-            self.model_queue = int(models_json[0].get("jobs", 0))
-            self.model_eta = models_json[0].get("eta", 0)
-            self.model_threads = models_json[0].get("count", 0)
-        except IndexError:
-            return
-        except Exception as ex:
-            logger.warning(str(ex))
+        models = horde_status.model_status.data
+        if models and models is not self.remote_data[2]:
+            self.model_queue = int(models[0].get("jobs", 0))
+            self.model_eta = models[0].get("eta", 0)
+            self.model_threads = models[0].get("count", 0)
+        self.remote_data = (worker, performance, models)
 
     def update_stats(self) -> None:
         # Recent job pop times
@@ -802,22 +739,12 @@ class TerminalUI:
             self.jobs_per_hour = bridge_stats.stats["jobs_per_hour"]
         if "avg_kudos_per_job" in bridge_stats.stats:
             self.avg_kudos_per_job = bridge_stats.stats["avg_kudos_per_job"]
-
-        if time.time() - self.last_stats_refresh > TerminalUI.REMOTE_STATS_REFRESH:
-            self.last_stats_refresh = time.time()
-            if (self._worker_info_thread and not self._worker_info_thread.is_alive()) or not self._worker_info_thread:
-                self._worker_info_thread = threading.Thread(
-                    target=self.get_remote_worker_info,
-                    daemon=True,
-                ).start()
-
-        if time.time() - self.last_horde_stats_refresh > TerminalUI.REMOTE_HORDE_STATS_REFRESH:
-            self.last_horde_stats_refresh = time.time()
-            if (self._horde_stats_thread and not self._horde_stats_thread.is_alive()) or not self._horde_stats_thread:
-                self._horde_stats_thread = threading.Thread(
-                    target=self.get_remote_horde_stats,
-                    daemon=True,
-                ).start()
+        if "utilization" in bridge_stats.stats:
+            self.idle = f"{bridge_stats.stats['utilization']['idle_share']:.0%}"
+        if shares := skipped_shares(bridge_stats.stats.get("skipped", {}).get("reasons", {})):
+            reason, share = shares[0]
+            self.most_skipped = f"{reason} ({share:.0%})"
+        self.update_remote_stats()
 
     def get_commit_hash(self):
         head_file = os.path.join(".git", "HEAD")
@@ -867,13 +794,30 @@ class TerminalUI:
     def poll(self) -> bool:
         if not self.get_input():
             return False
-        self.main.erase()
+        start = time.perf_counter()
+        self.frame_text_bytes = 0
         self.update_stats()
         self.print_status()
         self.print_log()
-        self.main.refresh()
+        # Only the cells changed since the last frame are sent to the terminal
+        self.main.noutrefresh()
+        curses.doupdate()
+        self.frame_time = time.perf_counter() - start
+        self.total_frame_time += self.frame_time
+        self.frames += 1
+        self.text_bytes_drawn += self.frame_text_bytes
         return True
 
+    def render_stats(self) -> dict:
+        """Frame time and the UTF-8 bytes of text handed to curses, for judging the cost of the UI"""
+        return {
+            "frames": self.frames,
+            "last_frame_ms": round(self.frame_time * 1000, 3),
+            "avg_frame_ms": round(self.total_frame_time / self.frames * 1000, 3) if self.frames else 0,
+            "last_frame_text_bytes": self.frame_text_bytes,
+            "text_bytes_drawn": self.text_bytes_drawn,
+        }
+
     def main_loop(self, stdscr) -> None:
         if not stdscr:
             self.stop()
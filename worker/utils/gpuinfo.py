@@ -1,134 +1,55 @@
-import contextlib
-import os
-
-from pynvml.smi import nvidia_smi
+from worker.telemetry import telemetry
 
 
 class GPUInfo:
+    """Formats the GPU readings of the latest telemetry snapshot for display"""
+
     def __init__(self) -> None:
-        self.avg_load = []
-        self.avg_temp = []
-        self.avg_power = []
-        # Average period in samples, default 10 samples per second, period 5 minutes
+        # UI refresh rate, the readings themselves are sampled by the telemetry thread
         self.samples_per_second = 10
-        # Look out for device env var hack
-        self.forced_gpu = os.getenv("CUDA_VISIBLE_DEVICES", None) is not None
-        self.device = int(os.getenv("CUDA_VISIBLE_DEVICES", 0))
-
-    # Return a value from the given dictionary supporting dot notation
-    def get(self, data, key, default=""):
-        # Handle nested structures
-        path = key.split(".")
 
-        if len(path) == 1:
-            # Simple case
-            return data.get(key, default)
-        # Nested case
-        walkdata = data
-        for element in path:
-            if element in walkdata:
-                walkdata = walkdata[element]
-            else:
-                walkdata = ""
-                break
-        return walkdata
+    @staticmethod
+    def _get_gpu_data(device=0) -> "dict | None":
+        gpus = telemetry.snapshot["gpus"]
+        return gpus[device] if device < len(gpus) else None
 
     def get_num_gpus(self):
         """How many GPUs in this system?"""
-        if self.forced_gpu:
-            return 1
-
-        with contextlib.suppress(Exception):
-            nvsmi = nvidia_smi.getInstance()
-            data = nvsmi.DeviceQuery()
-            return len(data.get("gpu", [None]))
-        return 1
-
-    def _get_gpu_data(self, device=0) -> dict:
-        with contextlib.suppress(Exception):
-            nvsmi = nvidia_smi.getInstance()
-            data = nvsmi.DeviceQuery()
-            return data.get("gpu", [None])[device]
+        return len(telemetry.snapshot["gpus"]) or 1
 
-    def _mem(self, raw) -> str:
-        unit = "GB"
-        mem = raw / 1024
-        if mem < 1:
-            unit = "MB"
-            raw *= 1024
-        return f"{round(mem)} {unit}"
+    @staticmethod
+    def _mem(megabytes) -> str:
+        if megabytes >= 1024:
+            return f"{round(megabytes / 1024)} GB"
+        return f"{megabytes} MB"
 
     def get_total_vram_mb(self):
         """Get total VRAM in MB as an integer, or 0"""
-        value = 0
         data = self._get_gpu_data()
-        if data:
-            value = self.get(data, "fb_memory_usage.total", "0")
-            try:
-                value = int(value)
-            except ValueError:
-                value = 0
-        return value
+        return data["vram_total_mb"] if data else 0
 
     def get_free_vram_mb(self):
         """Get free VRAM in MB as an integer, or 0"""
-        value = 0
         data = self._get_gpu_data()
-        if data:
-            value = self.get(data, "fb_memory_usage.free", "0")
-            try:
-                value = int(value)
-            except ValueError:
-                value = 0
-        return value
+        return data["vram_free_mb"] if data else 0
 
     def get_info(self, device_id=0):
-        # If we're overriding the device using Nvidia driver env var hack
-        if self.forced_gpu:
-            device_id = self.device
-
         data = self._get_gpu_data(device_id)
         if not data:
             return None
 
-        # Calculate averages
-        try:
-            gpu_util = int(self.get(data, "utilization.gpu_util", 0))
-        except ValueError:
-            gpu_util = 0
-
-        try:
-            gpu_temp = int(self.get(data, "temperature.gpu_temp", 0))
-        except ValueError:
-            gpu_temp = 0
-
-        try:
-            gpu_power = int(self.get(data, "power_readings.power_draw", 0))
-        except ValueError:
-            gpu_power = 0
-
-        self.avg_load.append(gpu_util)
-        self.avg_temp.append(gpu_temp)
-        self.avg_power.append(gpu_power)
-        self.avg_load = self.avg_load[-(self.samples_per_second * 60 * 5) :]
-        self.avg_power = self.avg_power[-(self.samples_per_second * 60 * 5) :]
-        self.avg_temp = self.avg_temp[-(self.samples_per_second * 60 * 5) :]
-        avg_load = int(sum(self.avg_load) / len(self.avg_load))
-        avg_power = int(sum(self.avg_power) / len(self.avg_power))
-        avg_temp = int(sum(self.avg_temp) / len(self.avg_temp))
-
         return {
-            "product": self.get(data, "product_name", "unknown"),
-            "pci_gen": self.get(data, "pci.pci_gpu_link_info.pcie_gen.current_link_gen", "?"),
-            "pci_width": self.get(data, "pci.pci_gpu_link_info.link_widths.current_link_width", "?"),
-            "fan_speed": f"{self.get(data, 'fan_speed')}{self.get(data, 'fan_speed_unit')}",
-            "vram_total": f"{self._mem(self.get(data, 'fb_memory_usage.total', '0'))}",
-            "vram_used": f"{self._mem(self.get(data, 'fb_memory_usage.used', '0'))}",
-            "vram_free": f"{self._mem(self.get(data, 'fb_memory_usage.free', '0'))}",
-            "load": f"{gpu_util}{self.get(data, 'utilization.unit')}",
-            "temp": f"{gpu_temp}{self.get(data, 'temperature.unit')}",
-            "power": f"{gpu_power}{self.get(data, 'power_readings.unit')}",
-            "avg_load": f"{avg_load}{self.get(data, 'utilization.unit')}",
-            "avg_temp": f"{avg_temp}{self.get(data, 'temperature.unit')}",
-            "avg_power": f"{avg_power}{self.get(data, 'power_readings.unit')}",
+            "product": data["product"],
+            "pci_gen": data["pci_gen"],
+            "pci_width": data["pci_width"],
+            "fan_speed": f"{data['fan_speed']}%",
+            "vram_total": self._mem(data["vram_total_mb"]),
+            "vram_used": self._mem(data["vram_used_mb"]),
+            "vram_free": self._mem(data["vram_free_mb"]),
+            "load": f"{data['load']}%",
+            "temp": f"{data['temp']}C",
+            "power": f"{data['power']}W",
+            "avg_load": f"{data['avg_load']}%",
+            "avg_temp": f"{data['avg_temp']}C",
+            "avg_power": f"{data['avg_power']}W",
         }